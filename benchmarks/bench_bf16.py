@@ -0,0 +1,161 @@
+"""
+bfloat16 cpu autocast (model_config.precision: bf16) versus fp32 on test_imgs/.
+
+Each precision runs in its own process so peak RSS is comparable. Reported:
+
+    - accuracy of bf16 against the fp32 predictions: exact matches, corpus BLEU
+      and mean normalised edit distance
+    - single-image latency (mean/p50/p95) and batch throughput
+    - peak RSS
+
+bf16 only pays off on cpus with native bf16 (AVX512-BF16 / AMX); the cpu
+capability torch detects is included in the report.
+
+With --vocab-subset the reduced LM head also runs under bf16 and must give
+exactly the bf16 full-head predictions.
+
+    python benchmarks/bench_bf16.py --output bench/bf16.json
+    python benchmarks/bench_bf16.py --vocab-subset models/unimernet_small/vocab_subset.json
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import statistics
+import sys
+import time
+
+import torch
+from PIL import Image
+from rapidfuzz.distance import Levenshtein
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.latency_trace import _percentile  # noqa: E402
+from unimernet.common.metrics import bleu_score  # noqa: E402
+from tools.worker_pool import load_model  # noqa: E402
+
+
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def describe(values_ms):
+    values = sorted(values_ms)
+    return {
+        "mean": statistics.fmean(values),
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+    }
+
+
+def run_precision(precision, cfg_path, image_dir, threads, repeats, batch_size, vocab_subset=None):
+    """one precision in a fresh process: predictions, latency, throughput and peak RSS"""
+    if threads:
+        torch.set_num_threads(threads)
+    model, vis_processor = load_model(cfg_path)
+    model.set_cpu_autocast(torch.bfloat16 if precision.startswith("bf16") else None)
+    # demo.yaml may already enable a subset, the plain runs compare against the full head
+    model.set_vocab_subset(model.load_vocab_subset(vocab_subset) if vocab_subset else None)
+
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.png")))
+    tensors = [vis_processor(Image.open(p).convert("RGB")).unsqueeze(0) for p in paths]
+    model.generate({"image": tensors[0]})
+
+    predictions = {}
+    latencies = []
+    for _ in range(repeats):
+        for path, tensor in zip(paths, tensors):
+            start = time.perf_counter()
+            predictions[os.path.basename(path)] = model.generate({"image": tensor})["pred_str"][0]
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    batches = [torch.cat(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)]
+    start = time.perf_counter()
+    for batch in batches:
+        model.generate({"image": batch})
+    throughput = len(tensors) / (time.perf_counter() - start)
+
+    return {
+        "predictions": predictions,
+        "latency_ms": describe(latencies),
+        f"throughput_bs{batch_size}": throughput,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def accuracy(reference, predictions):
+    names = sorted(reference)
+    exact = sum(predictions[n] == reference[n] for n in names)
+    distance = [Levenshtein.normalized_distance(predictions[n], reference[n]) for n in names]
+    return {
+        "exact_match": exact / len(names),
+        "bleu": bleu_score([predictions[n] for n in names], [reference[n] for n in names]),
+        "mean_edit_distance": statistics.fmean(distance),
+        "mismatches": [n for n in names if predictions[n] != reference[n]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare bf16 cpu autocast against fp32")
+    parser.add_argument("--cfg-path", default="demo.yaml")
+    parser.add_argument("--image-dir", default="test_imgs")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--repeats", type=int, default=2, help="passes over the images for latency")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--vocab-subset", default=None, help="also run bf16 with this reduced LM head")
+    parser.add_argument("--output", default=None, help="json report path")
+    args = parser.parse_args()
+
+    report = {
+        "cpu_capability": torch.backends.cpu.get_cpu_capability(),
+        "mkldnn_bf16": torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported(),
+        "threads": args.threads or torch.get_num_threads(),
+    }
+    runs = {"fp32": None, "bf16": None}
+    if args.vocab_subset:
+        runs["bf16+subset"] = args.vocab_subset
+    ctx = mp.get_context("spawn")
+    for precision, vocab_subset in runs.items():
+        with ctx.Pool(1) as pool:
+            report[precision] = pool.apply(
+                run_precision,
+                (precision, args.cfg_path, args.image_dir, args.threads, args.repeats, args.batch_size,
+                 vocab_subset),
+            )
+    report["accuracy"] = accuracy(report["fp32"]["predictions"], report["bf16"]["predictions"])
+
+    throughput_key = f"throughput_bs{args.batch_size}"
+    print(f"cpu capability: {report['cpu_capability']}, native bf16: {report['mkldnn_bf16']}")
+    print(f"\n{'':<8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>10}{'RSS MB':>10}")
+    for precision in runs:
+        r = report[precision]
+        lat = r["latency_ms"]
+        print(f"{precision:<8}{lat['mean']:>10.1f}{lat['p50']:>10.1f}{lat['p95']:>10.1f}"
+              f"{r[throughput_key]:>10.2f}{r['peak_rss_mb']:>10.0f}")
+    acc = report["accuracy"]
+    print(f"\nbf16 vs fp32: exact match {acc['exact_match']:.1%}, BLEU {acc['bleu']:.4f}, "
+          f"mean normalised edit distance {acc['mean_edit_distance']:.4f}")
+    for name in acc["mismatches"]:
+        print(f"  {name}\n    fp32: {report['fp32']['predictions'][name]}\n    bf16: {report['bf16']['predictions'][name]}")
+    if args.vocab_subset:
+        report["subset_accuracy"] = accuracy(report["bf16"]["predictions"], report["bf16+subset"]["predictions"])
+        mismatches = report["subset_accuracy"]["mismatches"]
+        print(f"\nbf16+subset vs bf16: {len(mismatches)} differing predictions (expected 0)")
+        for name in mismatches:
+            print(f"  {name}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
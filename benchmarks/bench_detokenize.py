@@ -0,0 +1,92 @@
+"""
+Per-result cost of DonutTokenizer.detokenize / token2str at long sequence lengths.
+
+Random batches shaped like generate() output (tokens, then eos, then padding)
+are post-processed by the current implementation and by the previous
+per-token one (kept below as reference); both must return the same result.
+
+    python benchmarks/bench_detokenize.py --tokenizer models/unimernet_small --lengths 256 768 1536
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import torch
+from ftfy import fix_text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unimernet.models.unimernet.encoder_decoder import DonutTokenizer  # noqa: E402
+
+
+def reference_token2str(tokenizer, tokens):
+    generated_text = tokenizer.tokenizer.batch_decode(tokens, skip_special_tokens=True)
+    return [fix_text(text) for text in generated_text]
+
+
+def reference_detokenize(tokenizer, tokens):
+    toks = [tokenizer.tokenizer.convert_ids_to_tokens(tok) for tok in tokens]
+    special = [tokenizer.tokenizer.bos_token, tokenizer.tokenizer.eos_token, tokenizer.tokenizer.pad_token]
+    for b in range(len(toks)):
+        for i in reversed(range(len(toks[b]))):
+            if toks[b][i] is None:
+                toks[b][i] = ''
+            toks[b][i] = toks[b][i].replace('Ġ', ' ').strip()
+            if toks[b][i] in special:
+                del toks[b][i]
+    return toks
+
+
+def random_batch(tokenizer, batch_size, length, generator, ascii_only=True):
+    """
+    [batch, length] ids: random tokens, eos at a random position, then padding.
+    With ascii_only only tokens that decode to ASCII are used, like typical LaTeX output.
+    """
+    special = set(tokenizer.tokenizer.all_special_ids)
+    candidates = [i for i in range(len(tokenizer)) if i not in special]
+    if ascii_only:
+        candidates = [i for i in candidates if tokenizer.tokenizer.decode([i]).isascii()]
+    candidates = torch.tensor(candidates)
+    ids = candidates[torch.randint(len(candidates), (batch_size, length), generator=generator)]
+    ends = torch.randint(length // 4, length, (batch_size,), generator=generator)
+    for b, end in enumerate(ends.tolist()):
+        ids[b, end] = tokenizer.eos_token_id
+        ids[b, end + 1:] = tokenizer.pad_token_id
+    return ids
+
+
+def timeit(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DonutTokenizer post-processing")
+    parser.add_argument("--tokenizer", default="models/unimernet_small")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[256, 768, 1536])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--non-ascii", action="store_true", help="sample from the whole vocabulary")
+    args = parser.parse_args()
+
+    tokenizer = DonutTokenizer(args.tokenizer)
+    generator = torch.Generator().manual_seed(0)
+    print(f"{'length':>8}{'detok ref':>12}{'detok new':>12}{'str ref':>12}{'str new':>12}   (ms per result)")
+    for length in args.lengths:
+        batch = random_batch(tokenizer, args.batch_size, length, generator, ascii_only=not args.non_ascii)
+        t_ref, ref = timeit(lambda: reference_detokenize(tokenizer, batch), args.repeats)
+        t_new, new = timeit(lambda: tokenizer.detokenize(batch), args.repeats)
+        assert ref == new, "detokenize output changed"
+        s_ref, ref = timeit(lambda: reference_token2str(tokenizer, batch), args.repeats)
+        s_new, new = timeit(lambda: tokenizer.token2str(batch), args.repeats)
+        assert ref == new, "token2str output changed"
+        per = 1000 / args.batch_size
+        print(f"{length:>8d}{t_ref * per:>12.3f}{t_new * per:>12.3f}{s_ref * per:>12.3f}{s_new * per:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Inference latency / throughput benchmark over test_imgs/.
+
+The model is loaded exactly like the GUI does (LocalProcessor.init_model on
+demo.yaml). Measured:
+
+    - cold start: imports, model load and the first recognition
+    - warm single-image latency (p50/p95, plus per-stage p50/p95 from LatencyTrace)
+    - batch throughput of UniMERModel.generate at several batch sizes
+    - peak RSS of the process
+
+The report is written as json. Pass a previous report as --baseline to fail
+(exit code 1) when any metric is worse than the baseline by more than
+--threshold:
+
+    python benchmarks/bench_inference.py --output bench/base.json
+    python benchmarks/bench_inference.py --baseline bench/base.json --threshold 0.1
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+_start = time.perf_counter()
+
+import torch  # noqa: E402
+from PIL import Image  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tools.latency_trace import LatencyStats, LatencyTrace, _percentile  # noqa: E402
+from tools.local_processor import LocalProcessor  # noqa: E402
+
+_import_time = time.perf_counter() - _start
+
+
+def peak_rss_mb():
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 2 ** 20
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def load_images(image_dir):
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.png")))
+    if not paths:
+        raise FileNotFoundError(f"no images found in {image_dir}")
+    return [(os.path.basename(p), Image.open(p).convert("RGB")) for p in paths]
+
+
+def describe(values_ms):
+    values = sorted(values_ms)
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values),
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+    }
+
+
+def bench_cold_start(cfg_path, device, image):
+    start = time.perf_counter()
+    # warm runs repeat the same images, so the encoder output cache is disabled
+    processor = LocalProcessor(cfg_path, encoder_cache_size=0)
+    processor.device = torch.device(device)
+    processor.init_model()
+    processor.model.eval()
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    processor.recognize(image)
+    first_time = time.perf_counter() - start
+    return processor, {
+        "import_s": _import_time,
+        "model_load_s": load_time,
+        "first_inference_s": first_time,
+        "total_s": _import_time + load_time + first_time,
+    }
+
+
+def bench_warm(processor, images, repeats):
+    stats = LatencyStats(window=len(images) * repeats)
+    latencies = []
+    predictions = {}
+    for _ in range(repeats):
+        for name, image in images:
+            trace = LatencyTrace("benchmark")
+            start = time.perf_counter()
+            predictions[name] = processor.recognize(image, trace)
+            latencies.append((time.perf_counter() - start) * 1000)
+            stats.record(trace)
+    return {"latency_ms": describe(latencies), "stages": stats.summary()}, predictions
+
+
+def bench_batches(processor, images, batch_sizes, min_images):
+    tensors = [processor.vis_processor(image) for _, image in images]
+    result = {}
+    for batch_size in batch_sizes:
+        num_batches = max(1, -(-min_images // batch_size))
+        batches = [
+            torch.stack([tensors[(b * batch_size + i) % len(tensors)] for i in range(batch_size)])
+            for b in range(num_batches)
+        ]
+        # warm up this shape once
+        processor.model.generate({"image": batches[0].to(processor.device)})
+        start = time.perf_counter()
+        for batch in batches:
+            processor.model.generate({"image": batch.to(processor.device)})
+        elapsed = time.perf_counter() - start
+        result[f"bs{batch_size}"] = num_batches * batch_size / elapsed
+        print(f"batch size {batch_size:<4d}{result[f'bs{batch_size}']:10.2f} img/s")
+    return result
+
+
+def flatten(report):
+    """
+    (metric path, value, higher_is_better) for every comparable number in a report.
+    """
+    metrics = [("cold_start/total_s", report["cold_start"]["total_s"], False)]
+    for key in ("p50", "p95"):
+        metrics.append((f"warm/latency_ms/{key}", report["warm"]["latency_ms"][key], False))
+    for name, value in report["throughput"].items():
+        metrics.append((f"throughput/{name}", value, True))
+    metrics.append(("peak_rss_mb", report["peak_rss_mb"], False))
+    return metrics
+
+
+def compare(report, baseline, threshold, strict_outputs=False):
+    """
+    Returns a list of human readable regressions (empty when everything is within threshold).
+    """
+    base = {path: value for path, value, _ in flatten(baseline)}
+    regressions = []
+    print(f"\n{'metric':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for path, value, higher_is_better in flatten(report):
+        if path not in base or not base[path]:
+            continue
+        change = (value - base[path]) / base[path]
+        print(f"{path:<28}{base[path]:>12.3f}{value:>12.3f}{change:>+10.1%}")
+        worse = -change if higher_is_better else change
+        if worse > threshold:
+            regressions.append(f"{path}: {base[path]:.3f} -> {value:.3f} ({change:+.1%})")
+
+    if strict_outputs:
+        for name, pred in baseline.get("predictions", {}).items():
+            if report["predictions"].get(name, pred) != pred:
+                regressions.append(f"prediction changed for {name}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark formula recognition inference")
+    parser.add_argument("--cfg-path", default="demo.yaml")
+    parser.add_argument("--image-dir", default="test_imgs")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--repeats", type=int, default=3, help="passes over the images for warm latency")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--batch-images", type=int, default=32, help="images per batch size")
+    parser.add_argument("--output", default=None, help="json report path")
+    parser.add_argument("--baseline", default=None, help="previous json report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative regression")
+    parser.add_argument("--strict-outputs", action="store_true",
+                        help="also fail when a prediction differs from the baseline")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    images = load_images(args.image_dir)
+    processor, cold_start = bench_cold_start(args.cfg_path, args.device, images[0][1])
+    print(f"cold start: {cold_start['total_s']:.2f}s (load {cold_start['model_load_s']:.2f}s, "
+          f"first inference {cold_start['first_inference_s']:.2f}s)")
+
+    warm, predictions = bench_warm(processor, images, args.repeats)
+    print(f"warm latency: p50 {warm['latency_ms']['p50']:.1f}ms, p95 {warm['latency_ms']['p95']:.1f}ms")
+
+    throughput = bench_batches(processor, images, args.batch_sizes, args.batch_images)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "device": args.device,
+            "threads": torch.get_num_threads(),
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "num_images": len(images),
+        },
+        "cold_start": cold_start,
+        "warm": warm,
+        "throughput": throughput,
+        "peak_rss_mb": peak_rss_mb(),
+        "predictions": predictions,
+    }
+    print(f"peak RSS: {report['peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.strict_outputs)
+        if regressions:
+            print("\nregressions:")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("\nno regression above {:.0%}".format(args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Throughput benchmark of the training-time image augmentations.
+
+Runs every weather augmentation on its own (p=1) and the full
+FormulaImageTrainProcessor pipeline over test_imgs/, and prints images/sec.
+Run it on two checkouts to get before/after numbers:
+
+    python benchmarks/bench_train_processor.py --iters 200
+    python benchmarks/bench_train_processor.py --fog-pool-size 0     # fog without the field cache
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unimernet.processors.formula_processor import FormulaImageTrainProcessor  # noqa: E402
+from unimernet.processors.formula_processor_helper import weather  # noqa: E402
+from unimernet.processors.formula_processor_helper.weather import Fog, Frost, Snow, Rain, Shadow  # noqa: E402
+
+
+def load_images(image_dir):
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.png")))
+    if not paths:
+        raise FileNotFoundError(f"no images found in {image_dir}")
+    return [Image.open(p).convert("RGB") for p in paths]
+
+
+def throughput(fn, inputs, iters, warmup=5):
+    for i in range(warmup):
+        fn(inputs[i % len(inputs)])
+    start = time.perf_counter()
+    for i in range(iters):
+        fn(inputs[i % len(inputs)])
+    elapsed = time.perf_counter() - start
+    return iters / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark training augmentations")
+    parser.add_argument("--image-dir", default="test_imgs")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[192, 672])
+    parser.add_argument("--iters", type=int, default=200)
+    parser.add_argument("--fog-pool-size", type=int, default=weather.FOG_POOL_SIZE)
+    parser.add_argument("--fog-refresh-every", type=int, default=weather.FOG_REFRESH_EVERY)
+    parser.add_argument("--fog-pool-budget-mb", type=float, default=weather.FOG_POOL_BUDGET_MB)
+    parser.add_argument("--output", default=None, help="optional json report path")
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir)
+    fog_args = dict(pool_size=args.fog_pool_size, refresh_every=args.fog_refresh_every, budget_mb=args.fog_pool_budget_mb)
+    processor = FormulaImageTrainProcessor(
+        image_size=args.image_size,
+        fog_pool_size=args.fog_pool_size,
+        fog_refresh_every=args.fog_refresh_every,
+        fog_pool_budget_mb=args.fog_pool_budget_mb,
+    )
+    # weather augmentations see the padded canvas, same as inside the pipeline
+    canvases = [np.array(processor.prepare_input(img, random_padding=True)) for img in images]
+
+    report = {}
+    for aug in (Fog(**fog_args), Frost(), Snow(), Rain(), Shadow()):
+        name = type(aug).__name__
+        report[name] = throughput(lambda x: aug.apply(x), canvases, args.iters)
+        print(f"{name:<28s}{report[name]:10.1f} img/s")
+
+    report["FormulaImageTrainProcessor"] = throughput(processor, images, args.iters)
+    print(f"{'FormulaImageTrainProcessor':<28s}{report['FormulaImageTrainProcessor']:10.1f} img/s")
+
+    report["fog_cache_mb"] = sum(f.nbytes for pool in weather._fog_fields.values() for f in pool) / 2 ** 20
+    print(f"{'fog field cache':<28s}{report['fog_cache_mb']:10.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Throughput of tools/worker_pool.InferencePool versus worker count.
+
+The baseline is a single process using all --cores threads. Each pool
+configuration splits the same cores into N workers with cores / N threads
+each; all workers share one copy of the weights (model.share_memory()).
+
+    python benchmarks/bench_worker_pool.py --workers 1 2 4 8 --output bench/pool.json
+
+Reported per configuration: images/s, speedup over the baseline and the
+resident memory of every worker (shared weight pages are counted in each
+worker's RSS, so compare against `shared_mb` rather than summing).
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.worker_pool import InferencePool, load_model  # noqa: E402
+
+
+def rss_mb(pid):
+    """current RSS of a process from /proc, None where unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def shared_mb(model):
+    return sum(t.numel() * t.element_size() for t in model.state_dict().values()) / 2 ** 20
+
+
+def bench_single(model, vis_processor, images, cores):
+    torch.set_num_threads(cores)
+    tensors = [vis_processor(image).unsqueeze(0) for image in images]
+    model.generate({"image": tensors[0]})
+    start = time.perf_counter()
+    for tensor in tensors:
+        model.generate({"image": tensor})
+    return len(tensors) / (time.perf_counter() - start)
+
+
+def bench_pool(model, vis_processor, images, num_workers, threads):
+    with InferencePool(model, vis_processor, num_workers, threads) as pool:
+        pool.wait_ready()
+        # one warm-up image per worker
+        pool.map(images[:num_workers])
+        start = time.perf_counter()
+        pool.map(images)
+        elapsed = time.perf_counter() - start
+        worker_rss = [rss_mb(pid) for pid in pool.pids]
+    return len(images) / elapsed, worker_rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the multi-process inference pool")
+    parser.add_argument("--cfg-path", default="demo.yaml")
+    parser.add_argument("--image-dir", default="test_imgs")
+    parser.add_argument("--cores", type=int, default=os.cpu_count())
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--min-images", type=int, default=32, help="images per measurement")
+    parser.add_argument("--output", default=None, help="json report path")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.image_dir, "*.png")))
+    if not paths:
+        raise FileNotFoundError(f"no images found in {args.image_dir}")
+    images = [Image.open(p).convert("RGB") for p in paths]
+    images = [images[i % len(images)] for i in range(max(args.min_images, len(images)))]
+
+    model, vis_processor = load_model(args.cfg_path)
+    baseline = bench_single(model, vis_processor, images, args.cores)
+    print(f"single process, {args.cores} threads: {baseline:.2f} img/s")
+
+    report = {
+        "cores": args.cores,
+        "num_images": len(images),
+        "shared_mb": shared_mb(model),
+        "single_process": baseline,
+        "pool": {},
+    }
+    print(f"\n{'workers':>8}{'threads':>9}{'img/s':>10}{'speedup':>10}{'worker RSS MB':>16}")
+    for num_workers in args.workers:
+        threads = max(1, args.cores // num_workers)
+        throughput, worker_rss = bench_pool(model, vis_processor, images, num_workers, threads)
+        report["pool"][str(num_workers)] = {
+            "threads_per_worker": threads,
+            "throughput": throughput,
+            "speedup": throughput / baseline,
+            "worker_rss_mb": worker_rss,
+        }
+        rss = "/".join(f"{r:.0f}" for r in worker_rss if r is not None) or "-"
+        print(f"{num_workers:>8d}{threads:>9d}{throughput:>10.2f}{throughput / baseline:>9.2f}x{rss:>16}")
+    print(f"\nweights in shared memory: {report['shared_mb']:.0f} MB")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Per-module CPU/GPU time breakdown of recognition over test_imgs/.
+
+Loads the model like the GUI (LocalProcessor.init_model on demo.yaml), runs
+every image once to warm up and then --repeats more times under
+unimernet.common.profiler.ModuleProfiler:
+
+    python benchmarks/profile_modules.py --output-dir bench/profile
+    flamegraph.pl bench/profile/modules.folded > modules.svg   # or open in speedscope
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.local_processor import LocalProcessor  # noqa: E402
+from unimernet.common.profiler import ModuleProfiler  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile encoder / decoder modules")
+    parser.add_argument("--cfg-path", default="demo.yaml")
+    parser.add_argument("--image-dir", default="test_imgs")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--output-dir", default="bench/profile")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    processor = LocalProcessor(args.cfg_path, encoder_cache_size=0)
+    processor.device = torch.device(args.device)
+    processor.init_model()
+    processor.model.eval()
+
+    paths = sorted(glob.glob(os.path.join(args.image_dir, "*.png")))
+    images = [Image.open(p).convert("RGB") for p in paths]
+    for image in images:
+        processor.recognize(image)
+
+    with ModuleProfiler(processor.model) as profiler:
+        for _ in range(args.repeats):
+            for image in images:
+                processor.recognize(image)
+
+    print(profiler.table())
+    os.makedirs(args.output_dir, exist_ok=True)
+    profiler.write_flamegraph(os.path.join(args.output_dir, "modules.folded"))
+    profiler.save_json(os.path.join(args.output_dir, "modules.json"))
+    print(f"\nwritten to {args.output_dir}/modules.folded and modules.json")
+
+
+if __name__ == "__main__":
+    main()
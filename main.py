@@ -2,9 +2,12 @@ import json
 import logging
 import os
 import sys
+import time
+from collections import OrderedDict
 from typing import List
 
-from latex2mathml.converter import convert
+STARTUP_TIME = time.perf_counter()  # 启动计时起点（在导入Qt、torch之前）
+
 from PyQt5.QtCore import (
     QFile,
     QIODevice,
@@ -39,7 +42,6 @@ from PyQt5.QtWidgets import (
     QWidget,
 )
 
-import resources  # noqa: F401
 from qfluentwidgets import (
     ComboBox,
     ImageLabel,
@@ -54,12 +56,30 @@ from qfluentwidgets import (
     PushButton as FluentPushButton,
 )
 from tools.clipboard_handler import ClipboardHandler
+from tools.export_worker import EXPORT_FORMATS, ExportWorker, export_variants, wrap_latex
+from tools.latency_trace import LatencyStats, LatencyTrace
 from tools.local_processor import LocalProcessor
 from tools.screenshot import ScreenshotOverlay
 
 # 软件版本号常量
 SOFTWARE_VERSION = "v0.3.0"
 
+# 预览图缩放：拖动窗口时每帧最多缩放一次，停止拖动后再做一次平滑缩放
+RESIZE_FRAME_INTERVAL_MS = 16
+RESIZE_SETTLE_DELAY_MS = 150
+SCALED_PIXMAP_CACHE_SIZE = 8
+
+# 识别耗时统计：滚动窗口大小
+LATENCY_STATS_WINDOW = 200
+
+
+def load_resources():
+    """
+    注册Qt资源（字体、mathview.html）。
+    app_rc把字体作为bytes常量整体载入，导入较慢，因此推迟到首帧之后。
+    """
+    import resources  # noqa: F401
+
 
 def render_latex_to_html(latex_code):
     """
@@ -146,7 +166,9 @@ class ModelStatusWidget(QWidget):
 class MainWindow(QMainWindow):
     """主窗口类"""
 
-    process_request = pyqtSignal(QPixmap)
+    process_request = pyqtSignal(QPixmap, object)  # 图片, LatencyTrace
+    prefetch_request = pyqtSignal(int)  # 剪切板图片后台预识别，参数为submit_prefetch的编号
+    export_request = pyqtSignal(str)  # 识别结果的MathML/包裹格式后台预计算
 
     def __init__(self):
         """
@@ -172,6 +194,15 @@ class MainWindow(QMainWindow):
         # 加载配置文件
         self.config = self.load_config()
 
+        # 识别耗时统计（各阶段p50/p95），可选导出每次识别的trace到JSON Lines文件
+        latency_config = self.config.get("latency", {})
+        self.latency_stats = LatencyStats(
+            window=LATENCY_STATS_WINDOW,
+            export_path=latency_config.get("export_path") or None,
+        )
+        self.render_trace = None  # 等待KaTeX渲染完成的trace
+        self.render_placeholder_loading = False  # 占位页面的加载尚未结束，其loadFinished不结束render阶段
+
         # 使用resource_path函数获取正确的脚本目录
         if getattr(sys, "frozen", False):
             # 在打包后的应用中，使用sys._MEIPASS作为基础目录
@@ -203,7 +234,10 @@ class MainWindow(QMainWindow):
         # 使用resource_path函数获取正确的配置文件路径
         config_path = resource_path("demo.yaml")
         self.logger.info(f"使用配置文件路径: {config_path}")
-        self.local_processor = LocalProcessor(config_path)
+        recognition_config = self.config.get("recognition", {})
+        self.local_processor = LocalProcessor(
+            config_path, detect_lines=recognition_config.get("split_lines", True)
+        )
         # 将处理器移动到新线程
         self.local_processor.moveToThread(self.processor_thread)
 
@@ -213,13 +247,32 @@ class MainWindow(QMainWindow):
         # 2. 模型加载完成 -> 更新UI
         self.local_processor.model_loaded.connect(self.on_model_loading_finished)
         # 3. 识别完成 -> 更新结果文本
+        self.local_processor.trace_finished.connect(self.on_trace_finished)
         self.local_processor.finished.connect(self.on_recognition_finished)
         # 4. 主线程请求处理图片 -> 触发处理器处理图片 (使用新信号)
         self.process_request.connect(self.local_processor.process_pixmap)
+        # 5. 剪切板出现新图片 -> 后台预识别，粘贴时直接命中结果缓存
+        self.prefetch_request.connect(self.local_processor.prefetch_pixmap)
+        clipboard_config = self.config.get("clipboard", {})
+        if clipboard_config.get("prefetch", False):
+            self.clipboard_handler.image_copied.connect(self.prefetch_clipboard_image)
+            self.clipboard_handler.start_monitoring(
+                clipboard_config.get("min_interval_ms", 500)
+            )
+            self.logger.info("已开启剪切板图片预识别")
 
         # 启动处理器线程 (模型加载将在线程启动后自动触发)
         self.processor_thread.start()
 
+        # 导出预计算线程：识别结果一到就计算MathML和各包裹格式，复制按钮直接取结果
+        self.current_export = None  # 当前LaTeX文本对应的export_variants结果
+        self.export_thread = QThread()
+        self.export_worker = ExportWorker()
+        self.export_worker.moveToThread(self.export_thread)
+        self.export_request.connect(self.export_worker.prepare)
+        self.export_worker.prepared.connect(self.on_export_prepared)
+        self.export_thread.start()
+
         # 初始化窗口
         self.initWindow()
         # 初始化UI状态：模型加载中，禁用相关按钮
@@ -229,9 +282,22 @@ class MainWindow(QMainWindow):
 
         self.overlay = None  # 用于存储截图覆盖层实例
         self.original_pixmap = None  # 保存原始（未缩放）的截图或上传图片
+        self.scaled_pixmap_cache = OrderedDict()  # (宽, 高, 是否平滑) -> 缩放后的画布
+
+        # 合并窗口大小变化事件：拖动中快速缩放，停止后平滑缩放
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(RESIZE_FRAME_INTERVAL_MS)
+        self.resize_timer.timeout.connect(
+            lambda: self._scale_and_display_image(smooth=False)
+        )
+        self.resize_settle_timer = QTimer(self)
+        self.resize_settle_timer.setSingleShot(True)
+        self.resize_settle_timer.setInterval(RESIZE_SETTLE_DELAY_MS)
+        self.resize_settle_timer.timeout.connect(self._scale_and_display_image)
 
-        # 初始化系统托盘
-        self.init_tray()
+        # 系统托盘在首帧显示后由App.init_deferred创建
+        self.tray_icon = None
 
     def initWindow(self):
         """
@@ -284,6 +350,19 @@ class MainWindow(QMainWindow):
         imageLayout.addWidget(self.imageLabel, 0, Qt.AlignCenter)
         imageLayout.setSpacing(0)
 
+        # 识别耗时调试浮层（默认隐藏）
+        self.latencyOverlay = QLabel(self.imageCard)
+        self.latencyOverlay.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 160); color: white;"
+            "font-family: Consolas, monospace; font-size: 11px; padding: 6px;"
+        )
+        self.latencyOverlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.latencyOverlay.move(8, 8)
+        self.latencyOverlay.setVisible(
+            bool(self.config.get("latency", {}).get("overlay", False))
+        )
+        self.update_latency_overlay()
+
         # LaTeX 结果显示区域
         self.latexCard = SimpleCardWidget(self.centralWidget)
         self.latexCard.setBorderRadius(8)
@@ -294,18 +373,16 @@ class MainWindow(QMainWindow):
         self.renderCard.setStyleSheet("background-color: white;")
         self.renderCard.setMinimumHeight(200)
 
-        # 渲染标签
-        self.renderView = QWebEngineView(self.renderCard)
-        self.renderView.setMinimumHeight(150)
-        self.renderView.setHtml(
-            "<html><body><center>识别结果将显示在这里</center></body></html>",
-            baseUrl=self.base_url,
-        )
-        self.renderView.setStyleSheet("border: none;")
+        # 渲染窗口（QWebEngineView）启动Chromium较慢，首帧先显示占位标签，
+        # 由init_render_view在空闲时替换
+        self.renderView = None
+        self.renderPlaceholder = QLabel("识别结果将显示在这里", self.renderCard)
+        self.renderPlaceholder.setAlignment(Qt.AlignCenter)
+        self.renderPlaceholder.setMinimumHeight(150)
 
-        renderLayout = QVBoxLayout(self.renderCard)
-        renderLayout.setContentsMargins(10, 10, 10, 10)
-        renderLayout.addWidget(self.renderView)
+        self.renderLayout = QVBoxLayout(self.renderCard)
+        self.renderLayout.setContentsMargins(10, 10, 10, 10)
+        self.renderLayout.addWidget(self.renderPlaceholder)
 
         self.latexEdit = TextEdit(self.latexCard)
         self.latexEdit.setPlaceholderText("识别出的 LaTeX 公式将显示在这里")
@@ -377,6 +454,32 @@ class MainWindow(QMainWindow):
 
         self.latexEdit.textChanged.connect(self.update_copy_button_state)
 
+    def init_render_view(self, placeholder=True):
+        """
+        创建LaTeX渲染窗口并替换占位标签，重复调用无副作用
+
+        参数:
+            placeholder (bool): 是否加载"识别结果将显示在这里"占位页面，
+                随后马上要显示识别结果时不加载
+        """
+        if self.renderView is not None:
+            return
+        self.renderView = QWebEngineView(self.renderCard)
+        self.renderView.setMinimumHeight(150)
+        if placeholder:
+            # 占位页面的loadFinished（加载完成或被识别结果打断）不属于任何识别请求
+            self.render_placeholder_loading = True
+            self.renderView.setHtml(
+                "<html><body><center>识别结果将显示在这里</center></body></html>",
+                baseUrl=self.base_url,
+            )
+        self.renderView.setStyleSheet("border: none;")
+        self.renderView.loadFinished.connect(self.on_render_finished)
+
+        self.renderLayout.replaceWidget(self.renderPlaceholder, self.renderView)
+        self.renderPlaceholder.deleteLater()
+        self.renderPlaceholder = None
+
     def onExportFormatChanged(self, index):
         """
         当导出格式改变时调用
@@ -388,7 +491,10 @@ class MainWindow(QMainWindow):
 
     def on_model_loading_finished(self, device_info):
         """模型加载完成后的回调函数"""
-        self.logger.info(f"接收到model_loaded信号. 设备: {device_info}")
+        self.logger.info(
+            f"接收到model_loaded信号. 设备: {device_info}, "
+            f"启动后 {(time.perf_counter() - STARTUP_TIME) * 1000:.0f}ms"
+        )
         if "失败" in device_info:
             self.modelStatus.setLoadingFailed(device_info)
             self.uploadButton.setEnabled(False)
@@ -422,10 +528,15 @@ class MainWindow(QMainWindow):
             "Image Files (*.png *.jpg *.bmp *.jpeg);;All Files (*)",
         )
         if fileName:
-            pixmap = QPixmap(fileName)
+            trace = LatencyTrace("upload")
+            with trace.stage("capture"):
+                pixmap = QPixmap(fileName)
             if not pixmap.isNull():
                 self.logger.info(f"上传图片: {fileName}, 大小: {pixmap.size()}")
-                QTimer.singleShot(100, lambda: self.display_result_pixmap(pixmap))
+                trace.begin("ui_delay")
+                QTimer.singleShot(
+                    100, lambda: self.display_result_pixmap(pixmap, trace)
+                )
             else:
                 self.logger.error(f"无法加载图片: {fileName}")
                 self.display_result_pixmap(QPixmap())
@@ -483,8 +594,14 @@ class MainWindow(QMainWindow):
         self.logger.info(
             f"接收到截图结果. 图片有效: {not pixmap.isNull()}, 大小: {pixmap.size()}"
         )
+        trace = LatencyTrace("screenshot")
+        # 全屏截图在覆盖层创建时完成（之后是用户框选），capture只计截屏本身，
+        # 总耗时从框选结束算起
+        if self.overlay is not None:
+            trace.add("capture", self.overlay.grab_seconds)
+        trace.begin("ui_delay")
         QTimer.singleShot(100, self.show_and_activate_main_window)
-        QTimer.singleShot(150, lambda: self.display_result_pixmap(pixmap))
+        QTimer.singleShot(150, lambda: self.display_result_pixmap(pixmap, trace))
 
         if self.overlay:
             pass
@@ -499,13 +616,17 @@ class MainWindow(QMainWindow):
         self.activateWindow()
         self.raise_()
 
-    def display_result_pixmap(self, pixmap):
+    def display_result_pixmap(self, pixmap, trace=None):
         """
         显示接收到的截图或上传的图片结果，并进行缩放
 
         参数:
             pixmap (QPixmap): 要显示的图像
+            trace (LatencyTrace): 本次识别的耗时记录，ui_delay阶段在此结束
         """
+        if trace is None:
+            trace = LatencyTrace()
+        trace.end("ui_delay")
         self.logger.debug(
             f"display_result_pixmap调用. 图片有效: {not pixmap.isNull()}, 大小: {pixmap.size()}"
         )
@@ -513,12 +634,14 @@ class MainWindow(QMainWindow):
         if pixmap and not pixmap.isNull():
             self.logger.info(f"显示图片，原始大小: {pixmap.size()}")
             self.original_pixmap = pixmap.copy()
+            self.scaled_pixmap_cache.clear()
             self.logger.debug(f"存储原始图片大小: {self.original_pixmap.size()}")
 
             self._scale_and_display_image()
             if self.local_processor.model is not None:
                 self.latexEdit.setText("正在识别图像...")
-                self.process_request.emit(pixmap)
+                self.local_processor.submit_request()
+                self.process_request.emit(pixmap, trace)
             else:
                 self.latexEdit.setText("模型尚未加载，请稍候...")
                 self.logger.warning("无法处理图片: 模型尚未加载完成")
@@ -528,13 +651,17 @@ class MainWindow(QMainWindow):
             self.latexEdit.setText("图片加载失败或取消")
             self.imageLabel.setText("图片加载失败或取消")
             self.original_pixmap = None
+            self.scaled_pixmap_cache.clear()
             self.imageLabel.setPixmap(QPixmap())
             self.imageLabel.setText("请上传图片或截图")
             self.latexEdit.setPlaceholderText("识别出的 LaTeX 公式将显示在这里")
 
-    def _scale_and_display_image(self):
+    def _scale_and_display_image(self, smooth=True):
         """
         根据QLabel大小缩放并显示图片，保持居中显示
+
+        参数:
+            smooth (bool): 是否使用平滑缩放，拖动窗口过程中使用快速缩放
         """
         if not self.original_pixmap or self.original_pixmap.isNull():
             self.imageLabel.setPixmap(QPixmap())
@@ -550,18 +677,37 @@ class MainWindow(QMainWindow):
             )
             return
 
-        scaled_pixmap = self.original_pixmap.scaled(
-            max_width, max_height, Qt.KeepAspectRatio, Qt.SmoothTransformation
+        # 快速缩放时，如果已有同尺寸的平滑结果则直接复用
+        cache_keys = [(max_width, max_height, True)]
+        if not smooth:
+            cache_keys.append((max_width, max_height, False))
+        cache_key = next(
+            (key for key in cache_keys if key in self.scaled_pixmap_cache), None
         )
 
-        canvas = QPixmap(lbl_rect.size())
-        canvas.fill(Qt.transparent)
+        if cache_key is not None:
+            self.scaled_pixmap_cache.move_to_end(cache_key)
+            canvas = self.scaled_pixmap_cache[cache_key]
+        else:
+            scaled_pixmap = self.original_pixmap.scaled(
+                max_width,
+                max_height,
+                Qt.KeepAspectRatio,
+                Qt.SmoothTransformation if smooth else Qt.FastTransformation,
+            )
+
+            canvas = QPixmap(lbl_rect.size())
+            canvas.fill(Qt.transparent)
+
+            painter = QPainter(canvas)
+            x = (canvas.width() - scaled_pixmap.width()) // 2
+            y = (canvas.height() - scaled_pixmap.height()) // 2
+            painter.drawPixmap(x, y, scaled_pixmap)
+            painter.end()
 
-        painter = QPainter(canvas)
-        x = (canvas.width() - scaled_pixmap.width()) // 2
-        y = (canvas.height() - scaled_pixmap.height()) // 2
-        painter.drawPixmap(x, y, scaled_pixmap)
-        painter.end()
+            self.scaled_pixmap_cache[(max_width, max_height, smooth)] = canvas
+            while len(self.scaled_pixmap_cache) > SCALED_PIXMAP_CACHE_SIZE:
+                self.scaled_pixmap_cache.popitem(last=False)
 
         self.imageLabel.setPixmap(canvas)
         self.imageLabel.setText("")
@@ -569,10 +715,13 @@ class MainWindow(QMainWindow):
     def resizeEvent(self, event):
         """
         窗口大小改变事件，重新缩放图片以适应新的 QLabel 大小。
+        连续的事件会被合并：每帧最多快速缩放一次，停止变化后再平滑缩放一次。
         """
         super().resizeEvent(event)
         if self.original_pixmap and not self.original_pixmap.isNull():
-            QTimer.singleShot(0, self._scale_and_display_image)
+            if not self.resize_timer.isActive():
+                self.resize_timer.start()
+            self.resize_settle_timer.start()
 
     def load_config(self):
         """加载配置文件"""
@@ -624,27 +773,51 @@ class MainWindow(QMainWindow):
         self.shortcut_paste.setEnabled(True)
         self.shortcut_paste.activated.connect(self.clipboard_handler.handle_paste)
 
+        # 识别耗时调试浮层快捷键
+        latency_seq = shortcuts.get("latency_overlay", "Ctrl+Shift+L")
+        self.logger.debug(f"耗时浮层快捷键: {latency_seq}")
+        self.shortcut_latency = QShortcut(QKeySequence(latency_seq), self)
+        self.shortcut_latency.setEnabled(True)
+        self.shortcut_latency.activated.connect(self.toggle_latency_overlay)
+
     def handle_clipboard_image(self, image: QImage):
         """处理从剪切板粘贴的图片 (QImage)"""
         self.logger.info(f"从剪切板接收到图片. 格式: {image.format()}")
-        pixmap = QPixmap.fromImage(image)
+        trace = LatencyTrace("paste")
+        with trace.stage("capture"):
+            pixmap = QPixmap.fromImage(image)
         if not pixmap.isNull():
-            self.display_result_pixmap(pixmap)
+            self.display_result_pixmap(pixmap, trace)
         else:
             self.logger.warning("剪切板中的图片无效")
             self.latexEdit.setText("剪切板中的图片无效")
             self.imageLabel.setText("剪切板中的图片无效")
 
+    def prefetch_clipboard_image(self, image: QImage):
+        """剪切板出现新图片时，在模型就绪后提交后台预识别"""
+        if self.local_processor.model is None:
+            return
+        self.logger.debug(f"剪切板新图片，提交预识别. 大小: {image.size()}")
+        generation = self.local_processor.submit_prefetch(QPixmap.fromImage(image))
+        self.prefetch_request.emit(generation)
+
     def on_recognition_finished(self, result):
         """识别完成后的回调函数"""
         self.logger.info(f"接收到识别结果: {result}")
 
-        # 更新 LaTeX 文本框
+        # 更新 LaTeX 文本框，并在后台预计算导出格式
+        self.current_export = None
         self.latexEdit.setText(result)
+        if not result.startswith("识别失败"):
+            self.export_request.emit(self.latexEdit.toPlainText())
 
         # 更新渲染窗口
         try:
-            # 使用 QWebEngineView 渲染公式
+            # 使用 QWebEngineView 渲染公式，渲染耗时在loadFinished中结束计时
+            load_resources()
+            self.init_render_view(placeholder=False)
+            if self.render_trace is not None:
+                self.render_trace.begin("render")
             html_content = render_latex_to_html(result)
             self.renderView.setHtml(html_content, baseUrl=self.base_url)
         except Exception as e:
@@ -669,9 +842,73 @@ class MainWindow(QMainWindow):
         # 保存当前的LaTeX代码
         self.current_latex = result
 
+    def on_export_prepared(self, latex_text, variants):
+        """导出结果计算完成，只保留与当前文本一致的结果；MathML转换失败时提前禁用Word复制按钮"""
+        if latex_text != self.latexEdit.toPlainText():
+            return
+        self.current_export = variants
+        if variants["mathml_error"] is not None:
+            self.logger.warning(f"当前结果无法转换为MathML: {variants['mathml_error']}")
+        self.update_copy_button_state()
+
+    def get_export(self, latex_text):
+        """当前文本的导出结果，后台尚未算完时返回None"""
+        if self.current_export is not None and self.current_export["plain"] == latex_text:
+            return self.current_export
+        return None
+
+    def on_trace_finished(self, trace):
+        """识别线程完成推理，保存trace等待KaTeX渲染结束"""
+        if self.render_trace is not None:
+            # 上一次的渲染还没结束就来了新结果，直接记录上一次
+            self.record_latency(self.render_trace)
+        self.render_trace = trace
+
+    def on_render_finished(self, ok):
+        """QWebEngineView加载完成（KaTeX在DOMContentLoaded时已完成渲染）"""
+        if self.render_placeholder_loading:
+            self.render_placeholder_loading = False
+            return
+        if self.render_trace is None:
+            return
+        trace, self.render_trace = self.render_trace, None
+        trace.end("render")
+        self.record_latency(trace)
+
+    def record_latency(self, trace):
+        self.latency_stats.record(trace)
+        self.logger.info(f"识别耗时: {trace.summary()}")
+        self.update_latency_overlay()
+
+    def update_latency_overlay(self):
+        """刷新识别耗时调试浮层"""
+        if self.latencyOverlay.isHidden():
+            return
+        last = self.latency_stats.last()
+        lines = ["识别耗时 (ms)"]
+        if last is not None:
+            lines.append(f"最近一次 #{last['request_id']} [{last['source']}]")
+            lines += [f"  {k:<16}{v:>10.1f}" for k, v in last["stages_ms"].items()]
+            lines += [
+                f"  {k:<16}{v:>10.1f}" if isinstance(v, float) else f"  {k:<16}{v:>10}"
+                for k, v in last["counters"].items()
+            ]
+            lines.append("")
+            lines.append(self.latency_stats.format_table())
+        else:
+            lines.append("暂无数据")
+        self.latencyOverlay.setText("\n".join(lines))
+        self.latencyOverlay.adjustSize()
+        self.latencyOverlay.raise_()
+
+    def toggle_latency_overlay(self):
+        """显示/隐藏识别耗时调试浮层"""
+        self.latencyOverlay.setVisible(self.latencyOverlay.isHidden())
+        self.update_latency_overlay()
+
     def closeEvent(self, event):
         """窗口关闭事件处理"""
-        if self.tray_icon.isVisible():
+        if self.tray_icon is not None and self.tray_icon.isVisible():
             event.ignore()  # 忽略关闭事件
             self.hide()  # 隐藏主窗口
             self.tray_icon.showMessage(
@@ -689,12 +926,15 @@ class MainWindow(QMainWindow):
                 self.logger.warning("处理器线程未正常终止")
             else:
                 self.logger.info("处理器线程已停止")
+            self.export_thread.quit()
+            self.export_thread.wait(1000)
 
             if self.overlay is not None and self.overlay.isVisible():
                 self.overlay.close()
                 self.overlay = None
 
-            self.tray_icon.hide()  # 确保托盘图标被移除
+            if self.tray_icon is not None:
+                self.tray_icon.hide()  # 确保托盘图标被移除
             event.accept()
 
     def copy_latex_result(self):
@@ -702,16 +942,13 @@ class MainWindow(QMainWindow):
         latex_text = self.latexEdit.toPlainText()
         if latex_text:
             clipboard = QApplication.clipboard()
-            export_format = self.exportComboBox.currentIndex()
-            # 根据选择的格式添加包裹
-            if export_format == 1:  # $$包裹
-                formatted_latex = f"${latex_text}$"
-            elif export_format == 2:  # \begin{equation}\end{equation}包裹
-                formatted_latex = (
-                    f"\\begin{{equation}}\n{latex_text}\n\\end{{equation}}"
-                )
-            else:  # 不加包裹
-                formatted_latex = latex_text
+            # 根据选择的格式添加包裹：不加包裹 / $$包裹 / \begin{equation}\end{equation}包裹
+            export_format = EXPORT_FORMATS[self.exportComboBox.currentIndex()]
+            export = self.get_export(latex_text)
+            if export is not None:
+                formatted_latex = export[export_format]
+            else:
+                formatted_latex = wrap_latex(latex_text, export_format)
             clipboard.setText(formatted_latex)
             self.logger.info("LaTeX结果已复制到剪贴板")
             tooltip = StateToolTip("复制成功", "LaTeX 代码已复制到剪贴板", self)
@@ -735,7 +972,13 @@ class MainWindow(QMainWindow):
 
         if not is_placeholder_or_empty and not is_error_message:
             try:
-                mathml_text = convert(latex_text)
+                # 优先使用后台预计算的结果，尚未算完时在此同步转换
+                export = self.get_export(self.latexEdit.toPlainText())
+                if export is None:
+                    export = export_variants(latex_text)
+                if export["mathml_error"] is not None:
+                    raise ValueError(export["mathml_error"])
+                mathml_text = export["mathml"]
                 self.logger.debug(f"转换LaTeX到MathML:\n{mathml_text[:200]}...")
                 clipboard = QApplication.clipboard()
                 clipboard.setText(mathml_text)
@@ -771,9 +1014,15 @@ class MainWindow(QMainWindow):
         is_error_message = text.startswith("识别失败:")
         # 只有当文本非空、非占位符且不是错误信息时才启用复制按钮
         should_enable = not is_placeholder_or_empty and not is_error_message
+        # 后台已确认无法转换为MathML时禁用Word复制按钮
+        export = self.get_export(self.latexEdit.toPlainText())
+        mathml_error = export["mathml_error"] if export is not None else None
 
         self.copyButton.setEnabled(should_enable)
-        self.copyWordButton.setEnabled(should_enable)
+        self.copyWordButton.setEnabled(should_enable and mathml_error is None)
+        self.copyWordButton.setToolTip(
+            f"MathML转换失败: {mathml_error}" if mathml_error is not None else ""
+        )
 
     def init_tray(self):
         """初始化系统托盘"""
@@ -813,17 +1062,27 @@ class MainWindow(QMainWindow):
 
     def quit_app(self):
         """完全退出应用程序"""
-        self.tray_icon.hide()
+        if self.tray_icon is not None:
+            self.tray_icon.hide()
         QApplication.quit()
 
 
 class App(QApplication):
+    """
+    分阶段启动：先构建轻量控件并完成首帧绘制，
+    Qt资源、字体、渲染窗口和系统托盘在事件循环空闲时逐个初始化，模型在处理器线程中并行加载。
+    各阶段耗时记录在startup_trace中并写入日志。
+    """
+
     def __init__(self, argv: List[str]) -> None:
         super().__init__(argv)
+        self.logger = logging.getLogger("FreeTex")
+        self.startup_trace = LatencyTrace("startup")
+        self.startup_trace.add("imports", time.perf_counter() - STARTUP_TIME)
 
         self.init_cwd()
-        self.init_font()
-        self.init_window()
+        with self.startup_trace.stage("window"):
+            self.init_window()
 
     def init_cwd(self):
         if getattr(sys, "frozen", False):
@@ -844,6 +1103,7 @@ class App(QApplication):
             pass
 
     def init_font(self):
+        load_resources()
         self.font_database = QFontDatabase()
 
         def _load_font(font_db: QFontDatabase, font_path: str, *args) -> QFont:
@@ -872,7 +1132,37 @@ class App(QApplication):
         self._main_window = MainWindow()
 
     def run(self):
-        self._main_window.show()
+        with self.startup_trace.stage("first_paint"):
+            self._main_window.show()
+            # 先完成首帧绘制，再开始延迟初始化
+            self.processEvents()
+        self.logger.info(
+            f"首个窗口显示耗时: {(time.perf_counter() - STARTUP_TIME) * 1000:.0f}ms"
+        )
+        QTimer.singleShot(0, self.init_deferred)
+
+    def init_deferred(self):
+        """首帧之后依次执行较重的初始化，每一步之间让出事件循环，界面保持响应"""
+        steps = [
+            ("resources", load_resources),
+            ("font", self.init_font),
+            ("render_view", self._main_window.init_render_view),
+            ("tray", self._main_window.init_tray),
+        ]
+
+        def run_next():
+            name, step = steps.pop(0)
+            with self.startup_trace.stage(name):
+                step()
+            if steps:
+                QTimer.singleShot(0, run_next)
+            else:
+                self.logger.info(
+                    f"启动完成: {(time.perf_counter() - STARTUP_TIME) * 1000:.0f}ms, "
+                    f"{self.startup_trace.summary()}"
+                )
+
+        run_next()
 
 
 if __name__ == "__main__":
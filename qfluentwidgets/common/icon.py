@@ -1,17 +1,129 @@
 # coding:utf-8
+from collections import OrderedDict
 from enum import Enum
+from math import ceil
 from typing import Union
 
 from PyQt5.QtXml import QDomDocument
-from PyQt5.QtCore import QRectF, Qt, QFile, QObject, QRect
+from PyQt5.QtCore import QRectF, Qt, QFile, QObject, QRect, QByteArray
 from PyQt5.QtGui import QIcon, QIconEngine, QColor, QPixmap, QImage, QPainter
 from PyQt5.QtWidgets import QAction, qApp
 from PyQt5.QtSvg import QSvgRenderer
 
-from .config import isDarkTheme, Theme
+from .config import isDarkTheme, Theme, qconfig
 from .overload import singledispatchmethod
 
 
+class SvgCache:
+    """ Cache of parsed svg documents, rewritten svg code and rendered svg pixmaps """
+
+    def __init__(self, maxSvgs=256, maxPixmaps=512):
+        """
+        Parameters
+        ----------
+        maxSvgs: int
+            the maximum number of rewritten svg code to keep
+
+        maxPixmaps: int
+            the maximum number of rendered pixmaps to keep
+        """
+        self.maxSvgs = maxSvgs
+        self.maxPixmaps = maxPixmaps
+        self.documents = {}             # icon path -> QDomDocument
+        self.svgs = OrderedDict()       # (icon path, indexes, attributes) -> svg code
+        self.pixmaps = OrderedDict()    # (svg, width, height, device pixel ratio) -> QPixmap
+
+    def clear(self):
+        """ clear all cached items """
+        self.documents.clear()
+        self.svgs.clear()
+        self.pixmaps.clear()
+
+    def clearPixmaps(self):
+        """ clear rendered pixmaps, called when the theme changes """
+        self.pixmaps.clear()
+
+    def document(self, iconPath: str) -> QDomDocument:
+        """ get the parsed svg document of icon, the document should not be modified """
+        dom = self.documents.get(iconPath)
+        if dom is None:
+            f = QFile(iconPath)
+            f.open(QFile.ReadOnly)
+            dom = QDomDocument()
+            dom.setContent(f.readAll())
+            f.close()
+            self.documents[iconPath] = dom
+
+        return dom
+
+    def svg(self, iconPath: str, indexes=None, **attributes) -> str:
+        """ get the svg code of icon with the attributes of specified paths rewritten """
+        key = (iconPath, tuple(indexes) if indexes else None,
+               tuple(sorted((k, str(v)) for k, v in attributes.items())))
+        svg = self.svgs.get(key)
+        if svg is not None:
+            self.svgs.move_to_end(key)
+            return svg
+
+        dom = self.document(iconPath).cloneNode(True).toDocument()
+
+        # change the color of each path
+        pathNodes = dom.elementsByTagName('path')
+        indexes = range(pathNodes.length()) if not indexes else indexes
+        for i in indexes:
+            element = pathNodes.at(i).toElement()
+
+            for k, v in attributes.items():
+                element.setAttribute(k, v)
+
+        svg = dom.toString()
+        self.svgs[key] = svg
+        if len(self.svgs) > self.maxSvgs:
+            self.svgs.popitem(last=False)
+
+        return svg
+
+    def pixmap(self, icon, width: int, height: int, ratio: float) -> QPixmap:
+        """ get the svg icon rendered at `width` x `height` device pixels
+
+        Parameters
+        ----------
+        icon: str | bytes
+            the path or code of svg icon
+
+        width, height: int
+            the size of pixmap in device pixels
+
+        ratio: float
+            the device pixel ratio of pixmap
+        """
+        key = (icon, width, height, ratio)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+            return pixmap
+
+        image = QImage(width, height, QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        painter = QPainter(image)
+        painter.setRenderHints(QPainter.Antialiasing | QPainter.SmoothPixmapTransform)
+        QSvgRenderer(QByteArray(icon) if isinstance(icon, bytes) else icon).render(
+            painter, QRectF(0, 0, width, height))
+        painter.end()
+
+        pixmap = QPixmap.fromImage(image)
+        pixmap.setDevicePixelRatio(ratio)
+        self.pixmaps[key] = pixmap
+        if len(self.pixmaps) > self.maxPixmaps:
+            self.pixmaps.popitem(last=False)
+
+        return pixmap
+
+
+svgCache = SvgCache()
+qconfig.themeChanged.connect(svgCache.clearPixmaps)
+
+
 class FluentIconEngine(QIconEngine):
     """ Fluent icon engine """
 
@@ -110,8 +222,24 @@ def drawSvgIcon(icon, painter, rect):
     rect: QRect | QRectF
         the rect to render icon
     """
-    renderer = QSvgRenderer(icon)
-    renderer.render(painter, QRectF(rect))
+    if isinstance(icon, QByteArray):
+        icon = bytes(icon)
+
+    rect = QRectF(rect)
+    transform = painter.transform()
+    if transform.isScaling() or transform.isRotating():
+        # a cached pixmap would be resampled, render the vector directly
+        renderer = QSvgRenderer(QByteArray(icon) if isinstance(icon, bytes) else icon)
+        renderer.render(painter, rect)
+        return
+
+    ratio = painter.device().devicePixelRatioF()
+    width, height = ceil(rect.width() * ratio), ceil(rect.height() * ratio)
+    if width <= 0 or height <= 0:
+        return
+
+    pixmap = svgCache.pixmap(icon, width, height, ratio)
+    painter.drawPixmap(rect, pixmap, QRectF(0, 0, width, height))
 
 
 def writeSvg(iconPath: str, indexes=None, **attributes):
@@ -136,24 +264,7 @@ def writeSvg(iconPath: str, indexes=None, **attributes):
     if not iconPath.lower().endswith('.svg'):
         return ""
 
-    f = QFile(iconPath)
-    f.open(QFile.ReadOnly)
-
-    dom = QDomDocument()
-    dom.setContent(f.readAll())
-
-    f.close()
-
-    # change the color of each path
-    pathNodes = dom.elementsByTagName('path')
-    indexes = range(pathNodes.length()) if not indexes else indexes
-    for i in indexes:
-        element = pathNodes.at(i).toElement()
-
-        for k, v in attributes.items():
-            element.setAttribute(k, v)
-
-    return dom.toString()
+    return svgCache.svg(iconPath, indexes, **attributes)
 
 
 def drawIcon(icon, painter, rect, state=QIcon.Off, **attributes):
@@ -1,5 +1,7 @@
 # coding:utf-8
+from collections import OrderedDict
 from enum import Enum
+import os
 from string import Template
 from typing import List, Union
 import weakref
@@ -65,6 +67,67 @@ class StyleSheetManager(QObject):
 styleSheetManager = StyleSheetManager()
 
 
+class QssCache:
+    """ Cache of qss file content and of the final style sheet per (source, theme, theme color) """
+
+    def __init__(self, maxSize=512):
+        self.maxSize = maxSize
+        self.files = {}                 # qss file path -> (modification time, content)
+        self.styleSheets = OrderedDict()  # (source key, theme, theme color) -> qss
+
+    def clear(self):
+        self.files.clear()
+        self.styleSheets.clear()
+
+    @staticmethod
+    def fileVersion(path: str):
+        """ get the modification time of qss file, `None` for Qt resources and missing files """
+        if path.startswith(':'):
+            return None
+
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def file(self, path: str):
+        """ get the content of qss file, re-read when the file has been modified """
+        version = self.fileVersion(path)
+        cached = self.files.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        f = QFile(path)
+        f.open(QFile.ReadOnly)
+        qss = str(f.readAll(), encoding='utf-8')
+        f.close()
+        self.files[path] = (version, qss)
+        return qss
+
+    def styleSheet(self, source: "StyleSheetBase", theme=Theme.AUTO):
+        """ get the style sheet of source with theme color applied """
+        key = source.cacheKey(theme)
+        if key is None:
+            return applyThemeColor(source.content(theme))
+
+        theme = qconfig.theme if theme == Theme.AUTO else theme
+        key = (key, theme, isDarkTheme(), qconfig.get(qconfig._cfg.themeColor).name())
+        qss = self.styleSheets.get(key)
+        if qss is not None:
+            self.styleSheets.move_to_end(key)
+            return qss
+
+        qss = applyThemeColor(source.content(theme))
+        self.styleSheets[key] = qss
+        if len(self.styleSheets) > self.maxSize:
+            self.styleSheets.popitem(last=False)
+
+        return qss
+
+
+qssCache = QssCache()
+
+
 class QssTemplate(Template):
     """ style sheet template """
 
@@ -96,6 +159,14 @@ class StyleSheetBase:
         """ get the content of style sheet """
         return getStyleSheetFromFile(self.path(theme))
 
+    def cacheKey(self, theme=Theme.AUTO):
+        """ get the key of style sheet in the qss cache, `None` means the style sheet is not cached """
+        if type(self).content is not StyleSheetBase.content:
+            return None
+
+        path = self.path(theme)
+        return path, QssCache.fileVersion(path)
+
     def apply(self, widget: QWidget, theme=Theme.AUTO):
         """ apply style sheet to widget """
         setStyleSheet(widget, self, theme)
@@ -218,6 +289,9 @@ class CustomStyleSheet(StyleSheetBase):
 
         return self.darkStyleSheet()
 
+    def cacheKey(self, theme=Theme.AUTO):
+        return ('custom', self.content(theme))
+
 
 class CustomStyleSheetWatcher(QObject):
     """ Custom style sheet watcher """
@@ -237,7 +311,7 @@ class DirtyStyleSheetWatcher(QObject):
     """ Dirty style sheet watcher """
 
     def eventFilter(self, obj: QWidget, e: QEvent):
-        if e.type() != QEvent.Type.Paint or not obj.property('dirty-qss'):
+        if e.type() not in (QEvent.Type.Show, QEvent.Type.Paint) or not obj.property('dirty-qss'):
             return super().eventFilter(obj, e)
 
         obj.setProperty('dirty-qss', False)
@@ -257,6 +331,10 @@ class StyleSheetCompose(StyleSheetBase):
     def content(self, theme=Theme.AUTO):
         return '\n'.join([i.content(theme) for i in self.sources])
 
+    def cacheKey(self, theme=Theme.AUTO):
+        keys = tuple(i.cacheKey(theme) for i in self.sources)
+        return None if None in keys else keys
+
     def add(self, source: StyleSheetBase):
         """ add style sheet source """
         if source is self or source in self.sources:
@@ -274,6 +352,9 @@ class StyleSheetCompose(StyleSheetBase):
 
 def getStyleSheetFromFile(file: Union[str, QFile]):
     """ get style sheet from qss file """
+    if isinstance(file, str):
+        return qssCache.file(file)
+
     f = QFile(file)
     f.open(QFile.ReadOnly)
     qss = str(f.readAll(), encoding='utf-8')
@@ -297,7 +378,7 @@ def getStyleSheet(source: Union[str, StyleSheetBase], theme=Theme.AUTO):
     if isinstance(source, str):
         source = StyleSheetFile(source)
 
-    return applyThemeColor(source.content(theme))
+    return qssCache.styleSheet(source, theme)
 
 
 def setStyleSheet(widget: QWidget, source: Union[str, StyleSheetBase], theme=Theme.AUTO, register=True):
@@ -382,13 +463,17 @@ def updateStyleSheet(lazy=False):
         whether to update the style sheet lazily, set to `True` will accelerate theme switching
     """
     removes = []
-    for widget, file in styleSheetManager.items():
+    for widget, source in list(styleSheetManager.items()):
         try:
-            if not (lazy and widget.visibleRegion().isNull()):
-                setStyleSheet(widget, file, qconfig.theme)
-            else:
-                styleSheetManager.register(file, widget)
+            # hidden widgets are updated when they are shown, the obscured ones when painted if lazy
+            if not widget.isVisible() or (lazy and widget.visibleRegion().isNull()):
                 widget.setProperty('dirty-qss', True)
+                continue
+
+            # widgets sharing a source get the same cached qss, which is only computed once
+            qss = getStyleSheet(source, qconfig.theme)
+            if qss != widget.styleSheet():
+                widget.setStyleSheet(qss)
         except RuntimeError:
             removes.append(widget)
 
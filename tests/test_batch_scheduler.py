@@ -0,0 +1,63 @@
+import queue
+from types import SimpleNamespace
+
+import pytest
+import torch
+from PIL import Image
+
+from tools.batch_scheduler import ContinuousBatchScheduler
+
+
+class StubModel(torch.nn.Module):
+    """the attributes ContinuousBatchScheduler reads from UniMERModel, token2str joins the ids"""
+
+    max_seq_len = 8
+
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.zeros(1))
+        config = SimpleNamespace(eos_token_id=2)
+        vision_model = SimpleNamespace(config=config, generation_config=SimpleNamespace(forced_eos_token_id=None))
+        self.model = SimpleNamespace(model=vision_model)
+        self.tokenizer = SimpleNamespace(bos_token_id=0, token2str=lambda ids: [" ".join(map(str, ids[0].tolist()))])
+
+
+class FailingStepScheduler(ContinuousBatchScheduler):
+    """decodes by appending eos; the first step finishes one request and then fails"""
+
+    def __init__(self):
+        super().__init__(StubModel(), lambda image: torch.zeros(1, 2, 2), max_batch_size=4)
+        self.failed = False
+
+    def _admit(self, block):
+        while len(self.requests) < self.max_batch_size:
+            try:
+                request = self._pending.get(block=block, timeout=0.05 if block else None)
+            except queue.Empty:
+                return
+            if request is None:
+                return
+            block = False
+            self.requests.append(request)
+
+    def _step(self):
+        if not self.failed and len(self.requests) > 1:
+            self.failed = True
+            self._append(self.requests[0], self.eos_token_id)
+            raise RuntimeError("step failed")
+        for request in self.requests:
+            self._append(request, self.eos_token_id)
+        self._reset_batch()
+
+
+def test_failure_after_a_request_finished_keeps_the_scheduler_running():
+    image = Image.new("RGB", (2, 2))
+    scheduler = FailingStepScheduler()
+    # queued before start, so both requests are in the failing step
+    finished, failed = scheduler.submit(image), scheduler.submit(image)
+    with scheduler:
+        assert finished.result(timeout=10) == "2"
+        with pytest.raises(RuntimeError, match="step failed"):
+            failed.result(timeout=10)
+        assert scheduler._thread.is_alive()
+        assert scheduler.submit(image).result(timeout=10) == "2"
@@ -0,0 +1,50 @@
+import pytest
+import torch
+from transformers import MBartConfig, VisionEncoderDecoderConfig
+
+from unimernet.models.unimernet.encoder_decoder import DonutEncoderDecoder, VariableUnimerNetConfig
+from unimernet.models.unimernet.generation import SpeculativeStats
+
+VOCAB_SIZE = 50
+MAX_NEW_TOKENS = 24
+
+
+def build_model(path):
+    encoder = VariableUnimerNetConfig(image_size=[192, 672], patch_size=4, embed_dim=16, depths=[1, 1, 1, 1],
+                                      num_heads=[1, 2, 4, 8], window_size=4, drop_path_rate=0.0)
+    encoder.use_2d_embeddings = False
+    # no room for positions past MAX_NEW_TOKENS - 1, which plain greedy search never feeds
+    decoder = MBartConfig(vocab_size=VOCAB_SIZE, d_model=64, decoder_layers=2, decoder_attention_heads=4,
+                          decoder_ffn_dim=128, max_position_embeddings=MAX_NEW_TOKENS, is_decoder=True,
+                          add_cross_attention=True, scale_embedding=True, dropout=0.0)
+    VisionEncoderDecoderConfig.from_encoder_decoder_configs(encoder, decoder).save_pretrained(path)
+    torch.manual_seed(0)
+    model = DonutEncoderDecoder(str(path), num_tokens=VOCAB_SIZE, pad_token_id=1, bos_token_id=0, eos_token_id=2)
+    model.eval()
+    g = torch.Generator().manual_seed(1)
+    with torch.no_grad():
+        # an untied random head and perturbed layers give varied sequences, without eos they
+        # run to max_new_tokens
+        decoder = model.model.decoder
+        decoder.lm_head.weight = torch.nn.Parameter(torch.randn(decoder.lm_head.weight.shape, generator=g))
+        for p in decoder.model.decoder.layers.parameters():
+            p.add_(torch.randn(p.shape, generator=g) * 0.2)
+        decoder.lm_head.weight[2] = -100
+    return model
+
+
+@pytest.mark.parametrize("kwargs", [dict(draft_layers=1), dict(prompt_lookup_ngram=3)], ids=["layers", "lookup"])
+def test_draft_verify_to_max_new_tokens_matches_generate(tmp_path, kwargs):
+    model = build_model(tmp_path)
+    pixel_values = torch.randn(1, 3, 192, 672, generator=torch.Generator().manual_seed(2))
+    stats = SpeculativeStats()
+
+    def generate(**kw):
+        return model.generate(pixel_values, temperature=None, max_new_tokens=MAX_NEW_TOKENS,
+                              decoder_start_token_id=0, do_sample=False, top_p=None, **kw)
+
+    plain = generate()
+    speculative = generate(decode_stats=stats, **kwargs)
+    assert plain.shape[1] == MAX_NEW_TOKENS
+    assert torch.equal(speculative, plain)
+    assert stats.drafted > 0
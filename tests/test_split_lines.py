@@ -0,0 +1,53 @@
+import glob
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+from unimernet.processors.formula_processor import FormulaImageBaseProcessor
+
+TEST_IMGS = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(__file__)), "test_imgs", "*.png")))
+DERIVATION = "0000015.png"
+
+
+def split(path):
+    return FormulaImageBaseProcessor.split_lines(Image.open(path).convert("RGB"))
+
+
+def test_derivation_splits_into_its_lines():
+    path = next(p for p in TEST_IMGS if os.path.basename(p) == DERIVATION)
+    lines = split(path)
+    # ink rows 13-47, 64-123, 139-169, 186-244, 260-290, 307-366, 383-441
+    assert [line.height for line in lines] == [34, 59, 30, 58, 30, 59, 58]
+
+
+@pytest.mark.parametrize(
+    "path", [p for p in TEST_IMGS if os.path.basename(p) != DERIVATION], ids=os.path.basename
+)
+def test_single_formulas_stay_whole(path):
+    # single formulas, fractions, matrices (0000008, 0000012), cases (0000001, 0000010)
+    # and a photo with a watermark band (0000002)
+    img = Image.open(path).convert("RGB")
+    assert FormulaImageBaseProcessor.split_lines(img) == [img]
+
+
+def test_fraction_stays_whole():
+    # numerator, bar and denominator are three ink bands separated by blank rows
+    img = Image.new("RGB", (120, 70), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((30, 5, 90, 28), fill="black")
+    draw.rectangle((20, 34, 100, 35), fill="black")
+    draw.rectangle((30, 41, 90, 64), fill="black")
+    assert FormulaImageBaseProcessor.split_lines(img) == [img]
+
+
+def test_separate_lines_are_split():
+    first = Image.open(TEST_IMGS[4]).convert("RGB")
+    second = Image.open(TEST_IMGS[5]).convert("RGB")
+    gap = 12
+    canvas = Image.new("RGB", (max(first.width, second.width), first.height + gap + second.height), "white")
+    canvas.paste(first, (0, 0))
+    canvas.paste(second, (0, first.height + gap))
+    lines = FormulaImageBaseProcessor.split_lines(canvas)
+    assert len(lines) == 2
+    assert lines[0].height <= first.height and lines[1].height <= second.height
@@ -0,0 +1,100 @@
+import pytest
+import torch
+from transformers import MBartConfig, VisionEncoderDecoderConfig
+
+from unimernet.models.unimernet.encoder_decoder import (
+    CustomMBartForCausalLM,
+    DonutEncoderDecoder,
+    VariableUnimerNetConfig,
+)
+
+VOCAB_SIZE = 500
+D_MODEL = 64
+
+
+def build_decoder(seed=0):
+    config = MBartConfig(vocab_size=VOCAB_SIZE, d_model=D_MODEL, decoder_layers=1, decoder_attention_heads=4,
+                         decoder_ffn_dim=128, max_position_embeddings=64, is_decoder=True,
+                         add_cross_attention=True, scale_embedding=True, dropout=0.0)
+    torch.manual_seed(seed)
+    decoder = CustomMBartForCausalLM(config)
+    decoder.eval()
+    decoder.set_vocab_subset(list(range(0, VOCAB_SIZE, 2)))
+    return decoder
+
+
+def hidden_states(decoder, seed=1):
+    """random positions plus positions close to an excluded row, where the head is nearly tied"""
+    g = torch.Generator().manual_seed(seed)
+    weight = decoder.lm_head.weight.detach()
+    excluded = weight[1::2]
+    random = torch.randn(256, D_MODEL, generator=g) * 4
+    aligned = excluded[torch.randint(len(excluded), (256,), generator=g)] * 20
+    aligned = aligned + torch.randn(aligned.shape, generator=g) * 0.05
+    return torch.cat([random, aligned])
+
+
+@pytest.mark.parametrize("dtype", [None, torch.bfloat16, torch.float16])
+def test_subset_argmax_matches_full_head(dtype):
+    decoder = build_decoder()
+    h = hidden_states(decoder)
+    with torch.no_grad(), torch.autocast("cpu", dtype=dtype or torch.bfloat16, enabled=dtype is not None):
+        full = decoder.lm_head(h)
+        subset = decoder._vocab_subset_logits(h)
+    predicted = subset.argmax(dim=-1)
+    # ties at reduced precision are allowed, the chosen token must reach the full-vocab maximum
+    assert torch.equal(full.gather(-1, predicted[:, None]).squeeze(-1), full.max(dim=-1).values)
+    assert decoder.vocab_subset_stats["fallback_rows"] > 0
+
+
+def build_model(path):
+    encoder = VariableUnimerNetConfig(image_size=[192, 672], patch_size=4, embed_dim=16, depths=[1, 1, 1, 1],
+                                      num_heads=[1, 2, 4, 8], window_size=4, drop_path_rate=0.0)
+    encoder.use_2d_embeddings = False
+    decoder = MBartConfig(vocab_size=VOCAB_SIZE, d_model=D_MODEL, decoder_layers=1, decoder_attention_heads=4,
+                          decoder_ffn_dim=128, max_position_embeddings=64, is_decoder=True,
+                          add_cross_attention=True, scale_embedding=True, dropout=0.0)
+    VisionEncoderDecoderConfig.from_encoder_decoder_configs(encoder, decoder).save_pretrained(path)
+    torch.manual_seed(0)
+    model = DonutEncoderDecoder(str(path), num_tokens=VOCAB_SIZE, pad_token_id=1, bos_token_id=0, eos_token_id=2)
+    model.eval()
+    model.model.decoder.set_vocab_subset(list(range(0, VOCAB_SIZE, 2)))
+    return model
+
+
+@pytest.mark.parametrize("do_sample, num_beams, uses_subset", [(False, 1, True), (True, 1, False), (False, 2, False)])
+def test_subset_only_used_for_greedy_search(tmp_path, do_sample, num_beams, uses_subset):
+    model = build_model(tmp_path)
+    model.model.generation_config.num_beams = num_beams
+    decoder = model.model.decoder
+    model.generate(torch.randn(1, 3, 192, 672), temperature=None, max_new_tokens=4, decoder_start_token_id=0,
+                   do_sample=do_sample, top_p=None)
+    assert (decoder.vocab_subset_stats["rows"] > 0) == uses_subset
+    assert decoder.vocab_subset_enabled
+
+
+@pytest.mark.parametrize("dtype", [None, torch.bfloat16])
+def test_subset_generate_matches_full_head(tmp_path, dtype):
+    model = build_model(tmp_path)
+    decoder = model.model.decoder
+    g = torch.Generator().manual_seed(1)
+    with torch.no_grad():
+        # an untied random head and perturbed layers give varied sequences; the excluded (odd)
+        # tokens score lower, as for a subset built from the training formulas
+        decoder.lm_head.weight = torch.nn.Parameter(torch.randn(decoder.lm_head.weight.shape, generator=g))
+        for p in decoder.model.decoder.layers.parameters():
+            p.add_(torch.randn(p.shape, generator=g) * 0.2)
+        decoder.lm_head.weight[1::2] *= 0.3
+    decoder.set_vocab_subset(list(range(0, VOCAB_SIZE, 2)))
+    pixel_values = torch.randn(2, 3, 192, 672, generator=g)
+
+    def generate():
+        with torch.autocast("cpu", dtype=dtype or torch.bfloat16, enabled=dtype is not None):
+            return model.generate(pixel_values, temperature=None, max_new_tokens=24, decoder_start_token_id=0,
+                                  do_sample=False, top_p=None)
+
+    subset = generate()
+    decoder.vocab_subset_enabled = False
+    full = generate()
+    assert torch.equal(subset, full)
+    assert 0 < decoder.vocab_subset_stats["fallback_rows"] < decoder.vocab_subset_stats["rows"]
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+import torch
+from PIL import Image
+
+from tools.worker_pool import InferencePool
+
+CRASH = 13
+
+
+class CrashingModel(torch.nn.Module):
+    """returns the first pixel value as the prediction, exits the process on CRASH"""
+
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.zeros(1))
+
+    def generate(self, samples):
+        value = int(samples["image"].flatten()[0])
+        if value == CRASH:
+            os._exit(3)
+        return {"pred_str": [str(value)]}
+
+
+def first_pixel(image):
+    return torch.tensor([[float(image.getpixel((0, 0))[0])]])
+
+
+def test_dead_worker_fails_its_job_and_is_restarted():
+    values = [1, CRASH, 2, 3, CRASH, 4]
+    images = [Image.new("RGB", (2, 2), (value, 0, 0)) for value in values]
+    with InferencePool(CrashingModel(), first_pixel, num_workers=2) as pool:
+        assert pool.wait_ready(60)
+        futures = [pool.submit(image) for image in images]
+        for value, future in zip(values, futures):
+            if value == CRASH:
+                with pytest.raises(RuntimeError, match="exitcode=3"):
+                    future.result(timeout=60)
+            else:
+                assert future.result(timeout=60) == str(value)
+        assert pool.map(images[:1]) == ["1"]
@@ -0,0 +1,368 @@
+"""
+连续批处理（continuous batching）解码调度器，用于长期运行的识别服务
+
+静态批处理要等一批里最长的公式解码结束才能接收新请求。这里由一个调度线程循环执行:
+
+    1. 接纳新请求: 逐个运行编码器（VariableUnimerNetModel）并单独做第一步解码(prefill)，
+       得到该请求自己的KV cache，再左侧补零拼进正在运行的批次
+    2. 对整个批次做一步解码: 各行的历史长度不同，用attention_mask屏蔽补零部分，
+       position_ids给出每行自己的位置
+    3. 生成eos或达到最大长度的请求立即离开批次，结果通过Future返回
+
+新请求在任意token步都能加入，已完成的立即离开，突发请求下尾延迟低且CPU保持忙碌。
+贪心解码；由于补零位置参与了注意力的归约，个别结果可能与逐张识别在浮点末位上不同。
+
+用法（本地测试客户端，按泊松到达模拟突发请求）:
+    python tools/batch_scheduler.py --image-dir test_imgs --requests 64 --rate 4
+    python tools/batch_scheduler.py --serve --port 8765       # HTTP服务: POST图片字节, 返回LaTeX
+    python tools/batch_scheduler.py --url http://127.0.0.1:8765 --image-dir test_imgs
+"""
+
+import argparse
+import glob
+import io
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.latency_trace import _percentile  # noqa: E402
+from unimernet.models.unimernet.generation import decoder_step, encoder_memory  # noqa: E402
+
+
+class _Request:
+    __slots__ = ("image", "future", "tokens", "submitted", "started")
+
+    def __init__(self, image):
+        self.image = image
+        self.future = Future()
+        self.tokens = []
+        self.submitted = time.perf_counter()
+        self.started = None
+
+
+class ContinuousBatchScheduler:
+    """
+    参数:
+        model: UniMERModel
+        vis_processor: eval视觉处理器，vis_processor(PIL图像) -> [1, H, W]张量
+        max_batch_size: 同时解码的最大请求数
+        max_new_tokens: 每个请求最多生成的token数，默认model.max_seq_len
+    """
+
+    def __init__(self, model, vis_processor, max_batch_size=16, max_new_tokens=None):
+        self.model = model
+        self.vis_processor = vis_processor
+        self.vision_model = model.model.model  # CustomVisionEncoderDecoderModel
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens or model.max_seq_len
+        self.device = next(model.parameters()).device
+        self.logger = logging.getLogger("logs/FreeTex.log")
+
+        config = self.vision_model.config
+        self.start_token_id = model.tokenizer.bos_token_id
+        self.eos_token_id = config.eos_token_id
+        self.forced_eos_token_id = self.vision_model.generation_config.forced_eos_token_id
+
+        self._pending = queue.Queue()
+        self._thread = None
+        self._running = False
+        self._stopped = False
+        self._lock = threading.Lock()  # submit与stop之间：停止后不再有请求进入队列
+        self._reset_batch()
+
+        self.steps = 0
+        self.batch_size_sum = 0
+
+    def _reset_batch(self):
+        self.requests = []  # 当前批次中的请求，与下面各张量的行一一对应
+        self.past = None  # 每层 (self_k, self_v, cross_k, cross_v)，自注意力部分左侧补零
+        self.mask = None  # [b, L]，1为有效位置
+        self.memory = None  # [b, S, D] 编码器输出
+        self.last_tokens = None  # [b] 下一步的输入token
+
+    def start(self):
+        self._running = True
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止调度线程，队列中和批次中尚未完成的请求以RuntimeError结束"""
+        with self._lock:
+            self._running = False
+            self._stopped = True
+            self._pending.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        error = RuntimeError("scheduler stopped")
+        unfinished = list(self.requests)
+        while True:
+            try:
+                request = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                unfinished.append(request)
+        for request in unfinished:
+            if not request.future.done():
+                request.future.set_exception(error)
+        self._reset_batch()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def submit(self, pil_image):
+        """提交一张图片，返回Future，结果为LaTeX字符串。预处理在调用线程完成。"""
+        image = self.vis_processor(pil_image.convert("RGB")).unsqueeze(0)
+        request = _Request(image)
+        with self._lock:
+            if self._stopped:
+                request.future.set_exception(RuntimeError("scheduler stopped"))
+            else:
+                self._pending.put(request)
+        return request.future
+
+    @property
+    def mean_batch_size(self):
+        return self.batch_size_sum / self.steps if self.steps else 0.0
+
+    def _loop(self):
+        while self._running:
+            try:
+                # 批次为空时阻塞等待新请求，否则只取已经到达的
+                self._admit(block=not self.requests)
+                if self.requests:
+                    self._step()
+            except Exception as e:
+                self.logger.error(f"连续批处理解码出错: {e}")
+                for request in self.requests:
+                    # 出错前本步已结束的请求已有结果
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                self._reset_batch()
+
+    @torch.no_grad()
+    def _admit(self, block):
+        while len(self.requests) < self.max_batch_size:
+            try:
+                request = self._pending.get(block=block)
+            except queue.Empty:
+                return
+            if request is None:
+                return
+            block = False
+            request.started = time.perf_counter()
+            try:
+                with self.model.maybe_autocast():
+                    encoder_outputs = self.model.model.encode(request.image.to(self.device))
+                    memory = encoder_memory(self.vision_model, encoder_outputs.last_hidden_state)
+                    start = torch.tensor([[self.start_token_id]], device=self.device)
+                    logits, past = decoder_step(self.vision_model, start, memory)
+            except Exception as e:
+                request.future.set_exception(e)
+                continue
+            token = int(logits[0, -1].argmax())
+            if self._append(request, token):
+                self._join(request, memory, past, token)
+
+    def _append(self, request, token):
+        """记录新token，请求结束时返回False并给出结果"""
+        if len(request.tokens) == self.max_new_tokens - 1 and self.forced_eos_token_id is not None:
+            token = self.forced_eos_token_id
+        request.tokens.append(token)
+        if token == self.eos_token_id or len(request.tokens) >= self.max_new_tokens:
+            ids = torch.tensor([request.tokens])
+            request.future.set_result(self.model.tokenizer.token2str(ids)[0])
+            return False
+        return True
+
+    def _join(self, request, memory, past, token):
+        """把prefill后的单个请求左侧补零拼入当前批次"""
+        token = torch.tensor([token], device=self.device)
+        if not self.requests:
+            self.requests = [request]
+            self.past, self.memory, self.last_tokens = past, memory, token
+            self.mask = torch.ones(1, past[0][0].shape[2], dtype=torch.long, device=self.device)
+            return
+
+        length = self.mask.shape[1]
+        pad = length - past[0][0].shape[2]
+        joined = []
+        for batch_layer, new_layer in zip(self.past, past):
+            self_kv = [
+                torch.cat([t.new_zeros(t.shape[0], t.shape[1], pad, t.shape[3]), t], dim=2)
+                for t in new_layer[:2]
+            ]
+            joined.append(tuple(
+                torch.cat([b, n], dim=0) for b, n in zip(batch_layer, self_kv + list(new_layer[2:]))
+            ))
+        self.past = tuple(joined)
+        row_mask = torch.zeros(1, length, dtype=torch.long, device=self.device)
+        row_mask[:, pad:] = 1
+        self.mask = torch.cat([self.mask, row_mask], dim=0)
+        self.memory = torch.cat([self.memory, memory], dim=0)
+        self.last_tokens = torch.cat([self.last_tokens, token], dim=0)
+        self.requests.append(request)
+
+    @torch.no_grad()
+    def _step(self):
+        batch_size = len(self.requests)
+        self.steps += 1
+        self.batch_size_sum += batch_size
+
+        attention_mask = torch.cat([self.mask, self.mask.new_ones(batch_size, 1)], dim=1)
+        # 每行已写入cache的有效token数即为下一个位置
+        position_ids = self.mask.sum(dim=1, keepdim=True)
+        with self.model.maybe_autocast():
+            logits, self.past = decoder_step(
+                self.vision_model, self.last_tokens[:, None], self.memory, self.past,
+                attention_mask=attention_mask, position_ids=position_ids,
+            )
+        self.mask = attention_mask
+        next_tokens = logits[:, -1].argmax(dim=-1)
+
+        keep = [row for row, (request, token) in enumerate(zip(self.requests, next_tokens.tolist()))
+                if self._append(request, token)]
+        if len(keep) == batch_size:
+            self.last_tokens = next_tokens
+            return
+        if not keep:
+            self._reset_batch()
+            return
+
+        index = torch.tensor(keep, device=self.device)
+        self.requests = [self.requests[row] for row in keep]
+        self.mask = self.mask.index_select(0, index)
+        self.memory = self.memory.index_select(0, index)
+        self.last_tokens = next_tokens.index_select(0, index)
+        # 去掉所有剩余行都是补零的前缀
+        first = int(self.mask.any(dim=0).nonzero()[0])
+        self.mask = self.mask[:, first:]
+        self.past = tuple(
+            (layer[0].index_select(0, index)[:, :, first:], layer[1].index_select(0, index)[:, :, first:])
+            + tuple(t.index_select(0, index) for t in layer[2:])
+            for layer in self.past
+        )
+
+
+def _make_handler(scheduler):
+    from PIL import Image
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                latex = scheduler.submit(Image.open(io.BytesIO(data))).result()
+                body, status = json.dumps({"latex": latex}, ensure_ascii=False), 200
+            except Exception as e:
+                body, status = json.dumps({"error": str(e)}, ensure_ascii=False), 500
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def run_client(images, num_requests, rate, recognize):
+    """
+    本地测试客户端: 按泊松过程（平均每秒rate个）提交请求，返回每个请求的延迟（秒）
+    """
+    latencies = [None] * num_requests
+    threads = []
+
+    def worker(i, image):
+        start = time.perf_counter()
+        recognize(image)
+        latencies[i] = time.perf_counter() - start
+
+    rng = random.Random(0)
+    for i in range(num_requests):
+        thread = threading.Thread(target=worker, args=(i, images[i % len(images)]))
+        thread.start()
+        threads.append(thread)
+        time.sleep(rng.expovariate(rate))
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="连续批处理识别服务 / 本地测试客户端")
+    parser.add_argument("--cfg-path", default="demo.yaml")
+    parser.add_argument("--image-dir", default="test_imgs")
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op线程数")
+    parser.add_argument("--requests", type=int, default=32, help="测试客户端发送的请求数")
+    parser.add_argument("--rate", type=float, default=4.0, help="测试客户端平均每秒请求数")
+    parser.add_argument("--serve", action="store_true", help="启动HTTP服务")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", default=None, help="测试已运行的HTTP服务")
+    args = parser.parse_args()
+
+    from PIL import Image
+
+    paths = sorted(glob.glob(os.path.join(args.image_dir, "*.png")))
+    images = [Image.open(p).convert("RGB") for p in paths]
+
+    if args.url:
+        import urllib.request
+
+        def recognize(image):
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG")
+            with urllib.request.urlopen(args.url, data=buffer.getvalue()) as response:
+                return json.loads(response.read())["latex"]
+
+        latencies = sorted(run_client(images, args.requests, args.rate, recognize))
+        print(f"{args.requests}个请求: p50 {_percentile(latencies, 50) * 1000:.0f}ms, "
+              f"p95 {_percentile(latencies, 95) * 1000:.0f}ms")
+        return
+
+    from tools.worker_pool import load_model
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model, vis_processor = load_model(args.cfg_path, "cuda" if torch.cuda.is_available() else "cpu")
+    with ContinuousBatchScheduler(model, vis_processor, args.max_batch_size) as scheduler:
+        if args.serve:
+            server = ThreadingHTTPServer(("127.0.0.1", args.port), _make_handler(scheduler))
+            print(f"服务已启动: http://127.0.0.1:{args.port}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                server.shutdown()
+            return
+
+        start = time.perf_counter()
+        latencies = sorted(run_client(images, args.requests, args.rate, lambda im: scheduler.submit(im).result()))
+        elapsed = time.perf_counter() - start
+    print(f"{args.requests}个请求, {elapsed:.1f}s, 吞吐 {args.requests / elapsed:.2f} img/s")
+    print(f"延迟 p50 {_percentile(latencies, 50) * 1000:.0f}ms, p95 {_percentile(latencies, 95) * 1000:.0f}ms, "
+          f"平均批大小 {scheduler.mean_batch_size:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_vocab_subset(tokenizer_path, corpus_path, min_count=1):
+    """统计语料（每行一个公式）中出现的token，返回出现次数>=min_count的token id列表"""
+    from unimernet.models.unimernet.encoder_decoder import DonutTokenizer
+
+    tokenizer = DonutTokenizer(tokenizer_path)
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+    print(f"读取公式: {len(texts)} 条")
+
+    counts = tokenizer.token_frequencies(texts)
+    token_ids = sorted(i for i, c in counts.items() if c >= min_count)
+    special = [tokenizer.bos_token_id, tokenizer.eos_token_id, tokenizer.pad_token_id,
+               tokenizer.tokenizer.unk_token_id]
+    token_ids = sorted(set(token_ids) | {i for i in special if i is not None})
+    print(f"保留token: {len(token_ids)} / {len(tokenizer)}")
+    return token_ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成裁剪后LM head使用的token列表 (model_config.vocab_subset)")
+    parser.add_argument("corpus", help="LaTeX语料，每行一个公式")
+    parser.add_argument("--tokenizer", default="models/unimernet_small")
+    parser.add_argument("--min-count", type=int, default=1)
+    parser.add_argument("--output", default="models/unimernet_small/vocab_subset.json")
+    args = parser.parse_args()
+
+    ids = build_vocab_subset(args.tokenizer, args.corpus, args.min_count)
+    with open(args.output, "w") as f:
+        json.dump(ids, f)
+    print(f"已保存: {args.output}")
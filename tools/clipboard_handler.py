@@ -1,4 +1,7 @@
-from PyQt5.QtCore import QObject, pyqtSignal
+import hashlib
+import time
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
 from PyQt5.QtGui import QClipboard, QImage
 from PyQt5.QtWidgets import QApplication
 
@@ -9,13 +12,24 @@ class ClipboardHandler(QObject):
     1. 监听Ctrl+V快捷键
     2. 获取剪切板中的图片或文本
     3. 发出信号通知主窗口处理
+    4. 可选：监听剪切板变化（QClipboard.dataChanged），新图片去重、限流后发出image_copied，
+       用于在用户切回FreeTex粘贴之前就开始后台识别
     """
     image_received = pyqtSignal(QImage)  # 当剪切板中有图片时发出
     text_received = pyqtSignal(str)     # 当剪切板中有文本时发出
+    image_copied = pyqtSignal(QImage)   # 监听模式下，剪切板出现新图片时发出
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.clipboard = QApplication.clipboard()
+        self.monitoring = False
+        self.min_interval_ms = 500
+        self.last_image_hash = None  # 最近一次发出的图片哈希，用于去重
+        self.last_emit_time = 0.0
+        # 限流：间隔过短时推迟到间隔结束，只处理期间最后一张图片
+        self.pending_timer = QTimer(self)
+        self.pending_timer.setSingleShot(True)
+        self.pending_timer.timeout.connect(self.check_clipboard_image)
 
     def handle_paste(self):
         """处理粘贴操作"""
@@ -28,4 +42,55 @@ class ClipboardHandler(QObject):
             # 处理文本
             text = self.clipboard.text()
             if text.strip():
-                self.text_received.emit(text)
\ No newline at end of file
+                self.text_received.emit(text)
+
+    def start_monitoring(self, min_interval_ms=500):
+        """
+        开始监听剪切板变化
+        参数:
+            min_interval_ms: 两次发出image_copied的最小间隔（毫秒）
+        """
+        self.min_interval_ms = min_interval_ms
+        if not self.monitoring:
+            self.clipboard.dataChanged.connect(self.on_clipboard_changed)
+            self.monitoring = True
+
+    def stop_monitoring(self):
+        """停止监听剪切板变化"""
+        if self.monitoring:
+            self.clipboard.dataChanged.disconnect(self.on_clipboard_changed)
+            self.pending_timer.stop()
+            self.monitoring = False
+
+    def on_clipboard_changed(self):
+        """剪切板内容变化：间隔足够时立即检查，否则推迟到间隔结束"""
+        if self.pending_timer.isActive():
+            return
+        elapsed_ms = (time.monotonic() - self.last_emit_time) * 1000
+        if elapsed_ms >= self.min_interval_ms:
+            self.check_clipboard_image()
+        else:
+            self.pending_timer.start(int(self.min_interval_ms - elapsed_ms))
+
+    def check_clipboard_image(self):
+        """剪切板中是新图片时发出image_copied，与上一张相同则忽略"""
+        if not self.clipboard.mimeData().hasImage():
+            return
+        image = self.clipboard.image()
+        if image.isNull():
+            return
+        image_hash = self.image_hash(image)
+        if image_hash == self.last_image_hash:
+            return
+        self.last_image_hash = image_hash
+        self.last_emit_time = time.monotonic()
+        self.image_copied.emit(image)
+
+    @staticmethod
+    def image_hash(image: QImage):
+        """QImage像素内容哈希"""
+        bits = image.constBits()
+        bits.setsize(image.sizeInBytes())
+        digest = hashlib.blake2b(bytes(bits), digest_size=16)
+        digest.update(f"{image.format()}{image.width()}x{image.height()}".encode())
+        return digest.hexdigest()
@@ -0,0 +1,67 @@
+import logging
+from collections import OrderedDict
+
+from latex2mathml.converter import convert
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# 导出格式，顺序与主窗口"LaTeX导出格式"下拉框一致
+EXPORT_FORMATS = ("plain", "dollar", "equation")
+
+
+def wrap_latex(latex_text, export_format="plain"):
+    """按导出格式包裹LaTeX：plain不加包裹，dollar为$包裹，equation为equation环境"""
+    if export_format == "dollar":
+        return f"${latex_text}$"
+    if export_format == "equation":
+        return f"\\begin{{equation}}\n{latex_text}\n\\end{{equation}}"
+    return latex_text
+
+
+def export_variants(latex_text):
+    """
+    计算一条LaTeX结果的所有导出形式
+
+    返回:
+        dict: plain/dollar/equation为各包裹格式的LaTeX，mathml为MathML（转换失败时为None），
+        mathml_error为转换失败的错误信息
+    """
+    variants = {name: wrap_latex(latex_text, name) for name in EXPORT_FORMATS}
+    variants.update(mathml=None, mathml_error=None)
+    try:
+        variants["mathml"] = convert(latex_text.strip())
+    except Exception as e:
+        variants["mathml_error"] = str(e)
+    return variants
+
+
+class ExportWorker(QObject):
+    """
+    导出预计算worker，使用QObject以便在QThread中运行
+    功能：
+    1. 识别结果一到就在后台计算MathML和各包裹格式，复制按钮无需在GUI线程上转换
+    2. 结果按LaTeX字符串缓存，同一结果再次识别或切换回来时直接返回
+    """
+
+    CACHE_SIZE = 32  # 缓存的LaTeX结果数量
+
+    prepared = pyqtSignal(str, object)  # LaTeX字符串, export_variants结果
+
+    def __init__(self, cache_size=None):
+        super().__init__()
+        self.cache_size = self.CACHE_SIZE if cache_size is None else cache_size
+        self.cache = OrderedDict()  # LaTeX字符串 -> 导出结果
+        self.logger = logging.getLogger("logs/FreeTex.log")
+
+    def prepare(self, latex_text):
+        """计算（或从缓存取出）latex_text的导出结果，完成后发出prepared"""
+        variants = self.cache.get(latex_text)
+        if variants is not None:
+            self.cache.move_to_end(latex_text)
+        else:
+            variants = export_variants(latex_text)
+            self.cache[latex_text] = variants
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            if variants["mathml_error"] is not None:
+                self.logger.warning(f"MathML预转换失败: {variants['mathml_error']}")
+        self.prepared.emit(latex_text, variants)
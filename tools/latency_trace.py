@@ -0,0 +1,189 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# 识别流程各阶段，按执行顺序排列（用于统计和调试浮层的显示顺序）
+# capture: 截屏/读取图片直到得到QPixmap；ui_delay: 得到图片后等待窗口切换的定时器延迟
+STAGES = (
+    "capture",
+    "ui_delay",
+    "qimage",
+    "split_lines",
+    "crop_margin",
+    "resize_pad",
+    "normalize",
+    "encoder",
+    "decode",
+    "detokenize",
+    "render",
+    "total",
+)
+
+_request_ids = itertools.count(1)
+
+
+class LatencyTrace:
+    """
+    单次识别请求的耗时记录
+
+    功能：
+    1. stage()上下文管理器记录同一线程内的阶段耗时
+    2. begin()/end()记录跨回调、跨线程的阶段耗时（例如截图到显示、KaTeX渲染）
+    3. set()记录计数类指标（例如解码token数、tokens/sec）
+    """
+
+    def __init__(self, source="unknown"):
+        self.request_id = next(_request_ids)
+        self.source = source
+        self.timestamp = time.time()
+        self.stages = OrderedDict()  # 阶段名 -> 秒
+        self.counters = OrderedDict()
+        self._start = time.perf_counter()
+        self._open = {}
+        self.finished = False
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def begin(self, name):
+        self._open[name] = time.perf_counter()
+
+    def end(self, name):
+        start = self._open.pop(name, None)
+        if start is not None:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def set(self, name, value):
+        self.counters[name] = value
+
+    def finish(self):
+        """结束记录，total为从创建到结束的总耗时"""
+        if not self.finished:
+            self._open.clear()
+            self.stages["total"] = time.perf_counter() - self._start
+            self.finished = True
+        return self
+
+    def to_dict(self):
+        return {
+            "request_id": self.request_id,
+            "source": self.source,
+            "timestamp": self.timestamp,
+            "stages_ms": {k: round(v * 1000, 3) for k, v in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def summary(self):
+        parts = [f"{k}={v * 1000:.1f}ms" for k, v in self.stages.items()]
+        parts += [
+            f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+            for k, v in self.counters.items()
+        ]
+        return f"#{self.request_id} [{self.source}] " + ", ".join(parts)
+
+
+def _percentile(values, q):
+    """线性插值百分位数，values需已排序"""
+    if not values:
+        return float("nan")
+    pos = (len(values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+class LatencyStats:
+    """
+    最近window次请求的滚动统计（线程安全）
+
+    参数:
+        window: 每个阶段保留的样本数
+        export_path: 若不为空，每条完成的trace以JSON Lines追加写入该文件
+    """
+
+    def __init__(self, window=200, export_path=None):
+        self.window = window
+        self.export_path = export_path
+        self._stage_samples = {}  # 阶段名 -> 最近的耗时（秒）
+        self._counter_samples = {}  # 计数类指标 -> 最近的取值
+        self._traces = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, trace: LatencyTrace):
+        trace.finish()
+        record = trace.to_dict()
+        with self._lock:
+            for name, seconds in trace.stages.items():
+                self._stage_samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+            for name, value in trace.counters.items():
+                if isinstance(value, (int, float)):
+                    self._counter_samples.setdefault(name, deque(maxlen=self.window)).append(value)
+            self._traces.append(record)
+            if self.export_path:
+                self._append_jsonl(record)
+        return record
+
+    def _append_jsonl(self, record):
+        directory = os.path.dirname(self.export_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.export_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def summary(self):
+        """
+        各阶段p50/p95
+
+        返回:
+            {阶段名: {"count": n, "p50": x, "p95": y}}，阶段耗时单位为毫秒，计数类指标保持原值
+        """
+        with self._lock:
+            stages = {name: sorted(v) for name, v in self._stage_samples.items()}
+            counters = {name: sorted(v) for name, v in self._counter_samples.items()}
+        result = OrderedDict()
+        ordered = [s for s in STAGES if s in stages] + [s for s in stages if s not in STAGES]
+        for name in ordered:
+            result[name] = self._describe(stages[name], 1000.0)
+        for name, values in counters.items():
+            result[name] = self._describe(values, 1.0)
+        return result
+
+    @staticmethod
+    def _describe(values, scale):
+        return {
+            "count": len(values),
+            "p50": _percentile(values, 50) * scale,
+            "p95": _percentile(values, 95) * scale,
+        }
+
+    def last(self):
+        with self._lock:
+            return self._traces[-1] if self._traces else None
+
+    def export_json(self, path):
+        """导出最近的trace和统计结果到一个JSON文件"""
+        with self._lock:
+            traces = list(self._traces)
+        report = {"summary": self.summary(), "traces": traces}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
+
+    def format_table(self):
+        """调试浮层使用的文本表格"""
+        lines = [f"{'stage':<16}{'p50':>10}{'p95':>10}"]
+        for name, item in self.summary().items():
+            lines.append(f"{name:<16}{item['p50']:>10.1f}{item['p95']:>10.1f}")
+        return "\n".join(lines)
@@ -1,12 +1,18 @@
 import torch
 import warnings
 import argparse
+import hashlib
 import logging
+import threading
+import numpy as np
+from collections import OrderedDict
 from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtCore import QObject, pyqtSignal, QBuffer, QByteArray, QIODevice
 from PIL import Image
 from io import BytesIO
 
+from tools.latency_trace import LatencyTrace
+
 warnings.filterwarnings("ignore")
 
 
@@ -16,12 +22,21 @@ class LocalProcessor(QObject):
     功能：
     1. 加载本地模型进行图像识别
     2. 通过信号返回识别结果
+    3. 记录每次识别各阶段耗时（LatencyTrace）
+    4. 按图像哈希缓存最近几张图的编码器输出，同一张图再次识别（重试、换解码参数）时跳过编码器
+    5. 多行公式截图按行切分，各行以原分辨率一次批量识别，再拼成aligned环境
+    6. 剪切板图片预识别（prefetch_pixmap），结果按图像哈希和解码设置缓存，用户粘贴时直接返回；
+       只识别最新一张剪切板图片，有用户识别请求排队时跳过预识别
     """
 
+    ENCODER_CACHE_SIZE = 8  # 缓存的编码器输出数量
+    RESULT_CACHE_SIZE = 8  # 缓存的识别结果数量
+
     finished = pyqtSignal(str)  # 识别完成信号
+    trace_finished = pyqtSignal(object)  # 识别耗时记录，在finished之前发出
     model_loaded = pyqtSignal(str)  # 模型加载完成信号，附带设备信息
 
-    def __init__(self, cfg_path):
+    def __init__(self, cfg_path, encoder_cache_size=None, detect_lines=True):
         """
         初始化处理器，但不立即加载模型。
         模型加载将在moveToThread并启动线程后，通过start_loading方法触发。
@@ -30,6 +45,17 @@ class LocalProcessor(QObject):
         self.cfg_path = cfg_path
         self.model = None
         self.vis_processor = None
+        self.encoder_cache_size = (
+            self.ENCODER_CACHE_SIZE if encoder_cache_size is None else encoder_cache_size
+        )
+        self.encoder_cache = OrderedDict()  # 图像哈希+行切分设置 -> 编码器输出，按最近使用排序
+        self.result_cache = OrderedDict()  # 图像哈希+decode_settings -> 默认解码参数下的识别结果
+        self.detect_lines = detect_lines  # 是否把多行截图切分为单行分别识别
+        # 预识别只保留最新一张图片：GUI线程写入，处理线程取出
+        self.prefetch_lock = threading.Lock()
+        self.prefetch_generation = 0  # 每提交一张预识别图片加1
+        self.prefetch_slot = None  # 最新一张待预识别的图片
+        self.pending_requests = 0  # 已提交但尚未开始处理的用户识别请求
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.logger = logging.getLogger("logs/FreeTex.log")
         self.logger.debug(f"LocalProcessor 初始化完成. 使用设备: {self.device}")
@@ -68,6 +94,8 @@ class LocalProcessor(QObject):
         task = tasks.setup_task(cfg)
         # Load model and move to device
         self.model = task.build_model(cfg).to(self.device)
+        self.encoder_cache.clear()
+        self.result_cache.clear()
         self.logger.info("模型已构建并移动到设备")
         # Load processor
         self.vis_processor = load_processor(
@@ -76,12 +104,92 @@ class LocalProcessor(QObject):
         )
         self.logger.info("视觉处理器已加载")
 
-    def process_image(self, image_path):
+    def recognize(self, pil_image, trace=None, **generate_kwargs):
+        """
+        对PIL图像做预处理和推理，返回LaTeX字符串。
+        与 vis_processor(pil_image) + model.generate 等价，但分阶段记录耗时。
+        generate_kwargs 传给 generate_from_encoder_outputs（如 do_sample、temperature）。
+        """
+        if trace is None:
+            trace = LatencyTrace()
+
+        encoder_outputs = self.encode(pil_image, trace)
+        with torch.no_grad():
+            output = self.model.generate_from_encoder_outputs(encoder_outputs, trace=trace, **generate_kwargs)
+        return self.join_lines(output["pred_str"])
+
+    @staticmethod
+    def join_lines(lines):
+        """多行识别结果拼成aligned环境，单行原样返回"""
+        if len(lines) == 1:
+            return lines[0]
+        return "\\begin{aligned}\n" + " \\\\\n".join(lines) + "\n\\end{aligned}"
+
+    @staticmethod
+    def image_key(pil_image, *settings):
+        """图像内容哈希加上影响缓存内容的设置，作为缓存的键"""
+        digest = hashlib.blake2b(pil_image.tobytes(), digest_size=16)
+        digest.update(f"{pil_image.mode}{pil_image.size}{settings!r}".encode())
+        return digest.hexdigest()
+
+    def decode_settings(self):
+        """影响识别结果的设置：行切分、draft-and-verify解码和词表子集，改动后旧的缓存结果不再命中"""
+        decoder = self.model.model.model.decoder
+        vocab_subset = None
+        if decoder.vocab_subset is not None and decoder.vocab_subset_enabled:
+            vocab_subset = hashlib.blake2b(decoder.vocab_subset.cpu().numpy().tobytes(), digest_size=8).hexdigest()
+        speculative = sorted(self.model.speculative.items()) if self.model.speculative else None
+        return self.detect_lines, speculative, vocab_subset
+
+    def encode(self, pil_image, trace=None):
+        """
+        预处理 + 编码器，返回编码器输出（多行截图时每行一个batch元素）。
+        最近识别过的图像直接命中缓存，预处理和编码器都会跳过。
+        """
+        if trace is None:
+            trace = LatencyTrace()
+        pil_image = pil_image.convert("RGB")
+        key = self.image_key(pil_image, self.detect_lines) if self.encoder_cache_size > 0 else None
+
+        cached = self.encoder_cache.get(key) if key is not None else None
+        trace.set("encoder_cache_hit", int(cached is not None))
+        if cached is not None:
+            self.encoder_cache.move_to_end(key)
+            self.logger.debug(f"编码器输出缓存命中: {key}")
+            return cached
+
+        with trace.stage("split_lines"):
+            lines = self.vis_processor.split_lines(pil_image) if self.detect_lines else [pil_image]
+        trace.set("lines", len(lines))
+
+        tensors = []
+        for line in lines:
+            with trace.stage("crop_margin"):
+                image = self.vis_processor.crop_margin(line)
+            with trace.stage("resize_pad"):
+                image = self.vis_processor.resize_and_pad(image)
+            if image is None:
+                raise ValueError("图像预处理失败: 裁剪后的图像为空")
+            with trace.stage("normalize"):
+                tensors.append(self.vis_processor.transform(image=np.array(image))["image"][:1])
+        image_tensor = torch.stack(tensors).to(self.device)
+
+        encoder_outputs = self.model.encode(image_tensor, trace=trace)
+        if key is not None:
+            self.encoder_cache[key] = encoder_outputs
+            while len(self.encoder_cache) > self.encoder_cache_size:
+                self.encoder_cache.popitem(last=False)
+        return encoder_outputs
+
+    def process_image(self, image_path, trace=None):
         """
         处理图像并返回LaTeX公式
         参数:
             image_path: 图像路径
+            trace: 可选的LatencyTrace，为空时新建
         """
+        if trace is None:
+            trace = LatencyTrace("file")
         try:
             if self.model is None or self.vis_processor is None:
                 self.logger.warning("模型尚未加载完成，无法处理图像")
@@ -89,26 +197,27 @@ class LocalProcessor(QObject):
                 return
 
             self.logger.info(f"正在处理图像路径: {image_path}")
-            raw_image = Image.open(image_path).convert("RGB")  # Ensure RGB
-            image_tensor = self.vis_processor(raw_image).unsqueeze(0).to(self.device)
-            self.logger.debug("图像已通过视觉处理器处理")
-
-            with (
-                torch.no_grad()
-            ):  # Inference should be done without gradient calculation
-                output = self.model.generate({"image": image_tensor})
+            with trace.stage("qimage"):
+                raw_image = Image.open(image_path).convert("RGB")  # Ensure RGB
+
+            result = self.recognize(raw_image, trace)
             self.logger.debug("模型推理完成")
 
-            result = output["pred_str"][0]
             self.logger.info(f"路径识别结果:\n{result}")
+            self.logger.debug(f"识别耗时: {trace.summary()}")
+            self.trace_finished.emit(trace)
             self.finished.emit(result)
         except Exception as e:
             error_msg = f"识别失败 (路径): {str(e)}"
             self.logger.error(error_msg)
             self.finished.emit(error_msg)
 
-    def process_pixmap(self, pixmap: QPixmap):
+    def process_pixmap(self, pixmap: QPixmap, trace=None):
         """直接处理QPixmap对象"""
+        if trace is None:
+            trace = LatencyTrace("pixmap")
+        with self.prefetch_lock:
+            self.pending_requests = max(0, self.pending_requests - 1)
         try:
             if self.model is None or self.vis_processor is None:
                 self.logger.warning("模型尚未加载完成，无法处理QPixmap")
@@ -116,78 +225,20 @@ class LocalProcessor(QObject):
                 return
 
             self.logger.info("开始处理QPixmap...")
-            # 将QPixmap转换为QImage
-            q_image = pixmap.toImage()
-
-            if q_image.isNull():
-                raise ValueError("QPixmap转换为QImage失败，结果为null")
-
-            byte_array = QByteArray()
-            buffer_device = QBuffer(byte_array)
-
-            success = False
-            try:
-                # Open the buffer for writing
-                if not buffer_device.open(QIODevice.WriteOnly):
-                    raise IOError("无法打开QBuffer进行写入")
-
-                # Ensure the QImage is in a format suitable for saving to PNG
-                safe_formats = (
-                    QImage.Format_ARGB32,
-                    QImage.Format_RGB32,
-                    QImage.Format_ARGB32_Premultiplied,
-                    QImage.Format_RGB888,
-                )
-                if q_image.format() not in safe_formats:
-                    self.logger.debug(
-                        f"将QImage从格式{q_image.format()}转换为Format_ARGB32"
-                    )
-                    q_image = q_image.convertToFormat(QImage.Format_ARGB32)
-                    if q_image.isNull():
-                        raise ValueError("QImage格式转换失败")
-                else:
-                    self.logger.debug(f"QImage格式{q_image.format()}适合保存")
-
-                # Save the QImage to the QBuffer as a PNG file
-                success = q_image.save(buffer_device, "PNG")
-
-                if not success:
-                    raise IOError("无法将QImage保存为PNG到缓冲区")
-
-            finally:
-                # Always ensure the buffer is closed
-                if buffer_device.isOpen():
-                    buffer_device.close()
-
-            # Get the byte array from the buffer after saving
-            byte_array_data = byte_array.data()
-            if not byte_array_data:
-                raise IOError("保存QImage后QBuffer中没有数据")
-
-            self.logger.debug(
-                f"QImage已保存为PNG到QBuffer。缓冲区大小: {len(byte_array_data)}字节"
-            )
-
-            # Open the image from the buffer using PIL
-            buffer = BytesIO(byte_array_data)
-            pil_image = Image.open(buffer)
-            pil_image = pil_image.convert("RGB")
+            with trace.stage("qimage"):
+                pil_image = self.pixmap_to_pil(pixmap)
 
             self.logger.debug(
                 f"QPixmap已通过QBuffer转换为PIL Image。尺寸: {pil_image.size}, 模式: {pil_image.mode}"
             )
 
-            # Process the image using the visual processor
-            image_tensor = self.vis_processor(pil_image).unsqueeze(0).to(self.device)
-            self.logger.debug("PIL Image已通过视觉处理器处理")
-
-            # Perform inference
-            with torch.no_grad():
-                output = self.model.generate({"image": image_tensor})
+            # 预处理 + 推理，已预识别过的图片直接使用缓存结果
+            result = self.recognize_cached(pil_image, trace)
             self.logger.debug("模型推理完成")
 
-            result = output["pred_str"][0]
             self.logger.info(f"QPixmap识别结果:\n{result}")
+            self.logger.debug(f"识别耗时: {trace.summary()}")
+            self.trace_finished.emit(trace)
             self.finished.emit(result)
 
         except Exception as e:
@@ -197,3 +248,121 @@ class LocalProcessor(QObject):
 
             self.logger.error(traceback.format_exc())
             self.finished.emit(error_msg)
+
+    def recognize_cached(self, pil_image, trace=None):
+        """默认解码参数下的recognize，结果按图像哈希和decode_settings缓存"""
+        if trace is None:
+            trace = LatencyTrace()
+        key = self.image_key(pil_image.convert("RGB"), *self.decode_settings())
+        result = self.result_cache.get(key)
+        trace.set("result_cache_hit", int(result is not None))
+        if result is not None:
+            self.result_cache.move_to_end(key)
+            self.logger.debug(f"识别结果缓存命中: {key}")
+            return result
+
+        result = self.recognize(pil_image, trace)
+        self.result_cache[key] = result
+        while len(self.result_cache) > self.RESULT_CACHE_SIZE:
+            self.result_cache.popitem(last=False)
+        return result
+
+    def submit_request(self):
+        """GUI线程在发出process_pixmap请求前调用，排队中的预识别会因此让路"""
+        with self.prefetch_lock:
+            self.pending_requests += 1
+
+    def submit_prefetch(self, pixmap: QPixmap):
+        """
+        GUI线程提交一张预识别图片，覆盖尚未处理的旧图片
+
+        返回:
+            int: 本次提交的编号，作为prefetch_pixmap的参数
+        """
+        with self.prefetch_lock:
+            self.prefetch_generation += 1
+            self.prefetch_slot = pixmap
+            return self.prefetch_generation
+
+    def prefetch_pixmap(self, generation: int):
+        """
+        后台预识别剪切板中的图片，只写入结果缓存，不发出finished信号。
+        用户随后粘贴同一张图片时，process_pixmap直接命中缓存。
+        已被更新的图片取代，或有用户识别请求排队时直接跳过。
+        """
+        if self.model is None or self.vis_processor is None:
+            return
+        with self.prefetch_lock:
+            if generation != self.prefetch_generation or self.pending_requests:
+                self.logger.debug(f"跳过过期的剪切板预识别: {generation}")
+                return
+            pixmap, self.prefetch_slot = self.prefetch_slot, None
+        if pixmap is None:
+            return
+        try:
+            trace = LatencyTrace("prefetch")
+            pil_image = self.pixmap_to_pil(pixmap)
+            self.recognize_cached(pil_image, trace)
+            self.logger.info(f"剪切板图片预识别完成: {trace.finish().summary()}")
+        except Exception as e:
+            self.logger.warning(f"剪切板图片预识别失败: {e}")
+
+    def pixmap_to_pil(self, pixmap: QPixmap) -> Image.Image:
+        """QPixmap -> QImage -> PNG缓冲区 -> PIL Image (RGB)"""
+        # 将QPixmap转换为QImage
+        q_image = pixmap.toImage()
+
+        if q_image.isNull():
+            raise ValueError("QPixmap转换为QImage失败，结果为null")
+
+        byte_array = QByteArray()
+        buffer_device = QBuffer(byte_array)
+
+        success = False
+        try:
+            # Open the buffer for writing
+            if not buffer_device.open(QIODevice.WriteOnly):
+                raise IOError("无法打开QBuffer进行写入")
+
+            # Ensure the QImage is in a format suitable for saving to PNG
+            safe_formats = (
+                QImage.Format_ARGB32,
+                QImage.Format_RGB32,
+                QImage.Format_ARGB32_Premultiplied,
+                QImage.Format_RGB888,
+            )
+            if q_image.format() not in safe_formats:
+                self.logger.debug(
+                    f"将QImage从格式{q_image.format()}转换为Format_ARGB32"
+                )
+                q_image = q_image.convertToFormat(QImage.Format_ARGB32)
+                if q_image.isNull():
+                    raise ValueError("QImage格式转换失败")
+            else:
+                self.logger.debug(f"QImage格式{q_image.format()}适合保存")
+
+            # Save the QImage to the QBuffer as a PNG file
+            success = q_image.save(buffer_device, "PNG")
+
+            if not success:
+                raise IOError("无法将QImage保存为PNG到缓冲区")
+
+        finally:
+            # Always ensure the buffer is closed
+            if buffer_device.isOpen():
+                buffer_device.close()
+
+        # Get the byte array from the buffer after saving
+        byte_array_data = byte_array.data()
+        if not byte_array_data:
+            raise IOError("保存QImage后QBuffer中没有数据")
+
+        self.logger.debug(
+            f"QImage已保存为PNG到QBuffer。缓冲区大小: {len(byte_array_data)}字节"
+        )
+
+        # Open the image from the buffer using PIL
+        buffer = BytesIO(byte_array_data)
+        pil_image = Image.open(buffer)
+        pil_image = pil_image.convert("RGB")
+        return pil_image
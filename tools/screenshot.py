@@ -1,8 +1,13 @@
 import logging
 import platform
+import time
+from collections import deque
 from PyQt5.QtWidgets import QWidget, QApplication
-from PyQt5.QtGui import QPixmap, QPainter, QPen, QColor
-from PyQt5.QtCore import Qt, QRect, QPoint, pyqtSignal, QTimer
+from PyQt5.QtGui import QPixmap, QPainter, QPen, QColor, QRegion
+from PyQt5.QtCore import Qt, QRect, QRectF, QPoint, pyqtSignal, QTimer
+
+# 60fps 对应的单帧预算（毫秒）
+FRAME_BUDGET_MS = 1000 / 60
 
 
 class ScreenshotOverlay(QWidget):
@@ -13,10 +18,13 @@ class ScreenshotOverlay(QWidget):
     2. 允许用户通过鼠标拖拽选择区域
     3. 提供十字辅助线帮助精确定位
     4. 支持ESC键取消截图
+
+    遮罩背景在截图后只合成一次，鼠标移动时只重绘新旧选区和辅助线所在的区域。
     """
 
     screenshot_taken = pyqtSignal(QPixmap)  # 截图完成信号
     screenshot_cancelled = pyqtSignal()  # 截图取消信号
+    frame_rendered = pyqtSignal(float)  # 每帧绘制耗时（毫秒），用于验证能否维持60fps
 
     def __init__(self):
         super().__init__()
@@ -36,7 +44,10 @@ class ScreenshotOverlay(QWidget):
         self.is_selecting = False
         self.has_moved = False
         self.full_screenshot = None
+        self.grab_seconds = 0.0  # 全屏截图耗时，计入识别耗时记录的capture阶段
+        self.dimmed_screenshot = None  # 预先合成好遮罩的背景
         self.overlay_color = QColor(0, 0, 0, 120)  # 半透明遮罩颜色
+        self.frame_times = deque(maxlen=1000)  # 最近的帧绘制耗时（毫秒）
 
         # 获取桌面几何区域
         self.desktop_rect = self.get_desktop_geometry()
@@ -50,6 +61,8 @@ class ScreenshotOverlay(QWidget):
             QTimer.singleShot(10, self.close)
             return
 
+        self.build_dimmed_background()
+
         # 设置窗口大小为整个虚拟桌面
         self.setGeometry(self.desktop_rect)
         self.setMouseTracking(True)
@@ -84,6 +97,7 @@ class ScreenshotOverlay(QWidget):
                 self.logger.warning("QApplication未实例化，临时创建一个")
                 QApplication([])
 
+            start = time.perf_counter()
             if self.is_macos:
                 self.full_screenshot = screen.grabWindow(0)
             else:
@@ -94,6 +108,7 @@ class ScreenshotOverlay(QWidget):
                     self.desktop_rect.width(),
                     self.desktop_rect.height(),
                 )
+            self.grab_seconds = time.perf_counter() - start
             if self.full_screenshot.isNull():
                 self.logger.error("捕获屏幕截图失败: grabWindow返回空pixmap")
             else:
@@ -105,44 +120,78 @@ class ScreenshotOverlay(QWidget):
             self.logger.error(f"捕获屏幕截图过程中发生异常: {e}")
             self.full_screenshot = None
 
+    def build_dimmed_background(self):
+        """在截图上一次性叠加半透明遮罩，之后每帧直接绘制该图"""
+        self.dimmed_screenshot = QPixmap(self.full_screenshot)
+        painter = QPainter(self.dimmed_screenshot)
+        painter.fillRect(self.dimmed_screenshot.rect(), self.overlay_color)
+        painter.end()
+
+    def selection_rect(self):
+        """当前需要绘制的选区，没有选区时返回None"""
+        if (
+            self.is_selecting
+            and self.has_moved
+            and not self.start_pos.isNull()
+            and not self.end_pos.isNull()
+        ):
+            return QRect(self.start_pos, self.end_pos).normalized()
+        return None
+
+    def dirty_region(self):
+        """当前选区边框和十字辅助线覆盖的区域，状态变化前后各取一次即为需要重绘的区域"""
+        region = QRegion()
+        selection_rect = self.selection_rect()
+        if selection_rect is not None:
+            # 边框和抗锯齿会超出选区1像素，多留一些余量
+            region = region.united(selection_rect.adjusted(-2, -2, 2, 2))
+        if not self.end_pos.isNull() and not self.is_selecting:
+            region = region.united(QRect(0, self.end_pos.y() - 1, self.width(), 3))
+            region = region.united(QRect(self.end_pos.x() - 1, 0, 3, self.height()))
+        return region
+
+    def frame_stats(self):
+        """返回帧绘制耗时统计（毫秒）"""
+        if not self.frame_times:
+            return {"frames": 0, "avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0, "over_budget": 0}
+        times = sorted(self.frame_times)
+        return {
+            "frames": len(times),
+            "avg_ms": sum(times) / len(times),
+            "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+            "max_ms": times[-1],
+            "over_budget": sum(1 for t in times if t > FRAME_BUDGET_MS),
+        }
+
     def paintEvent(self, event):
         """绘制事件：绘制背景、遮罩、选区和辅助线"""
+        start_time = time.perf_counter()
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
 
-        # 绘制半透明遮罩层
-        if self.full_screenshot and not self.full_screenshot.isNull():
-            painter.drawPixmap(0, 0, self.full_screenshot)
-            painter.fillRect(self.rect(), self.overlay_color)
+        # 绘制预先合成的遮罩背景，绘制会被裁剪到本次更新的区域
+        if self.dimmed_screenshot and not self.dimmed_screenshot.isNull():
+            painter.drawPixmap(0, 0, self.dimmed_screenshot)
         else:
             painter.fillRect(self.rect(), QColor(100, 100, 100))
             painter.setPen(Qt.white)
             painter.drawText(self.rect(), Qt.AlignCenter, "无法捕获屏幕截图")
 
         # 如果正在选择，绘制清晰的选区和边框
-        if (
-            self.is_selecting
-            and self.has_moved
-            and not self.start_pos.isNull()
-            and not self.end_pos.isNull()
-        ):
-            selection_rect = QRect(self.start_pos, self.end_pos).normalized()
-
+        selection_rect = self.selection_rect()
+        if selection_rect is not None:
             if self.full_screenshot and not self.full_screenshot.isNull():
                 # 在遮罩层上显示选区部分的原始截图
                 if self.is_macos:
-                    # 计算在截图中的对应区域
+                    # 计算在截图中的对应区域，直接按源区域绘制，避免每帧复制
                     screenshot_rect = self.calculate_screenshot_rect(selection_rect)
-
-                    # 从原始截图中提取选择的区域并显示
-                    cropped_pixmap = self.full_screenshot.copy(screenshot_rect)
-                    painter.drawPixmap(selection_rect, cropped_pixmap)
+                    painter.drawPixmap(
+                        QRectF(selection_rect), self.full_screenshot, QRectF(screenshot_rect)
+                    )
                 else:
-                    painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
                     painter.drawPixmap(
                         selection_rect, self.full_screenshot, selection_rect
                     )
-                    painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
 
             # 绘制选区边框
             pen = QPen(Qt.red, 1, Qt.SolidLine)
@@ -164,6 +213,11 @@ class ScreenshotOverlay(QWidget):
             # 垂直线
             painter.drawLine(self.end_pos.x(), 0, self.end_pos.x(), self.height())
 
+        painter.end()
+        frame_ms = (time.perf_counter() - start_time) * 1000
+        self.frame_times.append(frame_ms)
+        self.frame_rendered.emit(frame_ms)
+
     def calculate_screenshot_rect(self, selection_rect):
         # 获取截图的实际尺寸和桌面的逻辑尺寸
         screenshot_size = self.full_screenshot.size()
@@ -190,16 +244,18 @@ class ScreenshotOverlay(QWidget):
             and self.full_screenshot
             and not self.full_screenshot.isNull()
         ):
+            old_region = self.dirty_region()
             self.start_pos = event.pos()
             self.end_pos = event.pos()
             self.is_selecting = True
             self.has_moved = False
-            self.update()
+            self.update(old_region.united(self.dirty_region()))
 
     def mouseMoveEvent(self, event):
         """鼠标移动事件：更新选择区域或辅助线位置"""
         if self.full_screenshot and not self.full_screenshot.isNull():
             current_pos = event.pos()
+            old_region = self.dirty_region()
 
             if self.is_selecting:
                 # 检查是否移动了足够的距离
@@ -213,10 +269,10 @@ class ScreenshotOverlay(QWidget):
 
                 self.end_pos = current_pos
                 if self.has_moved:
-                    self.update()
+                    self.update(old_region.united(self.dirty_region()))
             else:
                 self.end_pos = current_pos
-                self.update()
+                self.update(old_region.united(self.dirty_region()))
 
     def mouseReleaseEvent(self, event):
         """鼠标释放事件：完成选择，截取图片或取消"""
@@ -277,6 +333,17 @@ class ScreenshotOverlay(QWidget):
 
                 self.close()  # 关闭覆盖层
 
+    def closeEvent(self, event):
+        """关闭时记录帧耗时统计"""
+        stats = self.frame_stats()
+        if stats["frames"]:
+            self.logger.info(
+                f"截图覆盖层绘制 {stats['frames']} 帧, 平均 {stats['avg_ms']:.2f}ms, "
+                f"P95 {stats['p95_ms']:.2f}ms, 最大 {stats['max_ms']:.2f}ms, "
+                f"超出60fps预算 {stats['over_budget']} 帧"
+            )
+        super().closeEvent(event)
+
     def keyPressEvent(self, event):
         """键盘事件：按ESC取消截图"""
         if event.key() == Qt.Key_Escape:
@@ -0,0 +1,237 @@
+"""
+多进程识别worker池（批量识别 / 服务端场景）
+
+单进程多线程时解码阶段受限于小矩阵乘的延迟，增加intra-op线程数几乎不再提速。
+这里改为启动N个进程，每个进程用少量线程做贪心解码：
+
+    - 主进程加载一次模型，调用 model.share_memory() 把权重放入共享内存，
+      子进程通过torch.multiprocessing拿到的是同一份只读权重，而不是N份拷贝
+    - 所有任务放入同一个队列，空闲的worker自行领取，长公式不会把其他图片堵在某个worker上
+    - 结果由主进程的收集线程按任务id交给对应的Future
+    - worker异常退出（崩溃、被OOM杀掉）时，收集线程让它手上任务的Future抛出异常，并重启该worker
+
+用法:
+    python tools/worker_pool.py test_imgs --workers 4 --threads 1
+"""
+
+import argparse
+import glob
+import itertools
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+import torch
+import torch.multiprocessing as mp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_model(cfg_path, device="cpu"):
+    """按配置文件构建模型和eval视觉处理器（与LocalProcessor.init_model一致，不依赖Qt）"""
+    import unimernet.tasks as tasks
+    from unimernet.common.config import Config
+    from unimernet.processors import load_processor
+
+    args = argparse.Namespace(cfg_path=cfg_path, options=None)
+    cfg = Config(args)
+    task = tasks.setup_task(cfg)
+    model = task.build_model(cfg).to(device)
+    model.eval()
+    vis_processor = load_processor(
+        "formula_image_eval",
+        cfg.config.datasets.formula_rec_eval.vis_processor.eval,
+    )
+    return model, vis_processor
+
+
+def _worker_main(worker_id, model, vis_processor, threads, task_queue, result_queue, current_jobs):
+    """
+    子进程入口：从任务队列领取(job_id, 图片)，识别后把(job_id, 结果, 错误)放回结果队列。
+    领取的任务id写入共享数组current_jobs[worker_id]，进程异常退出时主进程据此找到未完成的任务
+    """
+    torch.set_num_threads(threads)
+    model.eval()
+    result_queue.put(("ready", worker_id, None))
+    while True:
+        job = task_queue.get()
+        if job is None:
+            break
+        job_id, image = job
+        current_jobs[worker_id] = job_id
+        try:
+            if isinstance(image, str):
+                from PIL import Image
+
+                image = Image.open(image)
+            image_tensor = vis_processor(image.convert("RGB")).unsqueeze(0)
+            with torch.no_grad():
+                output = model.generate({"image": image_tensor})
+            result_queue.put((job_id, output["pred_str"][0], None))
+        except Exception as e:
+            result_queue.put((job_id, None, f"{type(e).__name__}: {e}"))
+
+
+class InferencePool:
+    """
+    共享权重的多进程识别池
+
+    参数:
+        model: 已加载的识别模型（UniMERModel，仅支持CPU）
+        vis_processor: eval视觉处理器，vis_processor(PIL图像) -> [1, H, W]张量
+        num_workers: 进程数
+        threads_per_worker: 每个进程的torch intra-op线程数
+        start_method: 进程启动方式，默认spawn（fork后的OpenMP线程池可能死锁）
+    """
+
+    POLL_INTERVAL = 0.5  # 收集线程等待结果或worker退出的最长时间（秒）
+
+    def __init__(self, model, vis_processor, num_workers=2, threads_per_worker=1, start_method="spawn"):
+        if next(model.parameters()).is_cuda:
+            raise ValueError("InferencePool只支持CPU模型")
+        self.logger = logging.getLogger("logs/FreeTex.log")
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+
+        # 权重移入共享内存后，子进程反序列化得到的是同一块内存
+        model.share_memory()
+
+        self._model = model
+        self._vis_processor = vis_processor
+        self._ctx = mp.get_context(start_method)
+        self._task_queue = self._ctx.Queue()
+        # 结果队列用SimpleQueue：put直接写入管道，worker随后崩溃也不会丢失已放入的结果
+        self._result_queue = self._ctx.SimpleQueue()
+        # 每个worker当前领取的任务id（-1表示尚未领取），worker直接写共享内存，进程被杀也不会丢
+        self._current_jobs = self._ctx.Array("q", [-1] * num_workers, lock=False)
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._ready = threading.Event()
+        self._ready_workers = set()
+        self._closing = False
+
+        self._workers = [self._start_worker(i) for i in range(num_workers)]
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        self.logger.info(f"识别进程池已启动: {num_workers}个进程, 每个{threads_per_worker}线程")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pids(self):
+        return [worker.pid for worker in self._workers]
+
+    def wait_ready(self, timeout=None):
+        """等待所有worker完成启动（模型已反序列化），用于排除启动时间"""
+        return self._ready.wait(timeout)
+
+    def _start_worker(self, worker_id):
+        self._current_jobs[worker_id] = -1
+        worker = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self._model, self._vis_processor, self.threads_per_worker,
+                  self._task_queue, self._result_queue, self._current_jobs),
+            daemon=True,
+        )
+        worker.start()
+        return worker
+
+    def _check_workers(self):
+        """让异常退出的worker手上的任务失败，并重启该worker"""
+        for worker_id, worker in enumerate(self._workers):
+            if self._closing or worker.is_alive():
+                continue
+            message = f"识别进程{worker_id}异常退出 (exitcode={worker.exitcode})"
+            self.logger.error(message)
+            with self._lock:
+                future = self._futures.pop(self._current_jobs[worker_id], None)
+            if future is not None:
+                future.set_exception(RuntimeError(message))
+            self._ready_workers.discard(worker_id)
+            self._workers[worker_id] = self._start_worker(worker_id)
+
+    def _collect(self):
+        while True:
+            # 与concurrent.futures.ProcessPoolExecutor相同，同时等待结果管道和各进程的sentinel
+            sentinels = [worker.sentinel for worker in self._workers]
+            wait([self._result_queue._reader] + sentinels, timeout=self.POLL_INTERVAL)
+            if self._result_queue.empty():
+                # 已读完所有送达的结果，此时仍未完成的任务才属于已退出的worker
+                self._check_workers()
+                continue
+            job_id, result, error = self._result_queue.get()
+            if job_id is None:
+                break
+            if job_id == "ready":
+                self._ready_workers.add(result)
+                if len(self._ready_workers) == self.num_workers:
+                    self._ready.set()
+                continue
+            with self._lock:
+                future = self._futures.pop(job_id, None)
+            if future is None:  # 已因worker退出而失败
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def submit(self, image):
+        """
+        提交一张图片（PIL图像或路径），返回concurrent.futures.Future，结果为LaTeX字符串
+        """
+        future = Future()
+        job_id = next(self._job_ids)
+        with self._lock:
+            self._futures[job_id] = future
+        self._task_queue.put((job_id, image))
+        return future
+
+    def map(self, images):
+        """按输入顺序返回所有图片的识别结果"""
+        futures = [self.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._closing = True
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._result_queue.put((None, None, None))
+        self._collector.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程批量识别目录中的公式图片")
+    parser.add_argument("image_dir")
+    parser.add_argument("--cfg-path", default="demo.yaml")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=1, help="每个进程的torch线程数")
+    parser.add_argument("--output", default=None, help="结果写入该文件（每行: 文件名\\tLaTeX）")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.image_dir, "*.png")))
+    model, vis_processor = load_model(args.cfg_path)
+    with InferencePool(model, vis_processor, args.workers, args.threads) as pool:
+        results = pool.map(paths)
+
+    lines = [f"{os.path.basename(p)}\t{r}" for p, r in zip(paths, results)]
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    else:
+        print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
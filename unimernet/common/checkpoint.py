@@ -0,0 +1,110 @@
+"""
+Background checkpoint writer used by the runners.
+"""
+
+import logging
+import os
+import threading
+from collections import deque
+
+import torch
+
+
+def snapshot_to_cpu(obj):
+    """
+    Recursively copy every tensor in `obj` to CPU so that training can keep
+    updating the live tensors while the copy is being serialised.
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    elif isinstance(obj, dict):
+        return {k: snapshot_to_cpu(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [snapshot_to_cpu(v) for v in obj]
+    elif isinstance(obj, tuple):
+        return tuple(snapshot_to_cpu(v) for v in obj)
+    else:
+        return obj
+
+
+def atomic_save(obj, path):
+    """
+    torch.save to a temporary file next to `path`, then rename it over `path`,
+    so a crash mid-write never leaves a truncated checkpoint behind.
+    """
+    tmp_path = path + ".tmp"
+    try:
+        torch.save(obj, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class AsyncCheckpointSaver:
+    """
+    Writes checkpoints from a background thread.
+
+    Args:
+        max_to_keep (int): number of rotating checkpoints kept on disk, older ones are
+            deleted. None keeps everything. Fixed-name checkpoints (best/latest) are
+            never rotated.
+        asynchronous (bool): if False, `save` writes on the calling thread.
+
+    At most one save is in flight: a new `save` first waits for the previous one.
+    """
+
+    def __init__(self, max_to_keep=None, asynchronous=True):
+        self.max_to_keep = max_to_keep
+        self.asynchronous = asynchronous
+        self._thread = None
+        self._error = None
+        self._history = deque()
+
+    def save(self, obj, path, rotate=False):
+        self.wait()
+        snapshot = snapshot_to_cpu(obj)
+        if not self.asynchronous:
+            self._write(snapshot, path, rotate)
+            self._raise_error()
+            return
+        self._thread = threading.Thread(
+            target=self._write, args=(snapshot, path, rotate), name="checkpoint-saver"
+        )
+        self._thread.start()
+
+    def wait(self):
+        """
+        Block until the in-flight save (if any) is on disk.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Saving checkpoint failed.") from error
+
+    def _write(self, obj, path, rotate):
+        try:
+            atomic_save(obj, path)
+            logging.info("Checkpoint written to {}.".format(path))
+            if rotate:
+                self._rotate(path)
+        except Exception as e:
+            logging.error("Failed to write checkpoint {}: {}".format(path, e))
+            self._error = e
+
+    def _rotate(self, path):
+        if path in self._history:
+            self._history.remove(path)
+        self._history.append(path)
+        if self.max_to_keep is None:
+            return
+        while len(self._history) > self.max_to_keep:
+            stale = self._history.popleft()
+            if os.path.exists(stale):
+                os.remove(stale)
+                logging.info("Removed old checkpoint {}.".format(stale))
@@ -0,0 +1,147 @@
+"""
+Offline evaluation metrics for formula recognition.
+
+bleu_score reproduces `evaluate.load("bleu")` (13a tokenizer, max_order=4,
+no smoothing) without touching the HF hub, token_accuracy works on whole
+batches of ids and edit_distances runs rapidfuzz over all pairs in parallel.
+"""
+
+import collections
+import math
+import re
+from functools import lru_cache
+
+import numpy as np
+import torch
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+_13A_REGEXES = [
+    # language-dependent part (assuming Western languages)
+    (re.compile(r"([\{-\~\[-\` -\&\(-\+\:-\@\/])"), r" \1 "),
+    # tokenize period and comma unless preceded by a digit
+    (re.compile(r"([^0-9])([\.,])"), r"\1 \2 "),
+    # tokenize period and comma unless followed by a digit
+    (re.compile(r"([\.,])([^0-9])"), r" \1 \2"),
+    # tokenize dash when preceded by a digit
+    (re.compile(r"([0-9])(-)"), r"\1 \2 "),
+]
+
+
+@lru_cache(maxsize=2 ** 16)
+def tokenize_13a(line):
+    """
+    The mteval-v13a tokenizer used by sacrebleu and `evaluate`'s bleu metric.
+    """
+    line = line.replace("<skipped>", "")
+    line = line.replace("-\n", "")
+    line = line.replace("\n", " ")
+    if "&" in line:
+        line = line.replace("&quot;", '"')
+        line = line.replace("&amp;", "&")
+        line = line.replace("&lt;", "<")
+        line = line.replace("&gt;", ">")
+    line = f" {line} "
+    for regex, repl in _13A_REGEXES:
+        line = regex.sub(repl, line)
+    return tuple(line.split())
+
+
+def _get_ngrams(segment, max_order):
+    ngram_counts = collections.Counter()
+    for order in range(1, max_order + 1):
+        for i in range(0, len(segment) - order + 1):
+            ngram_counts[segment[i:i + order]] += 1
+    return ngram_counts
+
+
+def bleu_score(predictions, references, max_order=4, smooth=False):
+    """
+    Corpus-level BLEU.
+
+    Args:
+        predictions (List[str]): predicted strings.
+        references (List[str] or List[List[str]]): one or more references per prediction.
+
+    Returns:
+        float: the same value as evaluate.load("bleu").compute(...)["bleu"].
+    """
+    matches_by_order = [0] * max_order
+    possible_matches_by_order = [0] * max_order
+    reference_length = 0
+    translation_length = 0
+
+    for refs, pred in zip(references, predictions):
+        if isinstance(refs, str):
+            refs = [refs]
+        refs = [tokenize_13a(r) for r in refs]
+        pred = tokenize_13a(pred)
+
+        reference_length += min(len(r) for r in refs)
+        translation_length += len(pred)
+
+        merged_ref_ngram_counts = collections.Counter()
+        for ref in refs:
+            merged_ref_ngram_counts |= _get_ngrams(ref, max_order)
+        overlap = _get_ngrams(pred, max_order) & merged_ref_ngram_counts
+        for ngram, count in overlap.items():
+            matches_by_order[len(ngram) - 1] += count
+        for order in range(1, max_order + 1):
+            possible_matches = len(pred) - order + 1
+            if possible_matches > 0:
+                possible_matches_by_order[order - 1] += possible_matches
+
+    precisions = [0.0] * max_order
+    for i in range(max_order):
+        if smooth:
+            precisions[i] = (matches_by_order[i] + 1.0) / (possible_matches_by_order[i] + 1.0)
+        elif possible_matches_by_order[i] > 0:
+            precisions[i] = float(matches_by_order[i]) / possible_matches_by_order[i]
+
+    if min(precisions) > 0:
+        geo_mean = math.exp(sum((1.0 / max_order) * math.log(p) for p in precisions))
+    else:
+        geo_mean = 0.0
+
+    if translation_length == 0:
+        return 0.0
+    ratio = float(translation_length) / reference_length
+    bp = 1.0 if ratio > 1.0 else math.exp(1 - 1.0 / ratio)
+    return geo_mean * bp
+
+
+def edit_distances(predictions, references, workers=-1):
+    """
+    Normalized Levenshtein distance of every (prediction, reference) pair,
+    computed by rapidfuzz on `workers` threads (-1 uses all cores).
+    """
+    if len(predictions) == 0:
+        return np.zeros(0, dtype=np.float64)
+    return process.cpdist(
+        predictions,
+        references,
+        scorer=Levenshtein.normalized_distance,
+        dtype=np.float64,
+        workers=workers,
+    )
+
+
+def token_accuracy(pred_ids, truth_ids, pad_token_id):
+    """
+    Per-sample token accuracy over positions where either side is not padding.
+
+    Args:
+        pred_ids (torch.Tensor): [b, n] predicted ids.
+        truth_ids (torch.Tensor): [b, m] ground-truth ids.
+
+    Returns:
+        torch.Tensor: [b] float accuracies (nan for a sample with no tokens at all).
+    """
+    truth_ids = truth_ids.to(pred_ids.device)
+    length = max(pred_ids.shape[1], truth_ids.shape[1])
+    pred_ids = torch.nn.functional.pad(pred_ids, (0, length - pred_ids.shape[1]), value=pad_token_id)
+    truth_ids = torch.nn.functional.pad(truth_ids, (0, length - truth_ids.shape[1]), value=pad_token_id)
+
+    mask = torch.logical_or(pred_ids != pad_token_id, truth_ids != pad_token_id)
+    correct = torch.logical_and(pred_ids == truth_ids, mask)
+    return correct.sum(dim=1).float() / mask.sum(dim=1).float()
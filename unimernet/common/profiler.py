@@ -0,0 +1,286 @@
+"""
+Opt-in per-module profiler for the UniMERNet encoder and MBart decoder.
+
+Forward hooks time every UnimerNetLayer, UnimerNetPatchMerging, ConvEnhance,
+MBartDecoderLayer and the LM head, plus the interesting sub-blocks inside them
+(window attention / MLP in the encoder, self-attention / cross-attention / FFN
+in the decoder). Every call is attributed to a stack such as
+
+    encoder.stage1;UnimerNetLayer;ConvEnhance
+    decoder;MBartDecoderLayer;cross_attn
+
+and accumulates wall time (total and self), an analytic FLOP estimate
+(Linear, Conv2d and attention matmuls) and the bytes of the tensors it returns.
+
+Usage:
+    >>> with ModuleProfiler(model) as prof:
+    ...     model.generate({"image": image})
+    >>> print(prof.table())
+    >>> prof.write_flamegraph("profile.folded")  # flamegraph.pl / speedscope
+"""
+
+import json
+import re
+import time
+from collections import OrderedDict, defaultdict
+
+import torch
+import torch.nn as nn
+
+# class name -> frame label
+DEFAULT_TARGETS = OrderedDict(
+    [
+        ("UnimerNetLayer", "UnimerNetLayer"),
+        ("UnimerNetPatchMerging", "UnimerNetPatchMerging"),
+        ("ConvEnhance", "ConvEnhance"),
+        ("MBartDecoderLayer", "MBartDecoderLayer"),
+    ]
+)
+
+# (parent class name, child attribute) -> frame label
+DEFAULT_SUBMODULES = OrderedDict(
+    [
+        (("UnimerNetLayer", "attention"), "window_attention"),
+        (("UnimerNetLayer", "intermediate"), "mlp"),
+        (("UnimerNetLayer", "output"), "mlp"),
+        (("MBartDecoderLayer", "self_attn"), "self_attn"),
+        (("MBartDecoderLayer", "encoder_attn"), "cross_attn"),
+        (("MBartDecoderLayer", "fc1"), "ffn"),
+        (("MBartDecoderLayer", "fc2"), "ffn"),
+    ]
+)
+
+_ENCODER_STAGE = re.compile(r"encoder\.layers\.(\d+)\.")
+
+
+def _stage_of(name):
+    match = _ENCODER_STAGE.search(name)
+    if match:
+        return "encoder.stage{}".format(match.group(1))
+    if "encoder." in name and "decoder" not in name:
+        return "encoder"
+    return "decoder"
+
+
+def _tensor_bytes(output):
+    if torch.is_tensor(output):
+        return output.numel() * output.element_size()
+    if isinstance(output, (tuple, list)):
+        return sum(_tensor_bytes(o) for o in output)
+    return 0
+
+
+def _flops(module, args, output):
+    """
+    Multiply-add FLOPs (2 per MAC) of the module's own arithmetic, not its children.
+    """
+    if isinstance(module, nn.Linear):
+        return 2 * output.numel() * module.in_features
+    if isinstance(module, nn.Conv2d):
+        kh, kw = module.kernel_size
+        return 2 * output.numel() * (module.in_channels // module.groups) * kh * kw
+
+    name = type(module).__name__
+    if name == "UnimerNetSelfAttention":
+        # (batch * windows, N, C): QK^T and AV over each window
+        windows, tokens, channels = args[0].shape
+        return 2 * 2 * windows * tokens * tokens * channels
+    if name in ("MBartSqueezeAttention", "MBartAttention"):
+        attn_output, _, present = output
+        bsz, tgt_len, embed_dim = attn_output.shape
+        src_len = present[0].shape[2] if present is not None else tgt_len
+        qk_dim = getattr(module, "squeeze_dim", embed_dim)
+        return 2 * bsz * tgt_len * src_len * (qk_dim + embed_dim)
+    return 0
+
+
+class _Record:
+    __slots__ = ("calls", "total", "self_time", "flops", "bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.self_time = 0.0
+        self.flops = 0
+        self.bytes = 0
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.total += other.total
+        self.self_time += other.self_time
+        self.flops += other.flops
+        self.bytes += other.bytes
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "total_ms": self.total * 1000,
+            "self_ms": self.self_time * 1000,
+            "gflops": self.flops / 1e9,
+            "mbytes": self.bytes / 2 ** 20,
+        }
+
+
+class ModuleProfiler:
+    """
+    Args:
+        model (nn.Module): any module containing the UniMERNet encoder / decoder.
+        targets (dict): class name -> frame label of the modules that open a frame.
+        submodules (dict): (parent class name, attribute) -> frame label of children
+            that open a nested frame.
+        synchronize (bool): call torch.cuda.synchronize() around every frame so
+            that CUDA times are real; defaults to True when the model is on CUDA.
+    """
+
+    def __init__(self, model, targets=None, submodules=None, synchronize=None):
+        self.model = model
+        self.targets = DEFAULT_TARGETS if targets is None else targets
+        self.submodules = DEFAULT_SUBMODULES if submodules is None else submodules
+        if synchronize is None:
+            param = next(model.parameters(), None)
+            synchronize = param is not None and param.is_cuda
+        self.synchronize = synchronize
+
+        self.records = defaultdict(_Record)
+        self._stack = []  # [path, start, child_time]
+        self._handles = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        frames = self._frame_modules()
+        for module, (stage, label) in frames.items():
+            self._handles.append(module.register_forward_pre_hook(self._push_hook(stage, label)))
+            self._handles.append(module.register_forward_hook(self._pop_hook()))
+
+        # leaves only contribute FLOPs to whatever frame is currently open
+        for module in self.model.modules():
+            if module in frames:
+                continue
+            if isinstance(module, (nn.Linear, nn.Conv2d)) or type(module).__name__ in (
+                "UnimerNetSelfAttention", "MBartSqueezeAttention", "MBartAttention"
+            ):
+                self._handles.append(module.register_forward_hook(self._flops_hook))
+
+    def stop(self):
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        self._stack = []
+
+    def reset(self):
+        self.records.clear()
+
+    def _frame_modules(self):
+        frames = OrderedDict()
+        for name, module in self.model.named_modules():
+            cls_name = type(module).__name__
+            if cls_name in self.targets:
+                frames[module] = (_stage_of(name), self.targets[cls_name])
+            elif name.endswith("lm_head"):
+                frames[module] = ("decoder", "lm_head")
+            for child_name, child in module.named_children():
+                label = self.submodules.get((cls_name, child_name))
+                if label is not None and child not in frames:
+                    frames[child] = (_stage_of(name + "." + child_name), label)
+        return frames
+
+    def _now(self):
+        if self.synchronize:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _push_hook(self, stage, label):
+        def hook(module, args):
+            parent = self._stack[-1][0] if self._stack else (stage,)
+            self._stack.append([parent + (label,), self._now(), 0.0])
+
+        return hook
+
+    def _pop_hook(self):
+        def hook(module, args, output):
+            end = self._now()
+            path, start, child_time = self._stack.pop()
+            elapsed = end - start
+            record = self.records[path]
+            record.calls += 1
+            record.total += elapsed
+            record.self_time += elapsed - child_time
+            record.flops += _flops(module, args, output)
+            record.bytes += _tensor_bytes(output)
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+        return hook
+
+    def _flops_hook(self, module, args, output):
+        if self._stack:
+            self.records[self._stack[-1][0]].flops += _flops(module, args, output)
+
+    def _aggregate(self, key):
+        result = defaultdict(_Record)
+        for path, record in self.records.items():
+            result[key(path)].merge(record)
+        return result
+
+    def by_type(self):
+        """
+        Totals per frame label (UnimerNetLayer, ConvEnhance, cross_attn, lm_head, ...).
+        Nested frames are reported separately, use self_ms to avoid double counting.
+        """
+        return {k: v.to_dict() for k, v in self._aggregate(lambda p: p[-1]).items()}
+
+    def by_stage(self):
+        """
+        Totals per stage (encoder.stage0..3, decoder), self time only so they add up.
+        """
+        result = defaultdict(_Record)
+        for path, record in self.records.items():
+            agg = result[path[0]]
+            agg.calls += record.calls
+            agg.self_time += record.self_time
+            agg.flops += record.flops
+            agg.bytes += record.bytes
+            if len(path) == 2:
+                agg.total += record.total
+        return {k: v.to_dict() for k, v in result.items()}
+
+    def to_dict(self):
+        return {
+            "by_stage": self.by_stage(),
+            "by_type": self.by_type(),
+            "stacks": {";".join(path): record.to_dict() for path, record in self.records.items()},
+        }
+
+    def save_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_flamegraph(self, path):
+        """
+        Collapsed stacks ("a;b;c <self microseconds>"), the input format of
+        flamegraph.pl, speedscope and inferno.
+        """
+        with open(path, "w") as f:
+            for stack, record in sorted(self.records.items()):
+                micros = int(round(record.self_time * 1e6))
+                if micros > 0:
+                    f.write("{} {}\n".format(";".join(stack), micros))
+
+    def table(self, sort_by="self_ms"):
+        rows = sorted(
+            ((";".join(path), record.to_dict()) for path, record in self.records.items()),
+            key=lambda item: item[1][sort_by],
+            reverse=True,
+        )
+        lines = ["{:<56}{:>8}{:>12}{:>12}{:>10}{:>10}".format(
+            "stack", "calls", "total_ms", "self_ms", "GFLOPs", "MB")]
+        for stack, rec in rows:
+            lines.append("{:<56}{:>8d}{:>12.2f}{:>12.2f}{:>10.3f}{:>10.1f}".format(
+                stack, rec["calls"], rec["total_ms"], rec["self_ms"], rec["gflops"], rec["mbytes"]))
+        return "\n".join(lines)
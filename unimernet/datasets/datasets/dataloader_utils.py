@@ -6,7 +6,10 @@
 """
 
 import time
+import queue
 import random
+import logging
+import threading
 import torch
 from unimernet.datasets.data_utils import move_to_cuda
 from torch.utils.data import DataLoader
@@ -149,6 +152,102 @@ class PrefetchLoader(object):
         return method
 
 
+class ThreadedPrefetchLoader(object):
+    """
+    Device-agnostic counterpart of PrefetchLoader.
+
+    A background thread pulls batches from the wrapped loader (collation and
+    tensor preparation happen there) into a bounded queue, so the training
+    step overlaps with data loading on CPU as well. The consumer side counts
+    how often it had to wait on an empty queue, which makes data-bound
+    training visible in the logs.
+    """
+
+    _END = object()
+
+    def __init__(self, loader, queue_size=2):
+        self.loader = loader
+        self.queue_size = max(int(queue_size), 1)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.num_batches = 0
+        self.num_starved = 0
+        self.wait_time = 0.0
+
+    def stats(self):
+        """
+        Returns:
+            dict: batches fetched, how many of them found the queue empty and
+            the total time (in seconds) the consumer spent waiting.
+        """
+        return {
+            "batches": self.num_batches,
+            "starved": self.num_starved,
+            "starved_ratio": self.num_starved / max(self.num_batches, 1),
+            "wait_time": self.wait_time,
+        }
+
+    def _worker(self, it, out_queue, stop_event):
+        try:
+            for batch in it:
+                while not stop_event.is_set():
+                    try:
+                        out_queue.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop_event.is_set():
+                    return
+            item = self._END
+        except Exception as e:  # re-raised in the consumer thread
+            item = e
+        while not stop_event.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self):
+        out_queue = queue.Queue(maxsize=self.queue_size)
+        stop_event = threading.Event()
+        thread = threading.Thread(
+            target=self._worker,
+            args=(iter(self.loader), out_queue, stop_event),
+            daemon=True,
+        )
+        thread.start()
+        try:
+            while True:
+                starved = out_queue.empty()
+                start = time.time()
+                batch = out_queue.get()
+                if batch is self._END:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                self.num_batches += 1
+                if starved:
+                    self.num_starved += 1
+                    self.wait_time += time.time() - start
+                yield batch
+        finally:
+            stop_event.set()
+            thread.join(timeout=1.0)
+            logging.info(
+                "Prefetch stats: {batches} batches, {starved} starved "
+                "({starved_ratio:.1%}), waited {wait_time:.2f}s.".format(**self.stats())
+            )
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __getattr__(self, name):
+        method = self.loader.__getattribute__(name)
+        return method
+
+
 def record_cuda_stream(batch):
     if isinstance(batch, torch.Tensor):
         batch.record_stream(torch.cuda.current_stream())
@@ -38,15 +38,26 @@ class Blip2Base(BaseModel):
         return tokenizer
 
     def maybe_autocast(self, dtype=torch.float16):
-        # if on cpu, don't use autocast
+        # if on cpu, use autocast only with the dtype set by set_cpu_autocast (fp32 otherwise)
         # if on gpu, use autocast with dtype if provided, otherwise use torch.float16
         enable_autocast = self.device != torch.device("cpu")
 
         if enable_autocast:
             return torch.cuda.amp.autocast(dtype=dtype)
+        elif getattr(self, "cpu_autocast_dtype", None) is not None:
+            return torch.autocast("cpu", dtype=self.cpu_autocast_dtype)
         else:
             return contextlib.nullcontext()
 
+    def set_cpu_autocast(self, dtype=torch.bfloat16):
+        """
+        Run forward passes on cpu under torch.autocast with `dtype` (weights stay fp32,
+        matmuls and convolutions run in `dtype`). None restores fp32.
+        """
+        if dtype is not None and dtype != torch.bfloat16:
+            raise ValueError("cpu autocast only supports torch.bfloat16, got {}".format(dtype))
+        self.cpu_autocast_dtype = dtype
+
     @classmethod
     def init_Qformer(cls, num_query_token, vision_width, cross_attention_freq=2):
         encoder_config = BertConfig.from_pretrained("/mnt/lustre/hanxiao/work/bert-base-uncased")
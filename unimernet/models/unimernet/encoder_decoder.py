@@ -1,4 +1,5 @@
 import re
+import collections
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -24,6 +25,7 @@ from .configuration_unimernet_encoder import UnimerNetConfig
 
 from .modeling_unimernet_encoder import UnimerNetPatchEmbeddings, UnimerNetEmbeddings, UnimerNetModel, UnimerNetEncoder
 from .modeling_unimernet_decoder import MBartDecoder
+from .generation import compact_greedy, draft_verify_greedy, encoder_memory, supports_greedy_loop
 
 logger = logging.get_logger(__name__)
 
@@ -212,6 +214,8 @@ class CustomMBartDecoder(MBartDecoder):
         output_attentions: Optional[bool] = None,
         output_hidden_states: Optional[bool] = None,
         return_dict: Optional[bool] = None,
+        exit_layer: Optional[int] = None,
+        position_ids: Optional[torch.LongTensor] = None,
     ) -> Union[Tuple, BaseModelOutputWithPastAndCrossAttentions]:
         r"""
         Args:
@@ -277,6 +281,12 @@ class CustomMBartDecoder(MBartDecoder):
                 for more detail.
             return_dict (`bool`, *optional*):
                 Whether or not to return a [`~utils.ModelOutput`] instead of a plain tuple.
+            exit_layer (`int`, *optional*):
+                Only run the first `exit_layer` decoder layers (then the final layer norm). Used as the draft
+                model of speculative decoding; `past_key_values` then only needs those layers.
+            position_ids (`torch.LongTensor` of shape `(batch_size, sequence_length)`, *optional*):
+                Per-row positions, for batches whose rows are at different steps (left-padded cache
+                masked by `attention_mask`). Defaults to `past_key_values_length + arange(sequence_length)`.
         """
         output_attentions = output_attentions if output_attentions is not None else self.config.output_attentions
         output_hidden_states = (
@@ -324,7 +334,10 @@ class CustomMBartDecoder(MBartDecoder):
                 )
 
         # embed positions
-        positions = self.embed_positions(input, past_key_values_length)
+        if position_ids is None:
+            positions = self.embed_positions(input, past_key_values_length)
+        else:
+            positions = self.embed_positions.weight[position_ids + self.embed_positions.offset]
 
         hidden_states = inputs_embeds + positions.to(inputs_embeds.device)
 
@@ -356,7 +369,8 @@ class CustomMBartDecoder(MBartDecoder):
                         f"The `{mask_name}` should be specified for {len(self.layers)} layers, but it is for"
                         f" {attn_mask.size()[0]}."
                     )
-        for idx, decoder_layer in enumerate(self.layers):
+        layers = self.layers if exit_layer is None else self.layers[:exit_layer]
+        for idx, decoder_layer in enumerate(layers):
             # add LayerDrop (see https://arxiv.org/abs/1909.11556 for description)
             if output_hidden_states:
                 all_hidden_states += (hidden_states,)
@@ -434,6 +448,103 @@ class CustomMBartForCausalLM(MBartForCausalLM):
         # Modify the decoder within MBartDecoderWrapper
         self.model.decoder = CustomMBartDecoder(config)
 
+        # optional reduced LM head used at inference, see set_vocab_subset
+        self.register_buffer("vocab_subset", None, persistent=False)
+        self.register_buffer("vocab_subset_weight", None, persistent=False)
+        self.register_buffer("vocab_rest_centroid", None, persistent=False)
+        self.register_buffer("vocab_rest_radius", None, persistent=False)
+        self.register_buffer("vocab_max_row_norm", None, persistent=False)
+        self.vocab_subset_enabled = True
+        self.vocab_subset_stats = {"rows": 0, "fallback_rows": 0}
+
+    @torch.no_grad()
+    def set_vocab_subset(self, token_ids, num_clusters=32, kmeans_iters=10):
+        """
+        Compute inference logits only for `token_ids` (e.g. the tokens that occur in the
+        training formulas). The remaining rows of the LM head are grouped into
+        `num_clusters` balls (centroid c_k, radius r_k), so for every position h the logit
+        of any excluded token is bounded by max_k(h.c_k + |h| * r_k). When the best reduced
+        logit does not beat that bound the position falls back to the full head, hence
+        the argmax is the same as with the full vocabulary, also under fp16/bf16 autocast
+        (the bound is computed in fp32 with a margin for the rounding of the logits).
+        Excluded tokens get the lowest finite logit.
+
+        Must be called again after the LM head weights change. Pass None to disable.
+        """
+        if token_ids is None:
+            self.vocab_subset = None
+            self.vocab_subset_weight = None
+            self.vocab_rest_centroid = None
+            self.vocab_rest_radius = None
+            self.vocab_max_row_norm = None
+            return
+
+        weight = self.lm_head.weight.detach()
+        ids = torch.tensor(sorted(set(int(i) for i in token_ids)), dtype=torch.long, device=weight.device)
+        rest = torch.ones(weight.shape[0], dtype=torch.bool, device=weight.device)
+        rest[ids] = False
+
+        self.vocab_subset = ids
+        self.vocab_subset_weight = weight[ids].contiguous()
+        self.vocab_max_row_norm = weight.float().norm(dim=-1).max()
+        if rest.any():
+            centroids, radii = self._cluster_rows(weight[rest].float(), num_clusters, kmeans_iters)
+            self.vocab_rest_centroid = centroids
+            self.vocab_rest_radius = radii
+        else:
+            self.vocab_rest_centroid = None
+            self.vocab_rest_radius = None
+        self.vocab_subset_stats = {"rows": 0, "fallback_rows": 0}
+
+    @staticmethod
+    def _cluster_rows(rows, num_clusters, iters):
+        """
+        A few k-means iterations, returns the centroids and the radius of every cluster.
+        """
+        num_clusters = max(1, min(num_clusters, rows.shape[0]))
+        init = torch.linspace(0, rows.shape[0] - 1, num_clusters, device=rows.device).long()
+        centroids = rows[init].clone()
+        for _ in range(iters):
+            assign = torch.cdist(rows, centroids).argmin(dim=1)
+            for k in range(num_clusters):
+                members = rows[assign == k]
+                if members.shape[0]:
+                    centroids[k] = members.mean(dim=0)
+        assign = torch.cdist(rows, centroids).argmin(dim=1)
+        dist = (rows - centroids[assign]).norm(dim=-1)
+        radii = torch.zeros(num_clusters, device=rows.device).scatter_reduce(0, assign, dist, reduce="amax")
+        return centroids, radii
+
+    def _vocab_subset_logits(self, hidden_states):
+        shape = hidden_states.shape[:-1]
+        flat = hidden_states.reshape(-1, hidden_states.shape[-1])
+        sub_logits = F.linear(flat, self.vocab_subset_weight.to(flat.dtype))
+        logits = sub_logits.new_full((flat.shape[0], self.lm_head.out_features), torch.finfo(sub_logits.dtype).min)
+        logits[:, self.vocab_subset] = sub_logits
+
+        fallback_rows = 0
+        if self.vocab_rest_centroid is not None:
+            # bound and comparison in fp32 whatever autocast is active. A logit computed in
+            # sub_logits.dtype (inputs rounded to it, fp32 accumulation, rounded result) is off by
+            # at most ~(1.5 eps + n eps_fp32) |h| |w|; the margin covers both the best reduced logit
+            # and the excluded one.
+            with torch.autocast(flat.device.type, enabled=False):
+                flat32 = flat.float()
+                h_norm = flat32.norm(dim=-1, keepdim=True)
+                bound = flat32 @ self.vocab_rest_centroid.t() + h_norm * self.vocab_rest_radius
+                bound = bound.max(dim=-1).values
+                eps = torch.finfo(sub_logits.dtype).eps
+                rel_error = 4 * eps + 2 * flat.shape[-1] * torch.finfo(torch.float32).eps
+                margin = rel_error * h_norm.squeeze(-1) * self.vocab_max_row_norm
+                fallback = sub_logits.max(dim=-1).values.float() <= bound + margin
+            fallback_rows = int(fallback.sum())
+            if fallback_rows:
+                logits[fallback] = self.lm_head(flat[fallback]).to(logits.dtype)
+
+        self.vocab_subset_stats["rows"] += flat.shape[0]
+        self.vocab_subset_stats["fallback_rows"] += fallback_rows
+        return logits.view(*shape, -1)
+
     
     def forward(
         self,
@@ -451,6 +562,8 @@ class CustomMBartForCausalLM(MBartForCausalLM):
         output_hidden_states: Optional[bool] = None,
         return_dict: Optional[bool] = None,
         count_gt: Optional[torch.LongTensor] = None,
+        exit_layer: Optional[int] = None,
+        position_ids: Optional[torch.LongTensor] = None,
     ) -> Union[Tuple, CausalLMOutputWithCrossAttentions]:
         r"""
         Args:
@@ -561,9 +674,20 @@ class CustomMBartForCausalLM(MBartForCausalLM):
             output_attentions=output_attentions,
             output_hidden_states=output_hidden_states,
             return_dict=return_dict,
+            exit_layer=exit_layer,
+            position_ids=position_ids,
         )
 
-        logits = self.lm_head(outputs[0])
+        use_vocab_subset = (
+            self.vocab_subset is not None
+            and self.vocab_subset_enabled
+            and labels is None
+            and not self.training
+        )
+        if use_vocab_subset:
+            logits = self._vocab_subset_logits(outputs[0])
+        else:
+            logits = self.lm_head(outputs[0])
 
         loss = None
         if labels is not None:
@@ -776,14 +900,100 @@ class DonutEncoderDecoder(nn.Module):
         return loss
 
     @torch.no_grad()
-    def generate(self, pixel_values, temperature, max_new_tokens, decoder_start_token_id, do_sample, top_p,
-                 **kwargs):
-
+    def encode(self, pixel_values):
+        """
+        Vision encoder only. The returned BaseModelOutput can be passed to generate()
+        as `encoder_outputs`, any number of times.
+        """
         num_channels = pixel_values.shape[1]
         if num_channels == 1:
             pixel_values = pixel_values.repeat(1, 3, 1, 1)
+        return self.model.encoder(pixel_values, return_dict=True)
+
+    @torch.no_grad()
+    def generate(self, pixel_values, temperature, max_new_tokens, decoder_start_token_id, do_sample, top_p,
+                 draft_layers=None, prompt_lookup_ngram=None, num_draft_tokens=4, decode_stats=None,
+                 encoder_outputs=None, compact_batch=True, **kwargs):
+        """
+        Args:
+            pixel_values: images, may be None when `encoder_outputs` is given.
+            encoder_outputs (BaseModelOutput): result of encode(); skips the encoder.
+            draft_layers (int): enable self-speculative greedy decoding with the first
+                `draft_layers` decoder layers as draft model.
+            prompt_lookup_ngram (int): enable model-free drafting that continues the latest
+                earlier match of the last (at most) n generated tokens.
+            num_draft_tokens (int): initial number of tokens proposed per round.
+            decode_stats (generation.SpeculativeStats): receives the acceptance counts.
+            compact_batch (bool): greedy decoding of a batch removes finished sequences from
+                the batch (see generation.compact_greedy).
+
+        Drafting (see generation.draft_verify_greedy) is only used for greedy decoding of
+        a single image, batch compaction for greedy decoding of several images, otherwise
+        HF generate() is used. The output is the same either way.
+
+        The reduced LM head (CustomMBartForCausalLM.set_vocab_subset) only preserves the
+        argmax, so it is switched off unless decoding is plain greedy search.
+        """
+        decoder = self.model.decoder
+        generation_config = self.model.generation_config
+        previous = decoder.vocab_subset_enabled
+        decoder.vocab_subset_enabled = previous and not do_sample and supports_greedy_loop(generation_config)
+        try:
+            return self._generate(
+                pixel_values, temperature, max_new_tokens, decoder_start_token_id, do_sample, top_p,
+                draft_layers=draft_layers, prompt_lookup_ngram=prompt_lookup_ngram,
+                num_draft_tokens=num_draft_tokens, decode_stats=decode_stats,
+                encoder_outputs=encoder_outputs, compact_batch=compact_batch,
+            )
+        finally:
+            decoder.vocab_subset_enabled = previous
+
+    def _generate(self, pixel_values, temperature, max_new_tokens, decoder_start_token_id, do_sample, top_p,
+                  draft_layers, prompt_lookup_ngram, num_draft_tokens, decode_stats, encoder_outputs,
+                  compact_batch):
+        if encoder_outputs is None:
+            encoder_outputs = self.encode(pixel_values)
+        batch_size = encoder_outputs.last_hidden_state.shape[0]
+
+        generation_config = self.model.generation_config
+        if draft_layers and draft_layers >= len(self.model.decoder.model.decoder.layers):
+            draft_layers = None
+        use_drafting = (
+            (draft_layers or prompt_lookup_ngram)
+            and not do_sample
+            and batch_size == 1
+            and supports_greedy_loop(generation_config)
+        )
+        if use_drafting:
+            encoder_hidden_states = encoder_memory(self.model, encoder_outputs.last_hidden_state)
+            outputs = draft_verify_greedy(
+                self.model,
+                encoder_hidden_states,
+                max_new_tokens=max_new_tokens,
+                decoder_start_token_id=decoder_start_token_id,
+                eos_token_id=self.model.config.eos_token_id,
+                forced_eos_token_id=generation_config.forced_eos_token_id,
+                draft_layers=draft_layers,
+                prompt_lookup_ngram=prompt_lookup_ngram,
+                num_draft_tokens=num_draft_tokens,
+                stats=decode_stats,
+            )
+            return outputs[:, 1:]
+
+        if compact_batch and not do_sample and batch_size > 1 and supports_greedy_loop(generation_config):
+            outputs = compact_greedy(
+                self.model,
+                encoder_memory(self.model, encoder_outputs.last_hidden_state),
+                max_new_tokens=max_new_tokens,
+                decoder_start_token_id=decoder_start_token_id,
+                eos_token_id=self.model.config.eos_token_id,
+                pad_token_id=self.model.config.pad_token_id,
+                forced_eos_token_id=generation_config.forced_eos_token_id,
+            )
+            return outputs[:, 1:]
+
         outputs = self.model.generate(
-            pixel_values=pixel_values,
+            encoder_outputs=encoder_outputs,
             max_new_tokens=max_new_tokens,
             decoder_start_token_id=decoder_start_token_id,
             temperature=temperature,
@@ -794,6 +1004,10 @@ class DonutEncoderDecoder(nn.Module):
 
 
 
+# the only things ftfy.fix_text changes: non-ASCII, control characters and HTML entities
+_NEEDS_FIX_TEXT = re.compile(r"[^\x20-\x7e\n\t]|&#?[0-9A-Za-z]{1,24};")
+
+
 class DonutTokenizer:
     def __init__(self, path):
         AutoImageProcessor.register(VariableUnimerNetConfig, VariableDonutImageProcessor)
@@ -804,6 +1018,8 @@ class DonutTokenizer:
         self.pad_token_id = self.tokenizer.pad_token_id
         self.bos_token_id = self.tokenizer.bos_token_id
         self.eos_token_id = self.tokenizer.eos_token_id
+        self._clean_tokens = None
+        self._detokenize_drop_ids = None
 
     def __len__(self):
         return len(self.tokenizer)
@@ -823,21 +1039,56 @@ class DonutTokenizer:
 
     @staticmethod
     def post_process(text):
-        text = fix_text(text)
+        # plain ASCII LaTeX is returned unchanged by fix_text, skip it
+        if _NEEDS_FIX_TEXT.search(text):
+            text = fix_text(text)
         return text
 
+    @staticmethod
+    def _strip_ids(tokens, drop_ids):
+        """
+        Remove `drop_ids` from every sequence of a [batch, seq] tensor (or list of lists).
+        Tensor rows stay tensors: batch_decode converts a tensor with one tolist() but
+        checks a python list element by element.
+        """
+        if torch.is_tensor(tokens):
+            tokens = tokens.cpu()
+            keep = ~torch.isin(tokens, torch.tensor(sorted(drop_ids), dtype=tokens.dtype))
+            return [row[mask] for row, mask in zip(tokens, keep)]
+        return [[i for i in row if i not in drop_ids] for row in tokens]
+
+    def _token_table(self):
+        """
+        id -> token with 'Ġ' replaced by a space and stripped, built once for the whole vocabulary.
+        """
+        if self._clean_tokens is None or len(self._clean_tokens) != len(self.tokenizer):
+            tokens = self.tokenizer.convert_ids_to_tokens(list(range(len(self.tokenizer))))
+            self._clean_tokens = [(tok or '').replace('Ġ', ' ').strip() for tok in tokens]
+            special = {self.tokenizer.bos_token, self.tokenizer.eos_token, self.tokenizer.pad_token}
+            self._detokenize_drop_ids = {i for i, tok in enumerate(self._clean_tokens) if tok in special}
+        return self._clean_tokens
+
+    def token_frequencies(self, texts):
+        """
+        Count how often every token id occurs in `texts` (special tokens included).
+        """
+        counts = collections.Counter()
+        for start in range(0, len(texts), 1024):
+            encoded = self.tokenizer(texts[start:start + 1024], return_token_type_ids=False)["input_ids"]
+            for ids in encoded:
+                counts.update(ids)
+        return counts
+
     def token2str(self, tokens) -> list:
+        # padding is most of a batch, drop special ids before decoding
+        tokens = self._strip_ids(tokens, set(self.tokenizer.all_special_ids))
         generated_text = self.tokenizer.batch_decode(tokens, skip_special_tokens=True)
         generated_text = [self.post_process(text) for text in generated_text]
         return generated_text
 
     def detokenize(self, tokens):
-        toks = [self.tokenizer.convert_ids_to_tokens(tok) for tok in tokens]
-        for b in range(len(toks)):
-            for i in reversed(range(len(toks[b]))):
-                if toks[b][i] is None:
-                    toks[b][i] = ''
-                toks[b][i] = toks[b][i].replace('Ġ', ' ').strip()
-                if toks[b][i] in ([self.tokenizer.bos_token, self.tokenizer.eos_token, self.tokenizer.pad_token]):
-                    del toks[b][i]
-        return toks
+        table = self._token_table()
+        size = len(table)
+        ids = self._strip_ids(tokens, self._detokenize_drop_ids)
+        ids = [row.tolist() if torch.is_tensor(row) else row for row in ids]
+        return [[table[i] if 0 <= i < size else '' for i in row] for row in ids]
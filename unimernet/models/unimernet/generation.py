@@ -0,0 +1,311 @@
+"""
+Greedy decoding loops for CustomVisionEncoderDecoderModel that HF generate()
+does not provide for this model.
+
+All of them reproduce HF greedy search (including `forced_eos_token_id` at
+max length and pad after eos) and return the same [batch, 1 + new_tokens]
+ids, starting with the decoder start token.
+"""
+
+import torch
+
+# generation_config fields whose logits processors are not reproduced here
+_UNSUPPORTED_PROCESSORS = {
+    "repetition_penalty": 1.0,
+    "encoder_repetition_penalty": 1.0,
+    "no_repeat_ngram_size": 0,
+    "encoder_no_repeat_ngram_size": 0,
+    "bad_words_ids": None,
+    "min_length": 0,
+    "min_new_tokens": None,
+    "forced_bos_token_id": None,
+    "suppress_tokens": None,
+    "begin_suppress_tokens": None,
+    "sequence_bias": None,
+    "num_beams": 1,
+    "exponential_decay_length_penalty": None,
+}
+
+
+def supports_greedy_loop(generation_config):
+    """
+    True if plain greedy search under `generation_config` only involves
+    `forced_eos_token_id`, i.e. the loops in this module give the same result.
+    """
+    for name, default in _UNSUPPORTED_PROCESSORS.items():
+        value = getattr(generation_config, name, default)
+        if value is not None and value != default:
+            return False
+    return True
+
+
+def encoder_memory(model, encoder_hidden_states):
+    """
+    Encoder hidden states as the decoder's cross-attention sees them in HF generate.
+    """
+    if (
+        model.encoder.config.hidden_size != model.decoder.config.hidden_size
+        and model.decoder.config.cross_attention_hidden_size is None
+    ):
+        encoder_hidden_states = model.enc_to_dec_proj(encoder_hidden_states)
+    return encoder_hidden_states
+
+
+def decoder_step(model, input_ids, encoder_hidden_states, past_key_values=None, exit_layer=None,
+                 attention_mask=None, position_ids=None):
+    """
+    One decoder forward over `input_ids` ([b, t]) on top of `past_key_values`.
+    `attention_mask` ([b, past + t]) and `position_ids` ([b, t]) are only needed when
+    the rows of the batch are at different steps.
+
+    Returns:
+        logits [b, t, vocab] and the new legacy tuple cache.
+    """
+    outputs = model.decoder(
+        input_ids=input_ids,
+        encoder_hidden_states=encoder_hidden_states,
+        past_key_values=past_key_values,
+        attention_mask=attention_mask,
+        position_ids=position_ids,
+        use_cache=True,
+        return_dict=True,
+        exit_layer=exit_layer,
+    )
+    return outputs.logits, outputs.past_key_values
+
+
+def crop_cache(past_key_values, length):
+    """
+    Keep the first `length` self-attention positions; cross-attention entries are untouched.
+    """
+    return tuple(
+        (layer[0][:, :, :length], layer[1][:, :, :length]) + tuple(layer[2:])
+        for layer in past_key_values
+    )
+
+
+def select_cache(past_key_values, index):
+    """
+    Keep the batch rows in `index` of every cached tensor (self- and cross-attention).
+    """
+    return tuple(tuple(t.index_select(0, index) for t in layer) for layer in past_key_values)
+
+
+class SpeculativeStats:
+    """
+    Acceptance telemetry of speculative / prompt-lookup decoding.
+    """
+
+    def __init__(self):
+        self.rounds = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    @property
+    def acceptance_rate(self):
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+    def update(self, drafted, accepted):
+        self.rounds += 1
+        self.drafted += drafted
+        self.accepted += accepted
+
+    def to_dict(self):
+        return {
+            "rounds": self.rounds,
+            "drafted": self.drafted,
+            "accepted": self.accepted,
+            "acceptance_rate": self.acceptance_rate,
+        }
+
+
+def _finish(tokens, max_new_tokens, eos_token_id, forced_eos_token_id):
+    """
+    Cut after eos / at max_new_tokens and apply forced eos like HF.
+    """
+    if eos_token_id in tokens:
+        return tokens[: tokens.index(eos_token_id) + 1]
+    tokens = tokens[:max_new_tokens]
+    if len(tokens) == max_new_tokens and forced_eos_token_id is not None:
+        tokens[-1] = forced_eos_token_id
+    return tokens
+
+
+def prompt_lookup(tokens, num_tokens, max_ngram=3, min_ngram=1):
+    """
+    Model-free draft: find the latest earlier occurrence of the last n tokens
+    (longest n first) and propose the `num_tokens` tokens that followed it.
+    Matrices and aligned environments repeat patterns like `& 0 & 0 \\\\`.
+    """
+    for n in range(min(max_ngram, len(tokens) - 1), min_ngram - 1, -1):
+        suffix = tokens[-n:]
+        for start in range(len(tokens) - n - 1, -1, -1):
+            if tokens[start:start + n] == suffix:
+                return tokens[start + n:start + n + num_tokens]
+    return []
+
+
+class _LayerDraft:
+    """
+    Early-exit draft: the first `draft_layers` decoder layers on top of the verified cache.
+    """
+
+    def __init__(self, model, encoder_hidden_states, eos_token_id, draft_layers):
+        self.model = model
+        self.encoder_hidden_states = encoder_hidden_states
+        self.eos_token_id = eos_token_id
+        self.draft_layers = draft_layers
+
+    def __call__(self, tokens, past, num_tokens):
+        device = self.encoder_hidden_states.device
+        draft = []
+        draft_past = past[:self.draft_layers]
+        next_input = tokens[-1]
+        for _ in range(num_tokens):
+            logits, draft_past = decoder_step(
+                self.model, torch.tensor([[next_input]], device=device), self.encoder_hidden_states,
+                draft_past, exit_layer=self.draft_layers,
+            )
+            next_input = int(logits[0, -1].argmax())
+            draft.append(next_input)
+            if next_input == self.eos_token_id:
+                break
+        return draft
+
+
+@torch.no_grad()
+def draft_verify_greedy(
+    model,
+    encoder_hidden_states,
+    max_new_tokens,
+    decoder_start_token_id,
+    eos_token_id,
+    forced_eos_token_id=None,
+    draft_layers=None,
+    prompt_lookup_ngram=None,
+    num_draft_tokens=4,
+    max_draft_tokens=16,
+    stats=None,
+):
+    """
+    Greedy decoding of a single sequence where every full decoder forward
+    verifies several drafted tokens at once.
+
+    Drafts come from prompt lookup over the tokens generated so far (when
+    `prompt_lookup_ngram` is set, see prompt_lookup) and otherwise from the
+    first `draft_layers` decoder layers followed by the final layer norm and the
+    LM head (self-speculative early exit). Because layer i only depends on
+    layers < i, the layer draft reuses the verified cache of those layers, so it
+    costs draft_layers / num_layers of a full step per proposed token.
+
+    The full decoder then runs [last token] + draft in one forward on top of the
+    KV cache and keeps the longest prefix of the draft that matches its own
+    greedy choice plus one token of its own, so the result is exactly plain
+    greedy search. The draft length grows while everything is accepted and
+    shrinks otherwise.
+
+    Returns:
+        LongTensor [1, 1 + n] of ids, like HF generate().
+    """
+    if encoder_hidden_states.shape[0] != 1:
+        raise ValueError("draft_verify_greedy decodes one sequence at a time")
+    stats = stats if stats is not None else SpeculativeStats()
+    device = encoder_hidden_states.device
+    layer_draft = None
+    if draft_layers:
+        layer_draft = _LayerDraft(model, encoder_hidden_states, eos_token_id, draft_layers)
+
+    start = torch.tensor([[decoder_start_token_id]], device=device)
+    logits, past = decoder_step(model, start, encoder_hidden_states)
+    tokens = [int(logits[0, -1].argmax())]
+
+    while tokens[-1] != eos_token_id and len(tokens) < max_new_tokens:
+        # the verify pass feeds tokens[-1] + draft at positions len(tokens)..len(tokens) + k, plain
+        # greedy search never feeds past position max_new_tokens - 1
+        k = min(num_draft_tokens, max_new_tokens - len(tokens) - 1)
+        cache_len = past[0][0].shape[2]
+
+        draft = []
+        if prompt_lookup_ngram:
+            draft = prompt_lookup(tokens, k, max_ngram=prompt_lookup_ngram)
+        if not draft and layer_draft is not None:
+            draft = layer_draft(tokens, past, k)
+
+        # position i of the verify pass predicts the token after draft[:i]
+        verify_input = torch.tensor([[tokens[-1]] + draft], device=device)
+        logits, past = decoder_step(model, verify_input, encoder_hidden_states, past)
+        predicted = logits[0].argmax(dim=-1).tolist()
+
+        accepted = 0
+        while accepted < len(draft) and draft[accepted] == predicted[accepted]:
+            accepted += 1
+        tokens += draft[:accepted] + [predicted[accepted]]
+        if accepted < len(draft):
+            past = crop_cache(past, cache_len + 1 + accepted)
+
+        if draft:
+            stats.update(len(draft), accepted)
+            if accepted == len(draft):
+                num_draft_tokens = min(num_draft_tokens + 2, max_draft_tokens)
+            else:
+                num_draft_tokens = max(1, num_draft_tokens - 1)
+
+        if eos_token_id in tokens:
+            break
+
+    tokens = _finish(tokens, max_new_tokens, eos_token_id, forced_eos_token_id)
+    return torch.tensor([[decoder_start_token_id] + tokens], device=device)
+
+
+@torch.no_grad()
+def compact_greedy(
+    model,
+    encoder_hidden_states,
+    max_new_tokens,
+    decoder_start_token_id,
+    eos_token_id,
+    pad_token_id,
+    forced_eos_token_id=None,
+):
+    """
+    Batched greedy decoding that drops sequences from the batch as soon as they
+    emit eos: the KV cache and the encoder memory are gathered down to the rows
+    still running, so short formulas stop costing decoder compute.
+
+    Returns:
+        LongTensor [batch, 1 + n] padded with `pad_token_id`, like HF generate().
+    """
+    batch_size = encoder_hidden_states.shape[0]
+    device = encoder_hidden_states.device
+    active = list(range(batch_size))
+    tokens = [[] for _ in range(batch_size)]
+
+    input_ids = torch.full((batch_size, 1), decoder_start_token_id, dtype=torch.long, device=device)
+    past = None
+    for step in range(max_new_tokens):
+        logits, past = decoder_step(model, input_ids, encoder_hidden_states, past)
+        next_tokens = logits[:, -1].argmax(dim=-1)
+        if step == max_new_tokens - 1 and forced_eos_token_id is not None:
+            next_tokens.fill_(forced_eos_token_id)
+
+        keep = []
+        for row, token in enumerate(next_tokens.tolist()):
+            tokens[active[row]].append(token)
+            if token != eos_token_id:
+                keep.append(row)
+        if not keep:
+            break
+        if len(keep) < len(active):
+            index = torch.tensor(keep, device=device)
+            past = select_cache(past, index)
+            encoder_hidden_states = encoder_hidden_states.index_select(0, index)
+            next_tokens = next_tokens.index_select(0, index)
+            active = [active[row] for row in keep]
+        input_ids = next_tokens[:, None]
+
+    length = max(len(t) for t in tokens)
+    outputs = torch.full((batch_size, 1 + length), pad_token_id, dtype=torch.long, device=device)
+    outputs[:, 0] = decoder_start_token_id
+    for row, row_tokens in enumerate(tokens):
+        outputs[row, 1:1 + len(row_tokens)] = torch.tensor(row_tokens, device=device)
+    return outputs
@@ -1,8 +1,14 @@
+import contextlib
+import json
+import logging
+import time
+
 import torch
 import torch.nn.functional as F
 from unimernet.common.registry import registry
 from unimernet.models.blip2_models.blip2 import Blip2Base
 from unimernet.models.unimernet.encoder_decoder import DonutEncoderDecoder, DonutTokenizer
+from unimernet.models.unimernet.generation import SpeculativeStats
 
 
 @registry.register_model("unimernet")
@@ -41,6 +47,8 @@ class UniMERModel(Blip2Base):
         )
         self.max_seq_len = model_config.max_seq_len
         self.tokenizer.max_seq_len = self.max_seq_len
+        self.speculative = None
+        self.decode_stats = SpeculativeStats()
 
     def forward(self, samples):
         image, text = samples["image"], samples["text_input"]
@@ -71,13 +79,54 @@ class UniMERModel(Blip2Base):
             temperature: float = 0.2,
             do_sample: bool = False,
             top_p: float = 0.95,
+            trace=None,
             **kwargs
     ):
+        """
+        Args:
+            trace: optional latency trace (see tools/latency_trace.py). When given, the
+                encoder forward, the decode loop and detokenisation are timed into it
+                and the number of generated tokens / tokens per second are recorded.
+        """
+        encoder_outputs = self.encode(samples["image"], trace=trace)
+        return self.generate_from_encoder_outputs(
+            encoder_outputs, temperature=temperature, do_sample=do_sample, top_p=top_p, trace=trace, **kwargs
+        )
 
-        image = samples["image"]
+    @torch.no_grad()
+    def encode(self, image, trace=None):
+        """
+        Run only the vision encoder. The result can be decoded any number of times
+        (other settings, retries) with generate_from_encoder_outputs.
+        """
+        with trace.stage("encoder") if trace is not None else contextlib.nullcontext():
+            with self.maybe_autocast():
+                return self.model.encode(image)
+
+    @torch.no_grad()
+    def generate_from_encoder_outputs(
+            self,
+            encoder_outputs,
+            temperature: float = 0.2,
+            do_sample: bool = False,
+            top_p: float = 0.95,
+            trace=None,
+            **kwargs
+    ):
+        """
+        Same as generate() but starts from the output of encode(), skipping the encoder.
+        """
+        stats = None
+        if self.speculative is not None and not do_sample:
+            stats = SpeculativeStats()
+            for key, value in self.speculative.items():
+                kwargs.setdefault(key, value)
+            kwargs.setdefault("decode_stats", stats)
+        start = time.perf_counter()
         with self.maybe_autocast():
             outputs = self.model.generate(
-                pixel_values=image,
+                pixel_values=None,
+                encoder_outputs=encoder_outputs,
                 temperature=temperature,
                 max_new_tokens=self.max_seq_len,
                 decoder_start_token_id=self.tokenizer.tokenizer.bos_token_id,
@@ -86,10 +135,66 @@ class UniMERModel(Blip2Base):
                 top_p=top_p,
                 **kwargs
             )
-        pred_tokens = self.tokenizer.detokenize(outputs)
-        pred_str = self.tokenizer.token2str(outputs)
+        if trace is not None:
+            decode_time = time.perf_counter() - start
+            num_tokens = int((outputs != self.tokenizer.pad_token_id).sum())
+            trace.add("decode", decode_time)
+            trace.set("decode_tokens", num_tokens)
+            trace.set("tokens_per_sec", num_tokens / decode_time if decode_time > 0 else 0.0)
+            if stats is not None and stats.rounds:
+                trace.set("draft_acceptance", stats.acceptance_rate)
+        if stats is not None:
+            self.decode_stats.update(stats.drafted, stats.accepted)
+
+        with trace.stage("detokenize") if trace is not None else contextlib.nullcontext():
+            pred_tokens = self.tokenizer.detokenize(outputs)
+            pred_str = self.tokenizer.token2str(outputs)
         return {"pred_tokens": pred_tokens, "pred_str": pred_str, "pred_ids": outputs}
 
+    def set_speculative(self, draft_layers=None, num_draft_tokens=4, prompt_lookup_ngram=None):
+        """
+        Greedy decoding of single images where tokens are drafted by prompt lookup over
+        the output so far (`prompt_lookup_ngram`) and/or the first `draft_layers` decoder
+        layers, `num_draft_tokens` per round, and verified by the full decoder (same
+        output as plain greedy). Both None disables it. Acceptance is accumulated in
+        self.decode_stats.
+        """
+        if draft_layers is None and prompt_lookup_ngram is None:
+            self.speculative = None
+            return
+        num_layers = len(self.model.model.decoder.model.decoder.layers)
+        if draft_layers is not None and not 0 < draft_layers < num_layers:
+            raise ValueError("draft_layers must be in [1, {}), got {}".format(num_layers, draft_layers))
+        self.speculative = {
+            "draft_layers": draft_layers,
+            "prompt_lookup_ngram": prompt_lookup_ngram,
+            "num_draft_tokens": num_draft_tokens,
+        }
+
+    def set_vocab_subset(self, token_ids):
+        """
+        Restrict the inference LM head to `token_ids` (special tokens are always kept),
+        see CustomMBartForCausalLM.set_vocab_subset. None restores the full head.
+        """
+        if token_ids is not None:
+            special = [self.tokenizer.bos_token_id, self.tokenizer.eos_token_id, self.tokenizer.pad_token_id,
+                       self.tokenizer.tokenizer.unk_token_id]
+            token_ids = set(token_ids) | {i for i in special if i is not None}
+        self.model.model.decoder.set_vocab_subset(token_ids)
+
+    def load_vocab_subset(self, path, min_count=1):
+        """
+        Token ids for set_vocab_subset from either a json list of ids or a text
+        corpus with one formula per line (tokens seen at least `min_count` times).
+        """
+        if path.endswith(".json"):
+            with open(path, "r") as f:
+                return json.load(f)
+        with open(path, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        counts = self.tokenizer.token_frequencies(texts)
+        return [token_id for token_id, count in counts.items() if count >= min_count]
+
     @classmethod
     def from_config(cls, cfg):
 
@@ -107,4 +212,29 @@ class UniMERModel(Blip2Base):
 
         model.load_checkpoint_from_config(cfg)
 
+        vocab_subset = model_config.get("vocab_subset", None)
+        if vocab_subset:
+            token_ids = model.load_vocab_subset(vocab_subset, model_config.get("vocab_subset_min_count", 1))
+            model.set_vocab_subset(token_ids)
+            logging.info("LM head restricted to {} of {} tokens.".format(
+                len(model.model.model.decoder.vocab_subset), len(model.tokenizer)))
+
+        precision = model_config.get("precision", "fp32")
+        if precision == "bf16":
+            model.set_cpu_autocast(torch.bfloat16)
+            if not torch.backends.mkldnn.is_available() or not torch.ops.mkldnn._is_mkldnn_bf16_supported():
+                logging.warning("bf16 requested but this cpu has no native bf16 support, expect it to be slower than fp32.")
+            logging.info("cpu inference and training run under bfloat16 autocast.")
+        elif precision != "fp32":
+            raise ValueError("precision must be fp32 or bf16, got {}".format(precision))
+
+        speculative = model_config.get("speculative", None)
+        if speculative:
+            model.set_speculative(
+                draft_layers=speculative.get("draft_layers", None),
+                num_draft_tokens=speculative.get("num_draft_tokens", 4),
+                prompt_lookup_ngram=speculative.get("prompt_lookup_ngram", None),
+            )
+            logging.info("Draft-and-verify decoding: {}.".format(model.speculative))
+
         return model
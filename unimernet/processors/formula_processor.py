@@ -18,20 +18,100 @@ class FormulaImageBaseProcessor(BaseProcessor):
         assert len(self.input_size) == 2
 
     @staticmethod
-    def crop_margin(img: Image.Image) -> Image.Image:
+    def ink_mask(img: Image.Image):
+        """
+        Boolean mask of the dark (text) pixels after contrast stretching, None for a blank image.
+        """
         data = np.array(img.convert("L"))
         data = data.astype(np.uint8)
         max_val = data.max()
         min_val = data.min()
         if max_val == min_val:
-            return img
+            return None
         data = (data - min_val) / (max_val - min_val) * 255
-        gray = 255 * (data < 200).astype(np.uint8)
+        return data < 200
+
+    @classmethod
+    def crop_margin(cls, img: Image.Image) -> Image.Image:
+        mask = cls.ink_mask(img)
+        if mask is None:
+            return img
+        gray = 255 * mask.astype(np.uint8)
 
         coords = cv2.findNonZero(gray)  # Find all non-zero points (text)
         a, b, w, h = cv2.boundingRect(coords)  # Find minimum spanning bounding box
         return img.crop((a, b, w + a, h + b))
 
+    @classmethod
+    def split_lines(cls, img: Image.Image, min_gap: int = 4, min_gap_ratio: float = 0.15,
+                    gap_ratio: float = 0.5, min_height: int = 4):
+        """
+        Split a capture holding several formula lines (e.g. a whole derivation) into one
+        image per line, using the horizontal projection profile of the crop_margin threshold.
+
+        Ink bands lower than `min_height` are first merged into both neighbours when both gaps
+        are below the median band height (a fraction bar between numerator and denominator),
+        otherwise into the nearest band. The split points are then taken from the distribution
+        of the blank row runs between bands: the widest gap must be at least
+        max(min_gap, min_gap_ratio * median band height), and every gap of at least
+        gap_ratio times the widest one separates lines, so lines are only cut where the gaps
+        are clearly wider than the spacing inside a formula.
+        Returns [img] when only one line is found.
+        """
+        mask = cls.ink_mask(img)
+        if mask is None:
+            return [img]
+        rows = np.flatnonzero(mask.any(axis=1))
+        if len(rows) == 0:
+            return [img]
+
+        # ink bands [top, bottom)
+        breaks = np.flatnonzero(np.diff(rows) > 1)
+        tops = np.concatenate([[rows[0]], rows[breaks + 1]])
+        bottoms = np.concatenate([rows[breaks] + 1, [rows[-1] + 1]])
+        if len(tops) == 1:
+            return [img]
+
+        heights = bottoms - tops
+        line_height = float(np.median(heights[heights >= min_height] if (heights >= min_height).any() else heights))
+
+        # thin bands first, so a fraction bar joins numerator and denominator before the gap test
+        bands = [[top, bottom] for top, bottom in zip(tops, bottoms)]
+        i = 0
+        while len(bands) > 1 and i < len(bands):
+            top, bottom = bands[i]
+            if bottom - top >= min_height:
+                i += 1
+                continue
+            gap_above = top - bands[i - 1][1] if i > 0 else np.inf
+            gap_below = bands[i + 1][0] - bottom if i + 1 < len(bands) else np.inf
+            if max(gap_above, gap_below) < line_height:
+                bands[i - 1][1] = bands[i + 1][1]
+                del bands[i + 1]
+            elif gap_above <= gap_below:
+                bands[i - 1][1] = bottom
+            else:
+                bands[i + 1][0] = top
+            del bands[i]
+        if len(bands) == 1:
+            return [img]
+
+        gaps = np.array([top - bands[k][1] for k, (top, _) in enumerate(bands[1:])])
+        widest = gaps.max()
+        if widest < max(min_gap, min_gap_ratio * line_height):
+            return [img]
+        threshold = gap_ratio * widest
+        lines = [bands[0]]
+        for (top, bottom), gap in zip(bands[1:], gaps):
+            if gap < threshold:
+                lines[-1][1] = bottom
+            else:
+                lines.append([top, bottom])
+
+        if len(lines) == 1:
+            return [img]
+        return [img.crop((0, int(top), img.width, int(bottom))) for top, bottom in lines]
+
     def prepare_input(self, img: Image.Image, random_padding: bool = False):
         """
         Convert PIL Image to tensor according to specified input_size after following steps below:
@@ -48,6 +128,12 @@ class FormulaImageBaseProcessor(BaseProcessor):
             # might throw an error for broken files
             return
 
+        return self.resize_and_pad(img, random_padding)
+
+    def resize_and_pad(self, img: Image.Image, random_padding: bool = False):
+        """
+        Resize an already cropped image to fit input_size and pad it onto the canvas.
+        """
         if img.height == 0 or img.width == 0:
             return
 
@@ -72,19 +158,28 @@ class FormulaImageBaseProcessor(BaseProcessor):
 
 @registry.register_processor("formula_image_train")
 class FormulaImageTrainProcessor(FormulaImageBaseProcessor):
-    def __init__(self, image_size=384):
+    def __init__(self, image_size=384, fog_pool_size=None, fog_refresh_every=None, fog_pool_budget_mb=None):
         super().__init__(image_size)
 
         # Import weather-related augmentations only when initializing this class
         from unimernet.processors.formula_processor_helper.nougat import Bitmap, Dilation, Erosion
         from unimernet.processors.formula_processor_helper.weather import Fog, Frost, Snow, Rain, Shadow
+        from unimernet.processors.formula_processor_helper.weather import (
+            FOG_POOL_BUDGET_MB, FOG_POOL_SIZE, FOG_REFRESH_EVERY,
+        )
+
+        fog = Fog(
+            pool_size=FOG_POOL_SIZE if fog_pool_size is None else fog_pool_size,
+            refresh_every=FOG_REFRESH_EVERY if fog_refresh_every is None else fog_refresh_every,
+            budget_mb=FOG_POOL_BUDGET_MB if fog_pool_budget_mb is None else fog_pool_budget_mb,
+        )
 
         self.transform = alb.Compose(
             [
                 alb.Compose(
                     [
                         Bitmap(p=0.05),
-                        alb.OneOf([Fog(), Frost(), Snow(), Rain(), Shadow()], p=0.2),
+                        alb.OneOf([fog, Frost(), Snow(), Rain(), Shadow()], p=0.2),
                         alb.OneOf([Erosion((2, 3)), Dilation((2, 3))], p=0.2),
                         alb.ShiftScaleRotate(shift_limit=0, scale_limit=(-.15, 0), rotate_limit=1, border_mode=0,
                                              interpolation=3,
@@ -120,15 +215,19 @@ class FormulaImageTrainProcessor(FormulaImageBaseProcessor):
 
         return cls(
             image_size=image_size,
+            fog_pool_size=cfg.get("fog_pool_size", None),
+            fog_refresh_every=cfg.get("fog_refresh_every", None),
+            fog_pool_budget_mb=cfg.get("fog_pool_budget_mb", None),
         )
 
 
 @registry.register_processor("formula_image_multi_scale_train")
 class FormulaImageMultiScaleTrainProcessor(FormulaImageTrainProcessor):
-    def __init__(self, all_scales):
+    def __init__(self, all_scales, fog_pool_size=None, fog_refresh_every=None, fog_pool_budget_mb=None):
         for i, scales in enumerate(all_scales):
             all_scales[i] = [int(_) for _ in scales]
-        super(FormulaImageMultiScaleTrainProcessor, self).__init__(all_scales[0])
+        super(FormulaImageMultiScaleTrainProcessor, self).__init__(all_scales[0], fog_pool_size, fog_refresh_every,
+                                                                  fog_pool_budget_mb)
         self.all_scales = all_scales
 
     @classmethod
@@ -138,7 +237,10 @@ class FormulaImageMultiScaleTrainProcessor(FormulaImageTrainProcessor):
 
         all_scales = cfg.get("all_scales", [[384, 384]])
         return cls(
-            all_scales=all_scales
+            all_scales=all_scales,
+            fog_pool_size=cfg.get("fog_pool_size", None),
+            fog_refresh_every=cfg.get("fog_refresh_every", None),
+            fog_pool_budget_mb=cfg.get("fog_pool_budget_mb", None),
         )
 
     def reset_scale(self):
@@ -5,6 +5,9 @@ Reference: https://github.com/hendrycks/robustness
 Hacked together for STR by: Rowel Atienza
 """
 
+import math
+from functools import lru_cache
+
 import cv2
 import numpy as np
 from scipy.ndimage import zoom as scizoom
@@ -38,6 +41,38 @@ def disk(radius, alias_blur=0.1, dtype=np.float32):
     return cv2.GaussianBlur(aliased_disk, ksize=ksize, sigmaX=alias_blur)
 
 
+@lru_cache(maxsize=512)
+def motion_blur_kernel(radius, sigma, angle):
+    """
+    Build the 2d kernel equivalent to ImageMagick's one-sided motion blur:
+    2 * radius + 1 gaussian taps (std 'sigma') laid along direction 'angle' (degrees).
+    The returned array is shared between calls and must not be modified.
+    """
+    width = 2 * int(math.ceil(radius)) + 1
+    weights = np.exp(-np.arange(width) ** 2 / (2.0 * sigma ** 2))
+    weights /= weights.sum()
+    theta = math.radians(angle)
+    dx, dy = math.cos(theta), math.sin(theta)
+
+    kernel = np.zeros((2 * width - 1, 2 * width - 1), dtype=np.float32)
+    center = width - 1
+    for i, weight in enumerate(weights):
+        x = int(math.ceil(i * dx - 0.5))
+        y = int(math.ceil(i * dy - 0.5))
+        kernel[center + y, center + x] += weight
+    kernel.setflags(write=False)
+    return kernel
+
+
+def motion_blur(img, radius, sigma, angle):
+    """
+    Pure OpenCV replacement for wand's Image.motion_blur on a float/uint8 array.
+    'angle' is rounded to whole degrees so kernels can be reused.
+    """
+    kernel = motion_blur_kernel(radius, sigma, int(round(angle)))
+    return cv2.filter2D(img, -1, kernel, borderType=cv2.BORDER_REPLICATE)
+
+
 # modification of https://github.com/FLHerne/mapgen/blob/master/diamondsquare.py
 def plasma_fractal(mapsize=256, wibbledecay=3, rng=None):
     """
@@ -1,21 +1,76 @@
 import math
-from io import BytesIO
+from functools import lru_cache
 
 import cv2
 import numpy as np
 from PIL import Image, ImageOps, ImageDraw
 from pkg_resources import resource_filename
-from wand.image import Image as WandImage
 import albumentations as alb
 
-from .ops import plasma_fractal
+from .ops import plasma_fractal, motion_blur
+
+FROST_FILES = ['frost/frost1.png', 'frost/frost2.png', 'frost/frost3.png',
+               'frost/frost4.jpg', 'frost/frost5.jpg', 'frost/frost6.jpg']
+
+# Default number of plasma fractals kept per (size, decay). Each fog sample is a
+# random crop of one of them and a field is regenerated on average every
+# FOG_REFRESH_EVERY calls. Fields are stored as float16 (a 2048x2048 one, for inputs
+# up to 1024 px, takes 8 MB) and a pool never holds more than FOG_POOL_BUDGET_MB,
+# so large sizes keep fewer fields: 4096x4096 (1344 px inputs) keeps one.
+FOG_POOL_SIZE = 4
+FOG_REFRESH_EVERY = 64
+FOG_POOL_BUDGET_MB = 32
+
+# Module level caches live once per process, i.e. once per dataloader worker.
+_fog_fields = {}
+
+
+@lru_cache(maxsize=None)
+def load_frost(index):
+    # Some images have transparency. Remove alpha channel.
+    frost = Image.open(resource_filename(__name__, FROST_FILES[index])).convert('RGB')
+    frost.load()
+    return frost
+
+
+@lru_cache(maxsize=64)
+def resized_frost(index, f_w, f_h):
+    frost = np.asarray(load_frost(index).resize((f_w, f_h)))
+    frost.setflags(write=False)
+    return frost
+
+
+def fog_field(max_size, wibbledecay, rng, pool_size=FOG_POOL_SIZE, refresh_every=FOG_REFRESH_EVERY,
+              budget_mb=FOG_POOL_BUDGET_MB):
+    """
+    A plasma fractal of side `max_size` from a pool of at most `pool_size` fields and
+    `budget_mb` megabytes (at least one field). A field is replaced with probability
+    1 / `refresh_every`. `pool_size` 0 generates a new field on every call,
+    `refresh_every` 0 never replaces one.
+    """
+    if pool_size <= 0:
+        return plasma_fractal(mapsize=max_size, wibbledecay=wibbledecay, rng=rng)
+    field_mb = max_size * max_size * np.dtype(np.float16).itemsize / 2 ** 20
+    pool_size = max(1, min(pool_size, int(budget_mb // field_mb)))
+    pool = _fog_fields.setdefault((max_size, wibbledecay), [])
+    if len(pool) < pool_size:
+        pool.append(plasma_fractal(mapsize=max_size, wibbledecay=wibbledecay, rng=rng).astype(np.float16))
+        return pool[-1]
+    index = rng.integers(0, pool_size)
+    if refresh_every > 0 and rng.random() * refresh_every < 1:
+        pool[index] = plasma_fractal(mapsize=max_size, wibbledecay=wibbledecay, rng=rng).astype(np.float16)
+    return pool[index]
 
 
 class Fog(alb.ImageOnlyTransform):
-    def __init__(self, mag=-1, always_apply=False, p=1.):
+    def __init__(self, mag=-1, pool_size=FOG_POOL_SIZE, refresh_every=FOG_REFRESH_EVERY, budget_mb=FOG_POOL_BUDGET_MB,
+                 always_apply=False, p=1.):
         super().__init__(always_apply=always_apply, p=p)
         self.rng = np.random.default_rng()
         self.mag = mag
+        self.pool_size = pool_size
+        self.refresh_every = refresh_every
+        self.budget_mb = budget_mb
 
     def apply(self, img, **params):
         img = Image.fromarray(img.astype(np.uint8))
@@ -34,7 +89,10 @@ class Fog(alb.ImageOnlyTransform):
         max_val = img.max()
         # Make sure fog image is at least twice the size of the input image
         max_size = 2 ** math.ceil(math.log2(max(w, h)) + 1)
-        fog = c[0] * plasma_fractal(mapsize=max_size, wibbledecay=c[1], rng=self.rng)[:h, :w][..., np.newaxis]
+        # fields are cached, so take a random window instead of always the top-left corner
+        y_start, x_start = self.rng.integers(0, max_size - h + 1), self.rng.integers(0, max_size - w + 1)
+        field = fog_field(max_size, c[1], self.rng, self.pool_size, self.refresh_every, self.budget_mb)
+        fog = c[0] * field[y_start:y_start + h, x_start:x_start + w][..., np.newaxis]
         # x += c[0] * plasma_fractal(wibbledecay=c[1])[:224, :224][..., np.newaxis]
         # return np.clip(x * max_val / (max_val + c[0]), 0, 1) * 255
         if isgray:
@@ -63,16 +121,8 @@ class Frost(alb.ImageOnlyTransform):
             index = self.mag
         c = c[index]
 
-        filename = [resource_filename(__name__, 'frost/frost1.png'),
-                    resource_filename(__name__, 'frost/frost2.png'),
-                    resource_filename(__name__, 'frost/frost3.png'),
-                    resource_filename(__name__, 'frost/frost4.jpg'),
-                    resource_filename(__name__, 'frost/frost5.jpg'),
-                    resource_filename(__name__, 'frost/frost6.jpg')]
-        index = self.rng.integers(0, len(filename))
-        filename = filename[index]
-        # Some images have transparency. Remove alpha channel.
-        frost = Image.open(filename).convert('RGB')
+        index = int(self.rng.integers(0, len(FROST_FILES)))
+        frost = load_frost(index)
 
         # Resize the frost image to match the input image's dimensions
         f_w, f_h = frost.size
@@ -82,7 +132,7 @@ class Frost(alb.ImageOnlyTransform):
         else:
             f_w = round(f_w * h / f_h)
             f_h = h
-        frost = np.asarray(frost.resize((f_w, f_h)))
+        frost = resized_frost(index, f_w, f_h)
 
         # randomly crop
         y_start, x_start = self.rng.integers(0, f_h - h + 1), self.rng.integers(0, f_w - w + 1)
@@ -135,15 +185,8 @@ class Snow(alb.ImageOnlyTransform):
         # snow_layer = clipped_zoom(snow_layer[..., np.newaxis], c[2])
         snow_layer[snow_layer < c[3]] = 0
 
-        snow_layer = Image.fromarray((np.clip(snow_layer.squeeze(), 0, 1) * 255).astype(np.uint8), mode='L')
-        output = BytesIO()
-        snow_layer.save(output, format='PNG')
-        snow_layer = WandImage(blob=output.getvalue())
-
-        snow_layer.motion_blur(radius=c[4], sigma=c[5], angle=self.rng.uniform(-135, -45))
-
-        snow_layer = cv2.imdecode(np.frombuffer(snow_layer.make_blob(), np.uint8),
-                                  cv2.IMREAD_UNCHANGED) / 255.
+        snow_layer = np.clip(snow_layer, 0, 1).astype(np.float32)
+        snow_layer = motion_blur(snow_layer, radius=c[4], sigma=c[5], angle=self.rng.uniform(-135, -45))
 
         # snow_layer = cv2.cvtColor(snow_layer, cv2.COLOR_BGR2RGB)
 
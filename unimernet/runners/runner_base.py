@@ -30,6 +30,7 @@ from unimernet.datasets.datasets.dataloader_utils import (
     MultiIterLoader,
     ConcatLoader,
     PrefetchLoader,
+    ThreadedPrefetchLoader,
 )
 from torch.nn.parallel import DistributedDataParallel as DDP
 from torch.utils.data import DataLoader, DistributedSampler
@@ -137,7 +138,8 @@ class RunnerBase:
     def scaler(self):
         amp = self.config.run_cfg.get("amp", False)
 
-        if amp:
+        # GradScaler is for cuda fp16; bf16 on cpu (model precision: bf16) needs no loss scaling
+        if amp and self.cuda_enabled:
             if self._scaler is None:
                 self._scaler = torch.cuda.amp.GradScaler()
 
@@ -275,6 +277,10 @@ class RunnerBase:
     def cuda_enabled(self):
         return self.device.type == "cuda"
 
+    @property
+    def prefetch_queue_size(self):
+        return int(self.config.run_cfg.get("prefetch_queue_size", 2))
+
     @property
     def max_epoch(self):
         return int(self.config.run_cfg.max_epoch)
@@ -534,7 +540,12 @@ class RunnerBase:
                     collate_fn=collate_fn,
                     drop_last=True if is_train else False,
                 )
-                loader = PrefetchLoader(loader)
+                if self.cuda_enabled:
+                    loader = PrefetchLoader(loader)
+                else:
+                    loader = ThreadedPrefetchLoader(
+                        loader, queue_size=self.prefetch_queue_size
+                    )
 
                 if is_train:
                     loader = IterLoader(loader, use_distributed=self.use_distributed)
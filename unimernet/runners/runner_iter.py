@@ -13,6 +13,7 @@ import time
 import torch
 import torch.distributed as dist
 import webdataset as wds
+from unimernet.common.checkpoint import AsyncCheckpointSaver
 from unimernet.common.dist_utils import download_cached_file, is_main_process, main_process
 from unimernet.common.registry import registry
 from unimernet.common.utils import is_url
@@ -53,6 +54,16 @@ class RunnerIter(RunnerBase):
                 self.iters_per_inner_epoch > 0
         ), "iters_per_inner_epoch must be greater than 0."
 
+        max_checkpoints = self.config.run_cfg.get("max_checkpoints", None)
+        self._ckpt_saver = AsyncCheckpointSaver(
+            max_to_keep=int(max_checkpoints) if max_checkpoints is not None else None,
+            asynchronous=self.config.run_cfg.get("async_checkpoint", True),
+        )
+
+    @property
+    def save_trainable_only(self):
+        return self.config.run_cfg.get("save_trainable_only", True)
+
     @property
     def max_epoch(self):
         return int(self.max_iters / self.iters_per_inner_epoch)
@@ -128,6 +139,8 @@ class RunnerIter(RunnerBase):
             dist.barrier()
             cur_epoch += 1
 
+        self._ckpt_saver.wait()
+
         # testing phase
         self.evaluate(cur_epoch=self.cur_epoch)
 
@@ -155,17 +168,22 @@ class RunnerIter(RunnerBase):
 
     @main_process
     def _save_checkpoint(self, cur_iters, is_best=False, latest=False):
-        # only save the params requires gradient
+        """
+        Snapshot the training state to CPU and write it in the background.
+        Numbered checkpoints are rotated according to run_cfg.max_checkpoints.
+        """
         assert not (is_best and latest), "You can't set 'is_best' and 'latest' the same time."
         unwrapped_model = self.unwrap_dist_model(self.model)
-        param_grad_dic = {
-            k: v.requires_grad for (k, v) in unwrapped_model.named_parameters()
-        }
 
         state_dict = unwrapped_model.state_dict()
-        for k in list(state_dict.keys()):
-            if k in param_grad_dic.keys() and not param_grad_dic[k]:
-                del state_dict[k]
+        if self.save_trainable_only:
+            # only save the params requires gradient
+            param_grad_dic = {
+                k: v.requires_grad for (k, v) in unwrapped_model.named_parameters()
+            }
+            for k in list(state_dict.keys()):
+                if k in param_grad_dic.keys() and not param_grad_dic[k]:
+                    del state_dict[k]
 
         save_obj = {
             "model": state_dict,
@@ -190,7 +208,12 @@ class RunnerIter(RunnerBase):
                 "checkpoint_{}.pth".format(cur_iters),
             )
         logging.info("Saving checkpoint at iters {} to {}.".format(cur_iters, save_to))
-        torch.save(save_obj, save_to)
+        self._ckpt_saver.save(save_obj, save_to, rotate=not (is_best or latest))
+
+    def _reload_best_model(self, model):
+        # the best checkpoint may still be in flight
+        self._ckpt_saver.wait()
+        return super()._reload_best_model(model)
 
     def _load_checkpoint(self, url_or_filename):
         """
@@ -5,6 +5,7 @@
  For full license text, see the LICENSE file in the repo root or https://opensource.org/licenses/BSD-3-Clause
 """
 
+import json
 import logging
 import os
 
@@ -16,6 +17,43 @@ from unimernet.common.registry import registry
 from unimernet.datasets.data_utils import prepare_sample
 
 
+class ResultShard:
+    """
+    Append-only JSONL file holding the evaluation results of one rank.
+
+    Results are written as soon as each batch is evaluated, so a rank never
+    keeps the whole eval set in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "w")
+        self._count = 0
+
+    def extend(self, results):
+        for res in results:
+            self._file.write(json.dumps(res) + "\n")
+        self._count += len(results)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        self.close()
+        return iter_jsonl(self.path)
+
+
+def iter_jsonl(filename):
+    with open(filename, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
 class BaseTask:
     def __init__(self, **kwargs):
         super().__init__()
@@ -86,13 +124,22 @@ class BaseTask:
         # TODO make it configurable
         print_freq = 10
 
-        results = []
+        result_dir = registry.get_path("result_dir")
+        if result_dir is not None:
+            results = ResultShard(os.path.join(result_dir, "_streaming_rank%d.jsonl" % get_rank()))
+        else:
+            results = []
 
-        for samples in metric_logger.log_every(data_loader, print_freq, header):
-            samples = prepare_sample(samples, cuda_enabled=cuda_enabled)
+        try:
+            for samples in metric_logger.log_every(data_loader, print_freq, header):
+                samples = prepare_sample(samples, cuda_enabled=cuda_enabled)
 
-            eval_output = self.valid_step(model=model, samples=samples)
-            results.extend(eval_output)
+                eval_output = self.valid_step(model=model, samples=samples)
+                results.extend(eval_output)
+        finally:
+            # also on a failing batch, so the shard is flushed and its handle released
+            if isinstance(results, ResultShard):
+                results.close()
 
         if is_dist_avail_and_initialized():
             dist.barrier()
@@ -215,7 +262,8 @@ class BaseTask:
 
             lr_scheduler.step(cur_epoch=inner_epoch, cur_step=i)
 
-            with torch.cuda.amp.autocast(enabled=use_amp):
+            # fp16 autocast on gpu; on cpu the model applies bf16 itself via maybe_autocast
+            with torch.autocast("cuda", enabled=use_amp and cuda_enabled):
                 loss, loss_dict = self.train_step(model=model, samples=samples)
                 loss /= accum_grad_iters  # TODO: not affect loss_dict values for logging
 
@@ -249,14 +297,25 @@ class BaseTask:
 
     @staticmethod
     def save_result(result, result_dir, filename, remove_duplicate=""):
-        import json
+        """
+        Merge the per-rank results into one JSONL file and return its path.
 
+        `result` is either the ResultShard returned by `evaluation` or a plain
+        list of dicts. Duplicates (by the `remove_duplicate` key) are dropped
+        keeping the first occurrence.
+        """
         result_file = os.path.join(
-            result_dir, "%s_rank%d.json" % (filename, get_rank())
+            result_dir, "%s_rank%d.jsonl" % (filename, get_rank())
         )
-        final_result_file = os.path.join(result_dir, "%s.json" % filename)
+        final_result_file = os.path.join(result_dir, "%s.jsonl" % filename)
 
-        json.dump(result, open(result_file, "w"))
+        if isinstance(result, ResultShard):
+            result.close()
+            os.replace(result.path, result_file)
+        else:
+            with open(result_file, "w") as f:
+                for res in result:
+                    f.write(json.dumps(res) + "\n")
 
         if is_dist_avail_and_initialized():
             dist.barrier()
@@ -264,25 +323,19 @@ class BaseTask:
         if is_main_process():
             logging.warning("rank %d starts merging results." % get_rank())
             # combine results from all processes
-            result = []
-
-            for rank in range(get_world_size()):
-                result_file = os.path.join(
-                    result_dir, "%s_rank%d.json" % (filename, rank)
-                )
-                res = json.load(open(result_file, "r"))
-                result += res
-
-            if remove_duplicate:
-                result_new = []
-                id_list = []
-                for res in result:
-                    if res[remove_duplicate] not in id_list:
-                        id_list.append(res[remove_duplicate])
-                        result_new.append(res)
-                result = result_new
+            seen = set()
+            with open(final_result_file, "w") as f:
+                for rank in range(get_world_size()):
+                    result_file = os.path.join(
+                        result_dir, "%s_rank%d.jsonl" % (filename, rank)
+                    )
+                    for res in iter_jsonl(result_file):
+                        if remove_duplicate:
+                            if res[remove_duplicate] in seen:
+                                continue
+                            seen.add(res[remove_duplicate])
+                        f.write(json.dumps(res) + "\n")
 
-            json.dump(result, open(final_result_file, "w"))
             print("result file saved to %s" % final_result_file)
 
         return final_result_file
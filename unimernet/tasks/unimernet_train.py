@@ -1,14 +1,10 @@
-import torch
-import evaluate
-import random
-
 from unimernet.common.registry import registry
-from unimernet.tasks.base_task import BaseTask
+from unimernet.tasks.base_task import BaseTask, iter_jsonl
 from unimernet.common.dist_utils import main_process
+from unimernet.common.metrics import bleu_score, edit_distances, token_accuracy
 import os.path as osp
 import json
 import numpy as np
-from rapidfuzz.distance import Levenshtein
 
 
 @registry.register_task("unimernet_train")
@@ -65,21 +61,10 @@ class UniMERNet_Train(BaseTask):
         truth_strs = model.tokenizer.token2str(truth_inputs["input_ids"])
 
         ids = samples["id"]
+        tok_accs = token_accuracy(pred_ids, truth_ids, model.tokenizer.pad_token_id).tolist()
 
-        for pred_token, pred_str, pred_id, truth_token, truth_str, truth_id, id_ in zip(pred_tokens, pred_strs,
-                                                                                        pred_ids, truth_tokens,
-                                                                                        truth_strs, truth_ids, ids):
-            pred_id = pred_id.tolist()
-            truth_id = truth_id.tolist()
-            shape_diff = len(pred_id) - len(truth_id)
-            if shape_diff < 0:
-                pred_id = pred_id + [model.tokenizer.pad_token_id] * (-shape_diff)
-            else:
-                truth_id = truth_id + [model.tokenizer.pad_token_id] * shape_diff
-            pred_id, truth_id = torch.LongTensor(pred_id), torch.LongTensor(truth_id)
-            mask = torch.logical_or(pred_id != model.tokenizer.pad_token_id, truth_id != model.tokenizer.pad_token_id)
-            tok_acc = (pred_id == truth_id)[mask].float().mean().item()
-
+        for pred_token, pred_str, tok_acc, truth_token, truth_str, id_ in zip(pred_tokens, pred_strs, tok_accs,
+                                                                             truth_tokens, truth_strs, ids):
             this_item = {
                 "pred_token": pred_token,
                 "pred_str": pred_str,
@@ -110,38 +95,22 @@ class UniMERNet_Train(BaseTask):
 
     @main_process
     def _report_metrics(self, eval_result_file, split_name):
-
-        with open(eval_result_file) as f:
-            results = json.load(f)
-
-        edit_dists = []
-        all_pred_tokens = []
-        all_truth_tokens = []
         all_pred_strs = []
         all_truth_strs = []
         token_accs = []
-        for result in results:
-            pred_token, pred_str, truth_token, truth_str, tok_acc = result["pred_token"], result["pred_str"], result[
-                "truth_token"], result["truth_str"], result["token_acc"]
-
-            if len(truth_str) > 0:
-                norm_edit_dist = Levenshtein.normalized_distance(pred_str, truth_str)
-                edit_dists.append(norm_edit_dist)
-
-            all_pred_tokens.append(pred_token)
-            all_truth_tokens.append([truth_token])
-            all_pred_strs.append(pred_str)
-            all_truth_strs.append(truth_str)
-            token_accs.append(tok_acc)
-
-        # bleu_score = metrics.bleu_score(all_pred_tokens, all_truth_tokens)
-        bleu = evaluate.load("bleu", keep_in_memory=True, experiment_id=random.randint(1, 1e8))
-        bleu_results = bleu.compute(predictions=all_pred_strs, references=all_truth_strs)
-        bleu_score = bleu_results['bleu']
-        
+        for result in iter_jsonl(eval_result_file):
+            all_pred_strs.append(result["pred_str"])
+            all_truth_strs.append(result["truth_str"])
+            token_accs.append(result["token_acc"])
+
+        # empty references are skipped for the edit distance
+        non_empty = [(pred, truth) for pred, truth in zip(all_pred_strs, all_truth_strs) if len(truth) > 0]
+        edit_dists = edit_distances([p for p, _ in non_empty], [t for _, t in non_empty])
+
+        bleu = bleu_score(all_pred_strs, all_truth_strs)
         edit_distance = np.mean(edit_dists)
-        token_accuracy = np.mean(token_accs)
-        eval_ret = {"bleu": bleu_score, "edit_distance": edit_distance, "token_accuracy": token_accuracy}
+        tok_accuracy = np.mean(token_accs)
+        eval_ret = {"bleu": bleu, "edit_distance": edit_distance, "token_accuracy": tok_accuracy}
 
         log_stats = {split_name: {k: v for k, v in eval_ret.items()}}
 
@@ -155,9 +124,9 @@ class UniMERNet_Train(BaseTask):
         if "edit" in self.agg_metric.lower():  # edit_distance
             agg_metrics = (1 - edit_distance) * 100
         elif "bleu" in self.agg_metric.lower():  # bleu_score
-            agg_metrics = bleu_score * 100
+            agg_metrics = bleu * 100
         elif "token" in self.agg_metric.lower():  # token_accuracy
-            agg_metrics = token_accuracy * 100
+            agg_metrics = tok_accuracy * 100
         else:
             raise ValueError(f"Invalid metrics: '{self.agg_metric}'")
 